@@ -4,18 +4,29 @@ Sistema de reconhecimento facial para registro de entrada de alunos
 """
 
 import os
+import threading
 import cv2
 import numpy as np
 from flask import Flask, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import insightface
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import base64
-import json
+import uuid
+from embeddings_cache import EmbeddingsCache
+from db_loader import load_embeddings_from_db, parse_descriptor
+from inference_queue import InferenceScheduler, QueueFull
+from tracking import EntryDeduplicator
+from side_effects import SideEffectQueue, PermanentError
+from camera_ingest import CameraManager
 
 load_dotenv()
 
@@ -25,10 +36,36 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Configurações
 EDUFOCUS_API = os.getenv('EDUFOCUS_API_URL', 'http://localhost:5000')
+EDUFOCUS_SERVICE_TOKEN = os.getenv('EDUFOCUS_SERVICE_TOKEN', '')
 WHAPI_TOKEN = os.getenv('WHAPI_TOKEN', '')
 WHAPI_URL = os.getenv('WHAPI_URL', 'https://gate.whapi.cloud')
 EMBEDDINGS_DIR = 'embeddings_cache'
-SIMILARITY_THRESHOLD = 0.4  # Quanto menor, mais rigoroso
+SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.4'))  # Similaridade cosseno mínima (quanto maior, mais rigoroso)
+MATCH_TOP_K = int(os.getenv('MATCH_TOP_K', '3'))  # Candidatos devolvidos por rosto
+EMBEDDINGS_CACHE_MB = int(os.getenv('EMBEDDINGS_CACHE_MB', '512'))  # Memória máxima das galerias em cache
+MAX_FRAME_BYTES = int(os.getenv('MAX_FRAME_BYTES', str(5 * 1024 * 1024)))  # Tamanho máximo de um frame
+EMBEDDINGS_SOURCE = os.getenv('EMBEDDINGS_SOURCE', 'api')  # 'api' (HTTP) ou 'db' (lê os school_*.db direto)
+EDUFOCUS_DB_DIR = os.getenv('EDUFOCUS_DB_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database'))
+EMBEDDINGS_REFRESH_SECONDS = float(os.getenv('EMBEDDINGS_REFRESH_SECONDS', '30'))  # Intervalo da busca incremental
+EMBEDDINGS_REFRESH_TIMEOUT = float(os.getenv('EMBEDDINGS_REFRESH_TIMEOUT', '5'))  # Timeout da busca incremental (a carga completa usa 30s)
+INFERENCE_MAX_QUEUE = int(os.getenv('INFERENCE_MAX_QUEUE', '32'))  # Frames aguardando inferência (acima disso: 429)
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', '8'))  # Frames por lote
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv('INFERENCE_BATCH_WINDOW_MS', '10'))  # Espera para completar o lote
+FRAME_MAX_AGE_MS = float(os.getenv('FRAME_MAX_AGE_MS', '500'))  # Frame mais velho que isso na fila é descartado
+REGISTER_TIMEOUT_SECONDS = float(os.getenv('REGISTER_TIMEOUT_SECONDS', '30'))  # Espera do cadastro de rosto na fila
+ENTRY_COOLDOWN_SECONDS = float(os.getenv('ENTRY_COOLDOWN_SECONDS', '600'))  # Intervalo mínimo entre entradas do mesmo aluno
+TRACK_IOU_THRESHOLD = float(os.getenv('TRACK_IOU_THRESHOLD', '0.3'))  # Sobreposição mínima para ser o mesmo rosto
+TRACK_MAX_IDLE_SECONDS = float(os.getenv('TRACK_MAX_IDLE_SECONDS', '2'))  # Trilha sem rosto por mais tempo é encerrada
+SIDE_EFFECTS_DB = os.getenv('SIDE_EFFECTS_DB', 'side_effects_queue.db')  # Fila em disco de entradas/WhatsApp pendentes
+SIDE_EFFECT_WORKERS = int(os.getenv('SIDE_EFFECT_WORKERS', '4'))  # Envios simultâneos
+SIDE_EFFECT_MAX_ATTEMPTS = int(os.getenv('SIDE_EFFECT_MAX_ATTEMPTS', '8'))  # Tentativas antes de desistir
+CAMERA_INGEST = os.getenv('CAMERA_INGEST', 'false').lower() in ('1', 'true', 'yes')  # Ler as câmeras cadastradas direto
+CAMERA_PURPOSES = [p.strip() for p in os.getenv('CAMERA_PURPOSES', 'entrance').split(',') if p.strip()]  # Finalidades lidas
+CAMERA_MAX_FPS = float(os.getenv('CAMERA_MAX_FPS', '5'))  # Frames por segundo enviados ao reconhecimento por câmera
+DEBUG = os.getenv('FLASK_DEBUG', 'true').lower() in ('1', 'true', 'yes')  # Reloader/debugger do `python app.py`
+
+# Teto de qualquer corpo (com ou sem Content-Length): folga para o base64 do JSON e o envelope do multipart
+app.config['MAX_CONTENT_LENGTH'] = MAX_FRAME_BYTES * 2
 
 # Criar diretórios
 os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
@@ -39,71 +76,126 @@ face_app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
 face_app.prepare(ctx_id=0, det_size=(640, 640))
 print("✅ Modelo carregado com sucesso!")
 
-# Cache de embeddings
-embeddings_cache = {}
 
+def pooled_session():
+    """Sessão HTTP com conexões reaproveitadas (keep-alive) entre as chamadas"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=SIDE_EFFECT_WORKERS + 2)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-def load_embeddings_from_api(school_id):
-    """Carrega embeddings de alunos da API do EduFocus"""
-    try:
-        response = requests.get(f'{EDUFOCUS_API}/api/school/{school_id}/students/embeddings')
-        if response.status_code == 200:
-            students = response.json()
-            cache = {}
-            for student in students:
-                if student.get('face_descriptor'):
-                    # Converter string JSON para numpy array
-                    embedding = np.array(json.loads(student['face_descriptor']))
-                    cache[student['id']] = {
-                        'name': student['name'],
-                        'embedding': embedding,
-                        'guardian_phone': student.get('guardian_phone', ''),
-                        'class_name': student.get('class_name', '')
-                    }
-            return cache
-        return {}
-    except Exception as e:
-        print(f"❌ Erro ao carregar embeddings: {e}")
-        return {}
 
+api_session = pooled_session()
+whapi_session = pooled_session()
 
-def find_matching_student(face_embedding, school_embeddings):
-    """Encontra aluno correspondente comparando embeddings"""
-    best_match = None
-    best_similarity = -1
-    
-    for student_id, data in school_embeddings.items():
-        # Calcular similaridade cosseno
-        similarity = np.dot(face_embedding, data['embedding']) / (
-            np.linalg.norm(face_embedding) * np.linalg.norm(data['embedding'])
-        )
-        
-        if similarity > best_similarity and similarity > SIMILARITY_THRESHOLD:
-            best_similarity = similarity
-            best_match = {
-                'id': student_id,
-                'name': data['name'],
-                'similarity': float(similarity),
-                'guardian_phone': data['guardian_phone'],
-                'class_name': data['class_name']
-            }
-    
-    return best_match
+
+def check_response(response):
+    """Levanta exceção se a chamada falhou; 4xx (exceto 408/429) não adianta repetir"""
+    if response.ok:
+        return
+    message = f"HTTP {response.status_code}: {response.text[:200]}"
+    if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+        raise PermanentError(message)
+    raise Exception(message)
+
+
+def load_embeddings_from_api(school_id, since=0):
+    """Rostos da escola alterados desde a versão `since` (0 = todos)"""
+    response = api_session.get(
+        f'{EDUFOCUS_API}/api/school/{school_id}/students/embeddings',
+        params={'since': since, 'format': 'binary'},
+        headers={'X-Service-Token': EDUFOCUS_SERVICE_TOKEN},
+        timeout=EMBEDDINGS_REFRESH_TIMEOUT if since else 30
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def parse_embedding(face_descriptor):
+    """Descritor (BLOB em base64 ou JSON de backends antigos) para numpy array"""
+    embedding = parse_descriptor(face_descriptor)
+    if embedding is None:
+        raise ValueError('descritor facial inválido')
+    return embedding
+
+
+def load_embeddings(school_id, since=0):
+    """Carregador configurado em EMBEDDINGS_SOURCE (db quando o serviço roda junto do backend)"""
+    if EMBEDDINGS_SOURCE == 'db':
+        return load_embeddings_from_db(EDUFOCUS_DB_DIR, school_id, since)
+    return load_embeddings_from_api(school_id, since)
+
+
+# Cache de galerias (FaceGallery) por escola, versionado e com limite de memória
+embeddings_cache = EmbeddingsCache(
+    load_embeddings,
+    parse_embedding,
+    max_bytes=EMBEDDINGS_CACHE_MB * 1024 * 1024,
+    refresh_seconds=EMBEDDINGS_REFRESH_SECONDS
+)
+
+
+def detect_faces_batch(frames):
+    """Detecção frame a frame + um único forward do modelo de reconhecimento para todos os rostos do lote"""
+    rec_model = face_app.models['recognition']
+    per_frame = []
+    crops = []
+    for frame in frames:
+        bboxes, kpss = face_app.det_model.detect(frame, max_num=0, metric='default')
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+            crops.append(face_align.norm_crop(frame, landmark=face.kps, image_size=rec_model.input_size[0]))
+            faces.append(face)
+        per_frame.append(faces)
+
+    if crops:
+        try:
+            embeddings = rec_model.get_feat(crops)
+        except Exception:
+            # Modelo exportado com batch fixo em 1
+            embeddings = np.concatenate([rec_model.get_feat([crop]) for crop in crops])
+        for face, embedding in zip([f for faces in per_frame for f in faces], embeddings):
+            face.embedding = embedding.flatten()
+    return per_frame
+
+
+# Uma única thread usa o modelo; frames de várias câmeras são agrupados em lotes
+inference = InferenceScheduler(
+    detect_faces_batch,
+    max_queue=INFERENCE_MAX_QUEUE,
+    max_batch=INFERENCE_MAX_BATCH,
+    batch_window=INFERENCE_BATCH_WINDOW_MS / 1000,
+    max_age=FRAME_MAX_AGE_MS / 1000
+)
+
+
+# Uma entrada por chegada: trilhas por câmera + cooldown por aluno
+entry_dedup = EntryDeduplicator(
+    cooldown_seconds=ENTRY_COOLDOWN_SECONDS,
+    iou_threshold=TRACK_IOU_THRESHOLD,
+    max_idle=TRACK_MAX_IDLE_SECONDS
+)
+
+
+def find_matching_students(face_embeddings, gallery, k=MATCH_TOP_K):
+    """Top-k candidatos de cada rosto do frame (uma multiplicação de matrizes para todos)"""
+    return gallery.match(face_embeddings, k=k, threshold=SIMILARITY_THRESHOLD)
 
 
 def send_whatsapp_notification(phone, student_name, school_name, timestamp):
-    """Envia notificação via WhatsApp usando whapi.cloud"""
+    """Envia notificação via WhatsApp usando whapi.cloud (levanta exceção se falhar)"""
     if not WHAPI_TOKEN or not phone:
         print("⚠️ WhatsApp não configurado ou telefone ausente")
         return False
     
-    try:
-        # Formatar telefone (remover caracteres especiais)
-        phone_clean = ''.join(filter(str.isdigit, phone))
-        if not phone_clean.startswith('55'):
-            phone_clean = '55' + phone_clean
-        
-        message = f"""
+    # Formatar telefone (remover caracteres especiais)
+    phone_clean = ''.join(filter(str.isdigit, phone))
+    if not phone_clean.startswith('55'):
+        phone_clean = '55' + phone_clean
+    
+    message = f"""
 🎓 *EduFocus - Notificação de Entrada*
 
 ✅ O aluno *{student_name}* chegou à escola!
@@ -112,53 +204,87 @@ def send_whatsapp_notification(phone, student_name, school_name, timestamp):
 🕐 Horário: {timestamp}
 
 _Mensagem automática do sistema EduFocus_
-        """.strip()
-        
-        headers = {
-            'Authorization': f'Bearer {WHAPI_TOKEN}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'to': phone_clean,
-            'body': message
-        }
-        
-        response = requests.post(
-            f'{WHAPI_URL}/messages/text',
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            print(f"✅ WhatsApp enviado para {phone_clean}")
-            return True
-        else:
-            print(f"❌ Erro WhatsApp: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Erro ao enviar WhatsApp: {e}")
-        return False
+    """.strip()
+    
+    headers = {
+        'Authorization': f'Bearer {WHAPI_TOKEN}',
+        'Content-Type': 'application/json'
+    }
+    
+    payload = {
+        'to': phone_clean,
+        'body': message
+    }
+    
+    response = whapi_session.post(
+        f'{WHAPI_URL}/messages/text',
+        headers=headers,
+        json=payload,
+        timeout=10
+    )
+    check_response(response)
+    print(f"✅ WhatsApp enviado para {phone_clean}")
+    return True
 
 
-def register_entry(school_id, student_id, student_name):
-    """Registra entrada do aluno na API"""
-    try:
-        response = requests.post(
-            f'{EDUFOCUS_API}/api/school/{school_id}/attendance',
-            json={
-                'student_id': student_id,
-                'type': 'entry',
-                'timestamp': datetime.now().isoformat()
-            },
-            timeout=5
-        )
-        return response.status_code == 200
-    except Exception as e:
-        print(f"❌ Erro ao registrar entrada: {e}")
-        return False
+def register_entry(school_id, student_id, student_name, timestamp, event_id):
+    """Registra entrada do aluno na API (levanta exceção se falhar)"""
+    response = api_session.post(
+        f'{EDUFOCUS_API}/api/school/{school_id}/attendance',
+        json={
+            'student_id': student_id,
+            'type': 'entry',
+            'timestamp': timestamp
+        },
+        headers={'X-Service-Token': EDUFOCUS_SERVICE_TOKEN, 'Idempotency-Key': event_id},
+        timeout=5
+    )
+    check_response(response)
+    return True
+
+
+# Entrada e WhatsApp saem da requisição do frame: fila em disco + pool de envio com retentativas
+side_effects = SideEffectQueue(
+    SIDE_EFFECTS_DB,
+    {
+        'entry': lambda payload: register_entry(**payload),
+        'whatsapp': lambda payload: send_whatsapp_notification(**payload),
+    },
+    workers=SIDE_EFFECT_WORKERS,
+    max_attempts=SIDE_EFFECT_MAX_ATTEMPTS
+)
+
+
+def enqueue_arrival(school_id, match):
+    """Agenda registro da entrada + WhatsApp do aluno reconhecido; retorna o horário exibido"""
+    now = datetime.now(timezone.utc)
+    timestamp = now.astimezone().strftime('%d/%m/%Y %H:%M:%S')
+    side_effects.enqueue('entry', {
+        'school_id': school_id,
+        'student_id': match['id'],
+        'student_name': match['name'],
+        'timestamp': now.isoformat(),  # horário da detecção (UTC com fuso), não do envio
+        'event_id': str(uuid.uuid4())
+    })
+    if match['guardian_phone']:
+        side_effects.enqueue('whatsapp', {
+            'phone': match['guardian_phone'],
+            'student_name': match['name'],
+            'school_name': f"Escola ID {school_id}",  # Pode buscar nome da escola da API
+            'timestamp': timestamp
+        })
+    return timestamp
+
+
+def load_cameras_from_api():
+    """Câmeras ativas cadastradas (tabela cameras do system.db)"""
+    response = api_session.get(
+        f'{EDUFOCUS_API}/api/recognition/cameras',
+        headers={'X-Service-Token': EDUFOCUS_SERVICE_TOKEN},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()
 
 
 @app.route('/health', methods=['GET'])
@@ -167,9 +293,87 @@ def health():
     return jsonify({'status': 'ok', 'service': 'facial-recognition'})
 
 
+def decode_frame(buffer):
+    """Decodifica JPEG/PNG direto do buffer (np.frombuffer não copia os bytes)"""
+    return cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+
+
+def recognize_frame(school_id, frame, camera_id=None):
+    """Detecta os rostos do frame e registra a entrada dos alunos reconhecidos (QueueFull se saturado)"""
+    # Detectar rostos (fila de inferência em lotes)
+    job = inference.submit(frame, camera_id)
+    faces = job.wait(timeout=FRAME_MAX_AGE_MS / 1000 + 5)
+    
+    if job.status != 'done':
+        # Descartado: fila atrasada ou chegou frame mais novo da mesma câmera
+        return {'detected': False, 'faces': [], 'status': 'skipped',
+                'reason': 'timeout' if job.status == 'queued' else job.status}
+    
+    if not faces:
+        return {'detected': False, 'faces': []}
+    
+    # Carregar embeddings da escola (com cache)
+    gallery = embeddings_cache.get(str(school_id))
+    
+    # Buscar correspondência de todos os rostos de uma vez
+    candidates_per_face = find_matching_students(np.stack([face.embedding for face in faces]), gallery)
+    
+    # Mesmo rosto em frames seguidos (ou aluno em cooldown) não gera nova entrada
+    decisions = entry_dedup.observe(
+        school_id,
+        camera_id,
+        [face.bbox for face in faces],
+        [candidates[0]['id'] if candidates else None for candidates in candidates_per_face]
+    )
+    
+    results = []
+    for face, candidates, (track_id, new_entry) in zip(faces, candidates_per_face, decisions):
+        match = candidates[0] if candidates else None
+        
+        if match:
+            if new_entry and match['person_type'] == 'student':
+                # Registrar entrada + enviar WhatsApp (em segundo plano)
+                timestamp = enqueue_arrival(school_id, match)
+            else:
+                timestamp = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            
+            results.append({
+                'detected': True,
+                'student_id': match['id'],
+                'student_name': match['name'],
+                'similarity': match['similarity'],
+                'class': match['class_name'],
+                'person_type': match['person_type'],
+                'bbox': face.bbox.tolist(),
+                'timestamp': timestamp,
+                'track_id': track_id,
+                'new_entry': new_entry,
+                'candidates': [{'student_id': c['id'], 'similarity': c['similarity']} for c in candidates]
+            })
+    
+    response = {
+        'detected': len(results) > 0,
+        'faces': results
+    }
+    if camera_id:
+        response['camera_id'] = camera_id
+    return response
+
+
+def queue_full_response(error):
+    """429 quando a fila de inferência está cheia: a câmera deve pular este frame"""
+    response = jsonify({'error': str(error), 'status': 'rejected'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+
+def frame_too_large_response():
+    return jsonify({'error': 'Frame too large', 'max_bytes': MAX_FRAME_BYTES}), 413
+
+
 @app.route('/process-frame', methods=['POST'])
 def process_frame():
-    """Processa frame de vídeo e detecta rostos"""
+    """Processa frame de vídeo (JSON com a imagem em base64)"""
     try:
         data = request.json
         school_id = data.get('school_id')
@@ -180,57 +384,56 @@ def process_frame():
         
         # Decodificar imagem
         img_data = base64.b64decode(frame_base64.split(',')[1] if ',' in frame_base64 else frame_base64)
-        nparr = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        frame = decode_frame(img_data)
+        if frame is None:
+            return jsonify({'error': 'Invalid image'}), 400
         
-        # Detectar rostos
-        faces = face_app.get(frame)
+        return jsonify(recognize_frame(school_id, frame, data.get('camera_id')))
         
-        if not faces:
-            return jsonify({'detected': False, 'faces': []})
+    except QueueFull as e:
+        return queue_full_response(e)
+    except RequestEntityTooLarge:
+        return frame_too_large_response()
+    except Exception as e:
+        print(f"❌ Erro ao processar frame: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/process-frame/raw', methods=['POST'])
+def process_frame_raw():
+    """Processa frame binário: corpo image/jpeg (ou multipart, campo 'frame'), escola/câmera nos headers"""
+    try:
+        school_id = request.headers.get('X-School-Id') or request.args.get('school_id')
+        camera_id = request.headers.get('X-Camera-Id') or request.args.get('camera_id')
         
-        # Carregar embeddings da escola (com cache)
-        cache_key = f'school_{school_id}'
-        if cache_key not in embeddings_cache:
-            embeddings_cache[cache_key] = load_embeddings_from_api(school_id)
+        if not school_id:
+            return jsonify({'error': 'Missing X-School-Id'}), 400
+        if request.content_length and request.content_length > MAX_FRAME_BYTES:
+            return frame_too_large_response()
         
-        school_embeddings = embeddings_cache[cache_key]
+        # Leitura limitada: corpo chunked (sem Content-Length) também para em MAX_FRAME_BYTES + 1
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('frame')
+            buffer = upload.stream.read(MAX_FRAME_BYTES + 1) if upload else b''
+        else:
+            # Bytes do corpo sem passar por JSON/base64 (e sem guardar cópia no request)
+            buffer = request.stream.read(MAX_FRAME_BYTES + 1)
+        if len(buffer) > MAX_FRAME_BYTES:
+            return frame_too_large_response()
         
-        results = []
-        for face in faces:
-            embedding = face.embedding
-            
-            # Buscar correspondência
-            match = find_matching_student(embedding, school_embeddings)
-            
-            if match:
-                # Registrar entrada
-                register_entry(school_id, match['id'], match['name'])
-                
-                # Enviar WhatsApp
-                timestamp = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-                send_whatsapp_notification(
-                    match['guardian_phone'],
-                    match['name'],
-                    f"Escola ID {school_id}",  # Pode buscar nome da escola da API
-                    timestamp
-                )
-                
-                results.append({
-                    'detected': True,
-                    'student_id': match['id'],
-                    'student_name': match['name'],
-                    'similarity': match['similarity'],
-                    'class': match['class_name'],
-                    'bbox': face.bbox.tolist(),
-                    'timestamp': timestamp
-                })
+        if not buffer:
+            return jsonify({'error': 'Missing frame'}), 400
         
-        return jsonify({
-            'detected': len(results) > 0,
-            'faces': results
-        })
+        frame = decode_frame(buffer)
+        if frame is None:
+            return jsonify({'error': 'Invalid image'}), 400
+        
+        return jsonify(recognize_frame(school_id, frame, camera_id))
         
+    except QueueFull as e:
+        return queue_full_response(e)
+    except RequestEntityTooLarge:
+        return frame_too_large_response()
     except Exception as e:
         print(f"❌ Erro ao processar frame: {e}")
         return jsonify({'error': str(e)}), 500
@@ -249,11 +452,15 @@ def register_face():
         
         # Decodificar imagem
         img_data = base64.b64decode(image_base64.split(',')[1] if ',' in image_base64 else image_base64)
-        nparr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = decode_frame(img_data)
+        if img is None:
+            return jsonify({'error': 'Invalid image'}), 400
         
-        # Detectar rosto
-        faces = face_app.get(img)
+        # Detectar rosto na mesma fila das câmeras (sem câmera: não é substituído; nem descartado por atraso)
+        job = inference.submit(img, max_age=float('inf'))
+        faces = job.wait(timeout=REGISTER_TIMEOUT_SECONDS)
+        if job.status != 'done':
+            return jsonify({'error': 'Face detection timed out, try again'}), 503
         
         if not faces:
             return jsonify({'error': 'No face detected'}), 400
@@ -273,6 +480,10 @@ def register_face():
             'message': 'Face registered successfully'
         })
         
+    except QueueFull as e:
+        return queue_full_response(e)
+    except RequestEntityTooLarge:
+        return frame_too_large_response()
     except Exception as e:
         print(f"❌ Erro ao registrar rosto: {e}")
         return jsonify({'error': str(e)}), 500
@@ -282,18 +493,77 @@ def register_face():
 def reload_embeddings(school_id):
     """Recarrega embeddings de uma escola"""
     try:
-        cache_key = f'school_{school_id}'
-        embeddings_cache[cache_key] = load_embeddings_from_api(school_id)
+        gallery = embeddings_cache.reload(str(school_id))
         return jsonify({
             'success': True,
-            'count': len(embeddings_cache[cache_key])
+            'count': len(gallery),
+            'index': gallery.index.kind
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/inference-stats', methods=['GET'])
+def inference_stats():
+    """Profundidade da fila, tamanho dos lotes, frames descartados/rejeitados e entradas deduplicadas"""
+    return jsonify({**inference.metrics(), 'entries': entry_dedup.stats()})
+
+
+@app.route('/side-effects-stats', methods=['GET'])
+def side_effects_stats():
+    """Entradas/WhatsApp pendentes, em envio, entregues e desistidos"""
+    return jsonify(side_effects.stats())
+
+
+@app.route('/camera-stats', methods=['GET'])
+def camera_stats():
+    """Status, FPS de captura/envio, descartes e reconexões de cada câmera lida pelo serviço"""
+    return jsonify(cameras.stats() if cameras else {})
+
+
+@app.route('/gallery-stats', methods=['GET'])
+def gallery_stats():
+    """Tipo de índice, latência e recall estimado da galeria de cada escola carregada"""
+    return jsonify({
+        'cache': embeddings_cache.stats(),
+        'schools': {school_id: gallery.index.describe() for school_id, gallery in embeddings_cache.items()}
+    })
+
+
+# Leitores das câmeras cadastradas (CAMERA_INGEST=true); sem isso, só frames enviados pelas rotas
+cameras = CameraManager(
+    load_cameras_from_api,
+    recognize_frame,
+    purposes=CAMERA_PURPOSES,
+    max_fps=CAMERA_MAX_FPS
+) if CAMERA_INGEST else None
+_cameras_started = False
+_cameras_lock = threading.Lock()
+
+
+def start_cameras():
+    """Sobe os leitores uma única vez por processo (python app.py ou servidor WSGI)"""
+    global _cameras_started
+    if not cameras:
+        return
+    with _cameras_lock:
+        if _cameras_started:
+            return
+        _cameras_started = True
+    cameras.start()
+
+
+# Importado por um servidor (gunicorn/uwsgi: `app:app`) o bloco abaixo não roda; sobe os leitores aqui
+if __name__ != '__main__':
+    start_cameras()
+
+
 if __name__ == '__main__':
     print("🚀 Iniciando serviço de reconhecimento facial...")
     print(f"📡 EduFocus API: {EDUFOCUS_API}")
     print(f"📱 WhatsApp: {'Configurado' if WHAPI_TOKEN else 'Não configurado'}")
-    socketio.run(app, host='0.0.0.0', port=5001, debug=True)
+    print(f"🎥 Câmeras: {'Leitura direta (' + ', '.join(CAMERA_PURPOSES) + ')' if cameras else 'Somente frames enviados'}")
+    # Com o reloader (debug) este arquivo roda duas vezes; o processo pai só vigia os arquivos
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_cameras()
+    socketio.run(app, host='0.0.0.0', port=5001, debug=DEBUG)
@@ -0,0 +1,83 @@
+"""
+Benchmark offline dos índices de galeria (só CPU, sem câmera nem API).
+
+Gera galerias sintéticas de embeddings 512-d (identidades agrupadas, como
+turmas/irmãos parecidos) e consultas com ruído a partir de alunos da galeria.
+Para cada tamanho compara a busca exata com o IVF: tempo de construção,
+recall@1 (em relação à busca exata) e latência por rosto.
+
+Uso (a partir de facial-recognition/):
+    python benchmark_index.py
+    python benchmark_index.py --sizes 1000 10000 100000 --queries 500 --probe 4 8 16
+"""
+import argparse
+import time
+
+import numpy as np
+
+from face_index import BruteForceIndex, IVFIndex
+from gallery import normalize_rows
+
+DIM = 512
+
+
+def synthetic_gallery(size, rng, groups=None, spread=0.6):
+    """Embeddings normalizados em torno de `groups` centros aleatórios."""
+    groups = groups or max(1, size // 50)
+    centers = rng.standard_normal((groups, DIM), dtype=np.float32)
+    rows = centers[rng.integers(0, groups, size)] + spread * rng.standard_normal((size, DIM), dtype=np.float32)
+    return normalize_rows(rows)
+
+
+def synthetic_queries(matrix, n, rng, noise=0.5):
+    """Rostos "vistos pela câmera": alunos da galeria com ruído."""
+    picks = rng.integers(0, matrix.shape[0], n)
+    faces = matrix[picks] + noise * rng.standard_normal((n, DIM), dtype=np.float32) / np.sqrt(DIM)
+    return normalize_rows(faces)
+
+
+def latency_ms(index, queries):
+    """Latências por rosto (uma busca por frame de um rosto), em ms."""
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[np.newaxis, :], 1)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def run(sizes, n_queries, probes, seed):
+    rng = np.random.default_rng(seed)
+    print(f"{'alunos':>8} {'índice':<14} {'build s':>8} {'recall@1':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for size in sizes:
+        matrix = synthetic_gallery(size, rng)
+        queries = synthetic_queries(matrix, n_queries, rng)
+
+        brute = BruteForceIndex(matrix)
+        exact, _ = brute.exact(queries, 1)
+        times = latency_ms(brute, queries)
+        print(f"{size:>8} {'brute':<14} {0:>8.2f} {1:>9.4f} {np.percentile(times, 50):>8.3f} {np.percentile(times, 95):>8.3f}")
+
+        for probe in probes:
+            start = time.perf_counter()
+            ivf = IVFIndex(matrix, n_probe=probe, recall_sample=0.0, seed=seed)
+            build = time.perf_counter() - start
+            found, _ = ivf.search(queries, 1)
+            recall = float(np.mean(found[:, 0] == exact[:, 0]))
+            times = latency_ms(ivf, queries)
+            label = f"ivf {ivf.n_lists}/{ivf.n_probe}"
+            print(f"{size:>8} {label:<14} {build:>8.2f} {recall:>9.4f} {np.percentile(times, 50):>8.3f} {np.percentile(times, 95):>8.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recall@1 e latência dos índices de galeria facial')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--probe', type=int, nargs='+', default=[4, 8, 16], help='listas visitadas por busca no IVF')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    run(args.sizes, args.queries, args.probe, args.seed)
+
+
+if __name__ == '__main__':
+    main()
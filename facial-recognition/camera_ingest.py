@@ -0,0 +1,285 @@
+"""
+Leitura direta das câmeras cadastradas (tabela cameras do system.db).
+
+CameraManager busca as câmeras ativas na API (/api/recognition/cameras) e
+mantém um CameraReader por câmera. Cada leitor tem duas threads:
+
+- captura: lê frames o mais rápido que a câmera entrega e guarda só o último
+  em um LatestFrameBuffer (o anterior, se não foi consumido, é descartado);
+- envio: pega o frame mais recente (no máximo max_fps por segundo) e chama
+  process(school_id, frame, camera_id), ou seja, o mesmo recognize_frame das
+  rotas HTTP.
+
+Se a câmera cair, a captura reconecta com backoff exponencial. Métricas por
+câmera (FPS de captura e de envio, descartes, reconexões) em stats().
+
+Para testar sem câmera, use um arquivo de vídeo (tocado em loop, no FPS do
+arquivo) ou um RTSP local:
+    python camera_ingest.py --url video.mp4 --seconds 10
+"""
+import argparse
+import os
+import threading
+import time
+from urllib.parse import quote, urlsplit, urlunsplit
+
+import cv2
+
+
+def stream_url(camera):
+    """URL para o OpenCV a partir do cadastro (camera_url ou camera_ip/porta + credenciais)."""
+    url = (camera.get('camera_url') or '').strip()
+    if not url and camera.get('camera_ip'):
+        port = camera.get('camera_port') or '554'
+        url = f"rtsp://{camera['camera_ip']}:{port}/"
+    if not url or os.path.exists(url):
+        return url
+
+    parts = urlsplit(url)
+    username = camera.get('camera_username')
+    if username and parts.scheme.startswith('rtsp') and '@' not in parts.netloc:
+        credentials = quote(username, safe='')
+        if camera.get('camera_password'):
+            credentials += ':' + quote(camera['camera_password'], safe='')
+        parts = parts._replace(netloc=f'{credentials}@{parts.netloc}')
+    return urlunsplit(parts)
+
+
+class _Rate:
+    """Contador de eventos com taxa (por segundo) em janela deslizante simples."""
+
+    def __init__(self):
+        self.total = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.per_second = 0.0
+
+    def tick(self):
+        self.total += 1
+        self._window_count += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= 2.0:
+            self.per_second = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+
+
+class LatestFrameBuffer:
+    """Guarda só o frame mais recente; frame não consumido é substituído (e contado como descarte)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._consumed_seq = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame is not None and self._consumed_seq < self._seq:
+                self.dropped += 1
+            self._frame = frame
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self, timeout):
+        """Frame mais recente ainda não entregue, ou None se nada chegou em `timeout`."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > self._consumed_seq, timeout):
+                return None
+            self._consumed_seq = self._seq
+            frame, self._frame = self._frame, None
+            return frame
+
+
+class CameraReader:
+    def __init__(self, camera, process, max_fps=5.0, open_capture=cv2.VideoCapture,
+                 max_backoff=60.0):
+        self.camera = camera
+        self.camera_id = str(camera['id'])
+        self.school_id = camera['school_id']
+        self.url = stream_url(camera)
+        self.process = process
+        self.max_fps = max_fps
+        self.open_capture = open_capture
+        self.max_backoff = max_backoff
+        self.buffer = LatestFrameBuffer()
+        self.captured = _Rate()
+        self.processed = _Rate()
+        self.reconnects = 0
+        self.errors = 0
+        self.status = 'starting'
+        self.last_error = None
+        self.last_frame_at = None
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name=f'camera-{self.camera_id}-capture', daemon=True),
+            threading.Thread(target=self._process_loop, name=f'camera-{self.camera_id}-process', daemon=True),
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _capture_loop(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            end_of_file = False
+            capture = self.open_capture(self.url)
+            if not capture.isOpened():
+                self.status = 'offline'
+                self.last_error = 'não foi possível abrir o stream'
+            else:
+                self.status = 'online'
+                # Arquivo local: toca no FPS do vídeo, como uma câmera
+                is_file = os.path.exists(self.url)
+                file_fps = capture.get(cv2.CAP_PROP_FPS) if is_file else 0
+                interval = 1.0 / file_fps if file_fps and file_fps > 0 else 0
+                while not self._stop.is_set():
+                    ok, frame = capture.read()
+                    if not ok:
+                        end_of_file = is_file and self.captured.total > 0
+                        self.last_error = 'fim do arquivo' if end_of_file else 'stream interrompido'
+                        break
+                    backoff = 1.0
+                    self.last_frame_at = time.time()
+                    self.captured.tick()
+                    self.buffer.put(frame)
+                    if interval:
+                        time.sleep(interval)
+                self.status = 'reconnecting'
+            capture.release()
+            if self._stop.is_set():
+                break
+            if end_of_file:
+                continue  # vídeo local em loop
+            self.reconnects += 1
+            print(f"⚠️ Câmera {self.camera_id}: {self.last_error}; reconectando em {backoff:.0f}s")
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+        self.status = 'stopped'
+
+    def _process_loop(self):
+        min_interval = 1.0 / self.max_fps if self.max_fps else 0
+        while not self._stop.is_set():
+            frame = self.buffer.get(timeout=1.0)
+            if frame is None:
+                continue
+            started = time.monotonic()
+            try:
+                self.process(self.school_id, frame, self.camera_id)
+                self.processed.tick()
+            except Exception as e:
+                # Fila cheia (QueueFull) ou erro pontual: segue para o próximo frame
+                self.errors += 1
+                self.last_error = str(e)
+            wait = min_interval - (time.monotonic() - started)
+            if wait > 0:
+                self._stop.wait(wait)
+
+    def stats(self):
+        return {
+            'school_id': self.school_id,
+            'name': self.camera.get('camera_name'),
+            'status': self.status,
+            'capture_fps': round(self.captured.per_second, 2),
+            'process_fps': round(self.processed.per_second, 2),
+            'frames_captured': self.captured.total,
+            'frames_processed': self.processed.total,
+            'frames_dropped': self.buffer.dropped,
+            'reconnects': self.reconnects,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'last_frame_age_seconds': round(time.time() - self.last_frame_at, 1) if self.last_frame_at else None,
+        }
+
+
+class CameraManager:
+    def __init__(self, fetch_cameras, process, purposes=('entrance',), max_fps=5.0, refresh_seconds=60.0,
+                 open_capture=cv2.VideoCapture):
+        """fetch_cameras() -> lista de linhas da tabela cameras"""
+        self.fetch_cameras = fetch_cameras
+        self.process = process
+        self.purposes = set(purposes) if purposes else None
+        self.max_fps = max_fps
+        self.refresh_seconds = refresh_seconds
+        self.open_capture = open_capture
+        self.readers = {}  # camera_id -> CameraReader
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def sync(self):
+        """Inicia leitores de câmeras novas/alteradas e para os de câmeras removidas."""
+        cameras = {
+            str(c['id']): c for c in self.fetch_cameras()
+            if self.purposes is None or c.get('camera_purpose') in self.purposes
+        }
+        with self._lock:
+            for camera_id, reader in list(self.readers.items()):
+                camera = cameras.get(camera_id)
+                if camera is None or stream_url(camera) != reader.url or camera['school_id'] != reader.school_id:
+                    reader.stop()
+                    del self.readers[camera_id]
+                    print(f"⏹️ Câmera {camera_id} parada")
+            for camera_id, camera in cameras.items():
+                if camera_id not in self.readers and stream_url(camera):
+                    self.readers[camera_id] = CameraReader(
+                        camera, self.process, self.max_fps, self.open_capture
+                    ).start()
+                    print(f"🎥 Câmera {camera_id} ({camera.get('camera_name')}) da escola {camera['school_id']} iniciada")
+
+    def run(self):
+        """Sincroniza com o cadastro a cada refresh_seconds (rodar em thread)."""
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"⚠️ Falha ao buscar câmeras: {e}")
+            self._stop.wait(self.refresh_seconds)
+
+    def start(self):
+        threading.Thread(target=self.run, name='camera-manager', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            for reader in self.readers.values():
+                reader.stop()
+
+    def stats(self):
+        with self._lock:
+            return {camera_id: reader.stats() for camera_id, reader in self.readers.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lê uma câmera (ou vídeo local) e mostra FPS de captura/envio')
+    parser.add_argument('--url', required=True, help='rtsp://..., http://... ou caminho de um arquivo de vídeo')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--max-fps', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    reader = CameraReader(
+        {'id': 'teste', 'school_id': None, 'camera_url': args.url},
+        lambda school_id, frame, camera_id: None,
+        max_fps=args.max_fps
+    ).start()
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        time.sleep(2)
+        print(reader.stats())
+    reader.stop()
+    reader.join(timeout=2)
+
+
+if __name__ == '__main__':
+    main()
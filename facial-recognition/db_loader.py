@@ -0,0 +1,143 @@
+"""
+Carga dos rostos direto dos school_{id}.db (serviço rodando na mesma máquina
+do backend), sem passar pela API.
+
+Mesmo formato de resposta de GET /api/school/<id>/students/embeddings
+({'version', 'full', 'students', 'removed', 'employees'}), então o
+EmbeddingsCache funciona igual com os dois carregadores. A conexão é somente
+leitura (mode=ro) e cada linha recebe 'embedding' já convertido.
+
+Descritores no formato binário (server_python/face_descriptors.py: cabeçalho
+'<2sBBH' + float32/float16) viram array com np.frombuffer, sem parse. Linhas
+ainda em JSON são convertidas de uma vez por dimensão (np.fromstring) em vez
+de um json.loads por aluno.
+"""
+import base64
+import binascii
+import json
+import os
+import sqlite3
+import struct
+
+import numpy as np
+
+FACES_VERSION_KEY = 'faces'  # mesmo nome de server_python/routes/face_helpers.py
+
+# mesmo layout de server_python/face_descriptors.py
+DESCRIPTOR_MAGIC = b'FD'
+DESCRIPTOR_FORMAT_VERSION = 1
+DESCRIPTOR_HEADER = struct.Struct('<2sBBH')
+DESCRIPTOR_DTYPES = {1: np.dtype('<f4'), 2: np.dtype('<f2')}
+
+
+def decode_descriptor_blob(blob):
+    """BLOB binário -> array float32 (None se o cabeçalho ou o tamanho não baterem)."""
+    if len(blob) < DESCRIPTOR_HEADER.size:
+        return None
+    magic, version, code, dim = DESCRIPTOR_HEADER.unpack_from(blob)
+    dtype = DESCRIPTOR_DTYPES.get(code)
+    if magic != DESCRIPTOR_MAGIC or version != DESCRIPTOR_FORMAT_VERSION or dtype is None:
+        return None
+    if len(blob) != DESCRIPTOR_HEADER.size + dim * dtype.itemsize:
+        return None
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=DESCRIPTOR_HEADER.size).astype(np.float32)
+
+
+def parse_descriptor(descriptor):
+    """Um descritor (BLOB, BLOB em base64 da API, texto JSON ou lista) -> array float32 ou None."""
+    if isinstance(descriptor, (bytes, bytearray, memoryview)):
+        return decode_descriptor_blob(bytes(descriptor))
+    if isinstance(descriptor, str) and descriptor[:1] not in ('[', '{'):
+        try:
+            return decode_descriptor_blob(base64.b64decode(descriptor, validate=True))
+        except (binascii.Error, ValueError):
+            return None
+    if isinstance(descriptor, (list, tuple)):
+        return np.asarray(descriptor, dtype=np.float32)
+    return parse_descriptors([descriptor])[0]
+
+
+def parse_descriptors(descriptors):
+    """Lista de descritores (BLOB ou JSON "[0.1, ...]") -> lista de arrays float32 (None se inválido)."""
+    result = [None] * len(descriptors)
+    by_dim = {}
+    for i, descriptor in enumerate(descriptors):
+        if isinstance(descriptor, (bytes, bytearray, memoryview)):
+            result[i] = decode_descriptor_blob(bytes(descriptor))
+            continue
+        text = (descriptor or '').strip()
+        if len(text) > 2 and text[0] == '[' and text[-1] == ']':
+            body = text[1:-1]
+            by_dim.setdefault(body.count(',') + 1, []).append((i, body))
+        elif text:
+            # formato fora do padrão (ex.: objeto {"0": ...}): caminho lento
+            try:
+                value = json.loads(text)
+                values = list(value.values()) if isinstance(value, dict) else value
+                result[i] = np.asarray(values, dtype=np.float32)
+            except (ValueError, TypeError):
+                pass
+
+    for dim, items in by_dim.items():
+        try:
+            flat = np.fromstring(','.join(body for _, body in items), dtype=np.float32, sep=',')
+        except ValueError:
+            flat = np.empty(0, dtype=np.float32)
+        # numpy antigo devolve o array parcial em vez de levantar erro: confere o tamanho
+        if flat.size == dim * len(items):
+            matrix = flat.reshape(len(items), dim)
+            for row, (i, _) in zip(matrix, items):
+                result[i] = row
+            continue
+        # algum descritor malformado no grupo: converte um a um e descarta o ruim
+        for i, body in items:
+            try:
+                result[i] = np.asarray(json.loads(f'[{body}]'), dtype=np.float32)
+            except (ValueError, TypeError):
+                pass
+    return result
+
+
+def _attach_embeddings(rows):
+    embeddings = parse_descriptors([row['face_descriptor'] for row in rows])
+    for row, embedding in zip(rows, embeddings):
+        row['embedding'] = embedding
+    return rows
+
+
+def load_embeddings_from_db(db_dir, school_id, since=0):
+    """Rostos da escola alterados desde a versão `since` (0 = todos), lidos do school_{id}.db."""
+    path = os.path.join(db_dir, f'school_{int(school_id)}.db')
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'banco da escola {school_id} não encontrado: {path}')
+
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute('SELECT version FROM data_versions WHERE name = ?', (FACES_VERSION_KEY,)).fetchone()
+        version = row[0] if row else 0
+        full = not since
+        rows = [dict(r) for r in conn.execute(f'''
+            SELECT id, name, face_descriptor, phone AS guardian_phone, class_name
+            FROM students
+            {'' if full else 'WHERE face_version > ?'}
+        ''', () if full else (since,)).fetchall()]
+        removed = [r['id'] for r in rows if not r['face_descriptor']]
+        if not full:
+            removed += [r[0] for r in conn.execute(
+                'SELECT student_id FROM face_removals WHERE version > ?', (since,)
+            ).fetchall()]
+        employees = [dict(r) for r in conn.execute('''
+            SELECT id, name, face_descriptor FROM employees
+            WHERE face_descriptor IS NOT NULL AND face_descriptor != ''
+        ''').fetchall()]
+    finally:
+        conn.close()
+
+    return {
+        'version': version,
+        'full': full,
+        'students': _attach_embeddings([r for r in rows if r['face_descriptor']]),
+        'removed': removed,
+        'employees': _attach_embeddings(employees),
+    }
@@ -0,0 +1,208 @@
+"""
+Cache das galerias de rostos por escola.
+
+- Versionado: cada escola guarda a versão dos rostos (data_versions['faces']
+  no backend). Passados EMBEDDINGS_REFRESH_SECONDS, a próxima busca pede só o
+  que mudou desde essa versão (?since=) e remonta a galeria se houve mudança.
+- Memória limitada: as escolas menos usadas recentemente saem do cache quando
+  a soma das galerias passa de max_bytes.
+- Single-flight: frames simultâneos de uma escola fria disparam uma única
+  carga; os demais esperam o resultado dela.
+- Atualização em segundo plano: a busca incremental roda numa thread à parte
+  (uma por escola de cada vez); os frames seguem com a galeria atual e passam
+  a usar a nova assim que ela fica pronta, sem esperar a API.
+
+Funcionários vêm sempre completos ('employees') e entram na galeria com chave
+'employee:<id>' e person_type = 'employee'.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from gallery import FaceGallery
+
+
+class _Entry:
+    def __init__(self, students, version, index_kind=None, employees_signature=None):
+        self.students = students  # student_id (ou 'employee:<id>') -> {'name', 'embedding', ...}
+        self.version = version
+        self.employees_signature = employees_signature
+        self.gallery = FaceGallery(students, index_kind)
+        self.checked_at = time.monotonic()
+        self.refreshing = False
+        self.nbytes = self._estimate_bytes()
+
+    def _estimate_bytes(self):
+        """Estimativa: matriz + estruturas do índice + embeddings de origem."""
+        index = self.gallery.index
+        total = self.gallery.matrix.nbytes
+        total += getattr(index, 'sorted_matrix', np.empty(0)).nbytes
+        total += sum(np.asarray(s['embedding']).nbytes + sys.getsizeof(s) for s in self.students.values())
+        return total
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+def _parse_people(rows, parse_embedding, person_type='student'):
+    """Linhas do payload -> {chave: dados}; usa 'embedding' se o carregador já converteu."""
+    people = {}
+    for row in rows:
+        embedding = row.get('embedding')
+        try:
+            if 'embedding' not in row:
+                embedding = parse_embedding(row['face_descriptor'])
+        except (ValueError, TypeError):
+            embedding = None
+        if embedding is None:
+            print(f"⚠️ Descritor inválido ({person_type} {row['id']}), ignorado")
+            continue
+        key = row['id'] if person_type == 'student' else f"{person_type}:{row['id']}"
+        people[key] = {
+            'name': row['name'],
+            'embedding': embedding,
+            'guardian_phone': row.get('guardian_phone') or '',
+            'class_name': row.get('class_name') or '',
+            'person_type': person_type,
+        }
+    return people
+
+
+def _employees_signature(payload):
+    return tuple(sorted((e['id'], e['name'], e['face_descriptor']) for e in payload.get('employees', [])))
+
+
+class EmbeddingsCache:
+    def __init__(self, fetch, parse_embedding, max_bytes, refresh_seconds=30, index_kind=None):
+        """fetch(school_id, since) -> {'version', 'full', 'students', 'removed', 'employees'} (exceção em erro)"""
+        self.fetch = fetch
+        self.parse_embedding = parse_embedding
+        self.max_bytes = max_bytes
+        self.refresh_seconds = refresh_seconds
+        self.index_kind = index_kind
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # school_id -> _Entry, do menos para o mais usado
+        self._flights = {}  # school_id -> _Flight (carga completa em andamento)
+        self.loads = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def get(self, school_id):
+        """Galeria da escola: carrega se fria; se vencida, devolve a atual e atualiza em segundo plano."""
+        with self._lock:
+            entry = self._entries.get(school_id)
+            if entry is not None:
+                self._entries.move_to_end(school_id)
+                stale = not entry.refreshing and time.monotonic() - entry.checked_at >= self.refresh_seconds
+                if stale:
+                    entry.refreshing = True
+            else:
+                flight = self._flights.get(school_id)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[school_id] = _Flight()
+
+        if entry is not None:
+            if stale:
+                threading.Thread(target=self._refresh, args=(school_id, entry),
+                                 name=f'embeddings-refresh-{school_id}', daemon=True).start()
+            return entry.gallery
+        if leader:
+            return self._load(school_id, flight).gallery
+
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.entry.gallery
+
+    def reload(self, school_id):
+        """Descarta a versão guardada e carrega a escola do zero."""
+        with self._lock:
+            self._entries.pop(school_id, None)
+        return self.get(school_id)
+
+    def _load(self, school_id, flight):
+        try:
+            payload = self.fetch(school_id, 0)
+            people = _parse_people(payload['students'], self.parse_embedding)
+            people.update(_parse_people(payload.get('employees', []), self.parse_embedding, 'employee'))
+            flight.entry = _Entry(people, payload['version'], self.index_kind, _employees_signature(payload))
+            self.loads += 1
+            print(f"📦 Galeria da escola {school_id}: {len(flight.entry.gallery)} rostos (versão {payload['version']})")
+            with self._lock:
+                self._entries[school_id] = flight.entry
+                self._evict(keep=school_id)
+            return flight.entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(school_id, None)
+            flight.done.set()
+
+    def _refresh(self, school_id, entry):
+        try:
+            payload = self.fetch(school_id, entry.version)
+            signature = _employees_signature(payload)
+            employees_changed = signature != entry.employees_signature
+            if payload['version'] != entry.version or payload.get('full') or employees_changed:
+                if payload.get('full'):
+                    people = {}
+                else:
+                    people = {k: v for k, v in entry.students.items() if v['person_type'] == 'student'}
+                for student_id in payload['removed']:
+                    people.pop(student_id, None)
+                people.update(_parse_people(payload['students'], self.parse_embedding))
+                people.update(_parse_people(payload.get('employees', []), self.parse_embedding, 'employee'))
+
+                fresh = _Entry(people, payload['version'], self.index_kind, signature)
+                self.refreshes += 1
+                print(f"🔄 Galeria da escola {school_id}: versão {entry.version} -> {payload['version']} "
+                      f"({len(payload['students'])} alterados, {len(payload['removed'])} removidos)")
+                with self._lock:
+                    if self._entries.get(school_id) is entry:
+                        self._entries[school_id] = fresh
+                        self._evict(keep=school_id)
+                return
+        except Exception as e:
+            print(f"⚠️ Falha ao atualizar galeria da escola {school_id}, mantendo versão {entry.version}: {e}")
+        # sem mudança ou erro: vale a galeria atual até o próximo intervalo
+        with self._lock:
+            entry.checked_at = time.monotonic()
+            entry.refreshing = False
+
+    def _evict(self, keep):
+        """LRU até caber em max_bytes (chamado com o lock); a escola recém-usada fica."""
+        total = sum(entry.nbytes for entry in self._entries.values())
+        for school_id in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if school_id == keep:
+                continue
+            total -= self._entries.pop(school_id).nbytes
+            self.evictions += 1
+            print(f"🧹 Galeria da escola {school_id} removida do cache (limite de memória)")
+
+    def items(self):
+        with self._lock:
+            return [(school_id, entry.gallery) for school_id, entry in self._entries.items()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'schools': len(self._entries),
+                'bytes': sum(entry.nbytes for entry in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'versions': {str(school_id): entry.version for school_id, entry in self._entries.items()},
+                'loads': self.loads,
+                'refreshes': self.refreshes,
+                'evictions': self.evictions,
+            }
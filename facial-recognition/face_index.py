@@ -0,0 +1,187 @@
+"""
+Índices de busca sobre a matriz de embeddings de uma galeria.
+
+- BruteForceIndex: compara o rosto com todas as linhas (exato).
+- IVFIndex: agrupa as linhas em listas por k-means (produto interno) e só
+  compara com as listas cujos centróides são mais próximos do rosto
+  (aproximado, custo ~ n_probe/n_lists da busca exata).
+
+Os dois recebem a matriz já normalizada (FaceGallery.matrix), rodam só em
+CPU com numpy e expõem contadores de latência e recall em `stats`. No IVF o
+recall é estimado conferindo uma amostra das buscas contra a busca exata.
+
+build_index() escolhe o tipo por GALLERY_INDEX (auto, brute, ivf); em auto o
+IVF só entra a partir de IVF_MIN_GALLERY alunos.
+"""
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+GALLERY_INDEX = os.getenv('GALLERY_INDEX', 'auto')
+IVF_MIN_GALLERY = int(os.getenv('IVF_MIN_GALLERY', '20000'))
+IVF_PROBE = int(os.getenv('IVF_PROBE', '8'))
+IVF_RECALL_SAMPLE = float(os.getenv('IVF_RECALL_SAMPLE', '0.02'))  # fração das buscas conferidas contra a exata
+
+_CHUNK_ROWS = 8192  # linhas por bloco ao atribuir listas (limita a memória do k-means)
+
+
+class IndexStats:
+    """Contadores de uma instância de índice (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recall_checks = 0
+        self.recall_hits = 0
+
+    def record_search(self, n_queries, seconds):
+        with self._lock:
+            self.queries += n_queries
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def record_recall(self, checks, hits):
+        with self._lock:
+            self.recall_checks += checks
+            self.recall_hits += hits
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'queries': self.queries,
+                'avg_ms': round(self.total_seconds * 1000 / self.queries, 3) if self.queries else None,
+                'max_ms': round(self.max_seconds * 1000, 3),
+                'recall_at_1': round(self.recall_hits / self.recall_checks, 4) if self.recall_checks else None,
+                'recall_checks': self.recall_checks,
+            }
+
+
+def _top_k(scores, k):
+    """(índices, scores) dos k maiores de cada linha, do maior para o menor."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class BruteForceIndex:
+    kind = 'brute'
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.stats = IndexStats()
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def exact(self, queries, k):
+        return _top_k(queries @ self.matrix.T, k)
+
+    def search(self, queries, k=1):
+        """queries: (n, dim) normalizadas. Retorna (índices, scores), ambos (n, k)."""
+        start = time.perf_counter()
+        result = self.exact(queries, k)
+        self.stats.record_search(queries.shape[0], time.perf_counter() - start)
+        # busca exata: recall 1 por definição
+        self.stats.record_recall(queries.shape[0], queries.shape[0])
+        return result
+
+    def describe(self):
+        return {'kind': self.kind, 'size': len(self), **self.stats.snapshot()}
+
+
+class IVFIndex(BruteForceIndex):
+    kind = 'ivf'
+
+    def __init__(self, matrix, n_lists=None, n_probe=IVF_PROBE, iterations=10,
+                 recall_sample=IVF_RECALL_SAMPLE, seed=0):
+        super().__init__(matrix)
+        n = matrix.shape[0]
+        self.n_lists = max(1, min(n_lists or int(np.sqrt(n)), n))
+        self.n_probe = max(1, min(n_probe, self.n_lists))
+        self.recall_sample = recall_sample
+        self._random = random.Random(seed)
+
+        self.centroids = self._train(np.random.default_rng(seed), iterations)
+        assignments = self._assign(matrix)
+        # linhas reordenadas por lista: cada lista é uma fatia contígua
+        self.order = np.argsort(assignments, kind='stable')
+        self.sorted_matrix = np.ascontiguousarray(matrix[self.order])
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def _assign(self, rows):
+        """Lista (centróide de maior produto interno) de cada linha, em blocos."""
+        return np.concatenate([
+            np.argmax(rows[i:i + _CHUNK_ROWS] @ self.centroids.T, axis=1)
+            for i in range(0, rows.shape[0], _CHUNK_ROWS)
+        ]) if rows.shape[0] else np.zeros(0, dtype=np.int64)
+
+    def _train(self, rng, iterations):
+        """k-means esférico sobre uma amostra da galeria."""
+        n = self.matrix.shape[0]
+        sample_size = min(n, self.n_lists * 64)
+        sample = self.matrix[rng.choice(n, sample_size, replace=False)] if sample_size < n else self.matrix
+        centroids = sample[rng.choice(sample.shape[0], self.n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            self.centroids = centroids
+            assignments = self._assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = ~np.bincount(assignments, minlength=self.n_lists).astype(bool)
+            # listas vazias recebem um ponto aleatório da amostra
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return centroids
+
+    def _probe(self, query, k):
+        lists = np.argpartition(-(self.centroids @ query), self.n_probe - 1)[:self.n_probe]
+        rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+        indices = np.full(k, -1, dtype=np.int64)
+        scores = np.full(k, -np.inf, dtype=np.float32)
+        if rows.size:
+            top, top_scores = _top_k((self.sorted_matrix[rows] @ query)[np.newaxis, :], k)
+            indices[:top.shape[1]] = self.order[rows[top[0]]]
+            scores[:top.shape[1]] = top_scores[0]
+        return indices, scores
+
+    def search(self, queries, k=1):
+        """Igual a BruteForceIndex.search; posições sem candidato vêm como (-1, -inf)."""
+        k = min(k, len(self))
+        start = time.perf_counter()
+        results = [self._probe(query, k) for query in queries]
+        indices = np.array([r[0] for r in results]).reshape(len(results), k)
+        scores = np.array([r[1] for r in results]).reshape(len(results), k)
+        self.stats.record_search(queries.shape[0], time.perf_counter() - start)
+
+        # estimativa de recall fora do tempo medido
+        sampled = [i for i in range(queries.shape[0]) if self._random.random() < self.recall_sample]
+        if sampled:
+            exact, _ = self.exact(queries[sampled], 1)
+            hits = int(np.sum(indices[sampled, 0] == exact[:, 0]))
+            self.stats.record_recall(len(sampled), hits)
+        return indices, scores
+
+    def describe(self):
+        return {**super().describe(), 'n_lists': self.n_lists, 'n_probe': self.n_probe}
+
+
+def build_index(matrix, kind=None):
+    """Índice para a matriz normalizada de uma galeria (ver GALLERY_INDEX)."""
+    kind = kind or GALLERY_INDEX
+    if kind == 'auto':
+        kind = 'ivf' if matrix.shape[0] >= IVF_MIN_GALLERY else 'brute'
+    if kind == 'ivf' and matrix.shape[0] > 0:
+        return IVFIndex(matrix)
+    if kind not in ('brute', 'ivf'):
+        print(f"⚠️ GALLERY_INDEX desconhecido: {kind}, usando busca exata")
+    return BruteForceIndex(matrix)
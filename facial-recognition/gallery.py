@@ -0,0 +1,72 @@
+"""
+Galeria de rostos de uma escola em formato de matriz.
+
+Os embeddings são empilhados uma única vez (ao carregar a escola) em uma
+matriz float32 com as linhas já normalizadas; comparar todos os rostos de um
+frame com todos os alunos vira uma multiplicação de matrizes. A busca em si
+fica no índice (face_index.py), exato ou aproximado conforme o tamanho.
+"""
+import numpy as np
+
+from face_index import build_index
+
+
+def normalize_rows(matrix):
+    """Normaliza cada linha para norma 1 (linhas zeradas continuam zeradas)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class FaceGallery:
+    def __init__(self, students, index_kind=None):
+        """students: {student_id: {'name', 'embedding', 'guardian_phone', 'class_name'}}"""
+        self.student_ids = []
+        self.students = []
+        rows = []
+        dim = None
+        for student_id, data in students.items():
+            embedding = np.asarray(data['embedding'], dtype=np.float32).ravel()
+            if dim is None:
+                dim = embedding.shape[0]
+            if embedding.shape[0] != dim:
+                print(f"⚠️ Embedding do aluno {student_id} com dimensão {embedding.shape[0]} (esperado {dim}), ignorado")
+                continue
+            self.student_ids.append(student_id)
+            self.students.append({k: v for k, v in data.items() if k != 'embedding'})
+            rows.append(embedding)
+
+        self.dim = dim or 0
+        self.matrix = normalize_rows(np.stack(rows)) if rows else np.zeros((0, self.dim), dtype=np.float32)
+        self.index = build_index(self.matrix, index_kind)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def scores(self, face_embeddings):
+        """Similaridade cosseno (n_rostos x n_alunos) em uma única multiplicação."""
+        return normalize_rows(face_embeddings) @ self.matrix.T
+
+    def candidate(self, index, similarity):
+        return {
+            'id': self.student_ids[index],
+            'similarity': float(similarity),
+            **self.students[index],
+        }
+
+    def match(self, face_embeddings, k=1, threshold=0.0):
+        """Top-k alunos por rosto, com similaridade acima de threshold (maior primeiro)."""
+        face_embeddings = np.asarray(face_embeddings, dtype=np.float32)
+        n_faces = 1 if face_embeddings.ndim == 1 else face_embeddings.shape[0]
+        if len(self) == 0 or n_faces == 0:
+            return [[] for _ in range(n_faces)]
+
+        top, top_scores = self.index.search(normalize_rows(face_embeddings), k)
+
+        return [
+            [self.candidate(i, s) for i, s in zip(indices, row_scores) if s > threshold]
+            for indices, row_scores in zip(top, top_scores)
+        ]
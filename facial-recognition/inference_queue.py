@@ -0,0 +1,174 @@
+"""
+Fila de inferência com micro-lotes para os frames das câmeras.
+
+Uma única thread é dona do modelo: junta os frames que chegaram (de várias
+câmeras) em lotes de até max_batch, esperando no máximo batch_window
+segundos depois do primeiro, e chama run_batch(frames) uma vez por lote.
+
+Backpressure:
+- fila cheia (max_queue): submit levanta QueueFull (a rota responde 429);
+- frame novo de uma câmera que já tem frame na fila: o antigo é descartado
+  (status 'superseded'), já que só o mais recente interessa;
+- frame que esperou mais que max_age na fila é descartado sem inferência
+  (status 'stale'); submit(max_age=...) troca o limite de um job (cadastro de
+  rosto não é descartado por atraso).
+"""
+import threading
+import time
+from collections import deque
+
+
+class QueueFull(Exception):
+    pass
+
+
+class InferenceJob:
+    def __init__(self, frame, camera_id, max_age=None):
+        self.frame = frame
+        self.camera_id = camera_id
+        self.max_age = max_age
+        self.enqueued_at = time.monotonic()
+        self.status = 'queued'  # queued -> done | stale | superseded | error
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.frame = None
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Resultado de run_batch para este frame; None se foi descartado."""
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class InferenceScheduler:
+    def __init__(self, run_batch, max_queue=32, max_batch=8, batch_window=0.01, max_age=0.5):
+        """run_batch(frames) -> lista com um resultado por frame, na mesma ordem"""
+        self.run_batch = run_batch
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.max_age = max_age
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()  # protege as métricas
+        self._metrics = {
+            'submitted': 0, 'processed': 0, 'rejected': 0, 'stale': 0, 'superseded': 0, 'errors': 0,
+            'batches': 0, 'batch_frames': 0, 'max_batch_seen': 0, 'inference_seconds': 0.0, 'wait_seconds': 0.0,
+        }
+        self._batch_sizes = [0] * (max_batch + 1)
+        self._thread = threading.Thread(target=self._worker, name='inference', daemon=True)
+        self._thread.start()
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._metrics[key] += value
+
+    def submit(self, frame, camera_id=None, max_age=None):
+        """Enfileira o frame; levanta QueueFull se a fila estiver cheia.
+
+        camera_id None: o frame nunca é substituído por outro; max_age None: usa o do scheduler.
+        """
+        job = InferenceJob(frame, camera_id, max_age)
+        superseded = []
+        with self._cond:
+            if camera_id is not None:
+                for queued in [j for j in self._queue if j.camera_id == camera_id]:
+                    self._queue.remove(queued)
+                    superseded.append(queued)
+            if len(self._queue) >= self.max_queue:
+                self._count(rejected=1)
+                raise QueueFull(f'fila de inferência cheia ({self.max_queue})')
+            self._queue.append(job)
+            self._count(submitted=1)
+            self._cond.notify()
+
+        for queued in superseded:
+            queued.finish('superseded')
+        if superseded:
+            self._count(superseded=len(superseded))
+        return job
+
+    def _next_batch(self):
+        """Bloqueia até ter um frame e junta os que chegarem dentro da janela."""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self.batch_window
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+    def _worker(self):
+        while True:
+            jobs = self._next_batch()
+            now = time.monotonic()
+            fresh = []
+            for job in jobs:
+                max_age = self.max_age if job.max_age is None else job.max_age
+                if now - job.enqueued_at > max_age:
+                    job.finish('stale')
+                    self._count(stale=1)
+                else:
+                    fresh.append(job)
+            if not fresh:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.run_batch([job.frame for job in fresh])
+            except Exception as e:
+                print(f"❌ Erro na inferência do lote ({len(fresh)} frames): {e}")
+                for job in fresh:
+                    job.finish('error', error=e)
+                self._count(errors=len(fresh))
+                continue
+            elapsed = time.perf_counter() - start
+
+            for job, result in zip(fresh, results):
+                job.finish('done', result=result)
+            with self._lock:
+                self._metrics['processed'] += len(fresh)
+                self._metrics['batches'] += 1
+                self._metrics['batch_frames'] += len(fresh)
+                self._metrics['max_batch_seen'] = max(self._metrics['max_batch_seen'], len(fresh))
+                self._metrics['inference_seconds'] += elapsed
+                self._metrics['wait_seconds'] += sum(now - job.enqueued_at for job in fresh)
+                self._batch_sizes[len(fresh)] += 1
+
+    def metrics(self):
+        with self._cond:
+            depth = len(self._queue)
+        with self._lock:
+            m = dict(self._metrics)
+            batch_sizes = {str(size): count for size, count in enumerate(self._batch_sizes) if count}
+        processed = m['processed']
+        return {
+            'queue_depth': depth,
+            'max_queue': self.max_queue,
+            'submitted': m['submitted'],
+            'processed': processed,
+            'rejected': m['rejected'],
+            'stale': m['stale'],
+            'superseded': m['superseded'],
+            'errors': m['errors'],
+            'batches': m['batches'],
+            'avg_batch_size': round(m['batch_frames'] / m['batches'], 2) if m['batches'] else None,
+            'max_batch_size': m['max_batch_seen'],
+            'batch_sizes': batch_sizes,
+            'avg_inference_ms_per_frame': round(m['inference_seconds'] * 1000 / processed, 2) if processed else None,
+            'avg_queue_wait_ms': round(m['wait_seconds'] * 1000 / processed, 2) if processed else None,
+            'frames_per_second_busy': round(processed / m['inference_seconds'], 2) if m['inference_seconds'] else None,
+        }
@@ -0,0 +1,174 @@
+"""
+Fila persistente dos efeitos colaterais do reconhecimento (registro de entrada
+na API, WhatsApp para o responsável).
+
+process_frame só enfileira (uma linha no SQLite local) e responde; um
+despachante entrega as tarefas a um pool de threads que chama o handler do
+tipo. Falha temporária (rede, timeout, 5xx, 429) volta para a fila com
+backoff exponencial; falha definitiva (PermanentError, ex.: 4xx) ou tentativas
+esgotadas marcam a tarefa como 'dead'. Como a fila fica em disco, tarefas
+pendentes sobrevivem a um restart (entrega pelo menos uma vez).
+
+Cada tarefa é reservada no banco (claimed_until) antes de rodar, então mais
+de um processo pode consumir a mesma fila (ex.: reloader do Flask em debug)
+sem enviar duas vezes; se o processo morrer, a reserva expira e a tarefa volta.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PermanentError(Exception):
+    """Erro que não adianta repetir (dados inválidos, 4xx)."""
+
+
+class SideEffectQueue:
+    def __init__(self, db_path, handlers, workers=4, max_attempts=8, base_delay=2.0, max_delay=300.0,
+                 poll_interval=1.0, lease_seconds=120.0):
+        """handlers: {tipo: função(payload)}; levantar exceção = falhou"""
+        self.handlers = handlers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS side_effects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            last_error TEXT,
+            claimed_until REAL
+        )''')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(side_effects)').fetchall()]
+        if 'claimed_until' not in columns:
+            self._conn.execute('ALTER TABLE side_effects ADD COLUMN claimed_until REAL')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_side_effects_due ON side_effects(status, next_attempt_at)')
+        self._conn.commit()
+        self._db_lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._inflight = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='side-effect')
+        self._workers = workers
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._dispatch, name='side-effects', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, kind, payload):
+        """Grava a tarefa em disco e acorda o despachante."""
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                'INSERT INTO side_effects (kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)',
+                (kind, json.dumps(payload), now, now)
+            )
+            self._conn.commit()
+        with self._wake:
+            self._wake.notify()
+
+    def _claim(self, limit):
+        """Reserva até `limit` tarefas vencidas (transação de escrita: um processo por vez)."""
+        if limit <= 0:
+            return []
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                jobs = self._conn.execute('''
+                    SELECT id, kind, payload, attempts FROM side_effects
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                      AND (claimed_until IS NULL OR claimed_until < ?)
+                    ORDER BY next_attempt_at, id
+                    LIMIT ?
+                ''', (now, now, limit)).fetchall()
+                self._conn.executemany(
+                    'UPDATE side_effects SET claimed_until = ? WHERE id = ?',
+                    [(now + self.lease_seconds, job[0]) for job in jobs]
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            return jobs
+
+    def _dispatch(self):
+        while True:
+            with self._wake:
+                free = self._workers * 2 - len(self._inflight)
+            try:
+                jobs = self._claim(free)
+            except sqlite3.Error as e:
+                print(f"⚠️ Fila de efeitos colaterais indisponível: {e}")
+                jobs = []
+            for job in jobs:
+                with self._wake:
+                    self._inflight.add(job[0])
+                self._executor.submit(self._run, *job)
+            with self._wake:
+                self._wake.wait(self.poll_interval)
+
+    def _run(self, job_id, kind, payload, attempts):
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise PermanentError(f'tipo desconhecido: {kind}')
+            handler(json.loads(payload))
+            with self._db_lock:
+                self._conn.execute('DELETE FROM side_effects WHERE id = ?', (job_id,))
+                self._conn.commit()
+                self.delivered += 1
+        except Exception as e:
+            self._failed(job_id, kind, attempts + 1, e)
+        finally:
+            with self._wake:
+                self._inflight.discard(job_id)
+                self._wake.notify()
+
+    def _failed(self, job_id, kind, attempts, error):
+        if isinstance(error, PermanentError) or attempts >= self.max_attempts:
+            status, next_attempt_at = 'dead', time.time()
+            print(f"❌ {kind} #{job_id} desistido após {attempts} tentativa(s): {error}")
+        else:
+            # backoff exponencial com jitter
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            status, next_attempt_at = 'pending', time.time() + delay
+            print(f"⚠️ {kind} #{job_id} falhou (tentativa {attempts}), nova tentativa em {delay:.0f}s: {error}")
+        with self._db_lock:
+            self._conn.execute(
+                'UPDATE side_effects SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, claimed_until = NULL '
+                'WHERE id = ?',
+                (status, attempts, next_attempt_at, str(error)[:500], job_id)
+            )
+            self._conn.commit()
+            if status == 'dead':
+                self.failed += 1
+            else:
+                self.retried += 1
+
+    def stats(self):
+        with self._db_lock:
+            counts = dict(self._conn.execute(
+                "SELECT kind || ':' || status, COUNT(*) FROM side_effects GROUP BY kind, status"
+            ).fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM side_effects WHERE status = 'pending'"
+            ).fetchone()[0]
+        return {
+            'queued': counts,
+            'inflight': len(self._inflight),
+            'oldest_pending_seconds': round(time.time() - oldest, 1) if oldest else None,
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
@@ -0,0 +1,134 @@
+"""
+Cache das galerias (embeddings_cache.py): escola fria carrega uma vez só com
+frames simultâneos, galeria vencida é devolvida na hora e trocada quando a
+busca incremental termina em segundo plano, e falha na atualização mantém a
+galeria atual.
+
+    pytest test_embeddings_cache.py
+"""
+import threading
+import time
+
+import numpy as np
+
+from embeddings_cache import EmbeddingsCache
+
+
+def _row(student_id, seed):
+    return {'id': student_id, 'name': f'Aluno {student_id}', 'embedding': np.random.default_rng(seed).random(8)}
+
+
+class FakeApi:
+    """fetch(school_id, since) do backend; segura a resposta enquanto `gate` estiver fechado."""
+
+    def __init__(self):
+        self.version = 1
+        self.students = {1: _row(1, 1), 2: _row(2, 2)}
+        self.removed = []
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.error = None
+
+    def fetch(self, school_id, since):
+        self.calls.append(since)
+        self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return {'version': self.version, 'full': since == 0, 'students': list(self.students.values()),
+                'removed': self.removed if since else []}
+
+
+def _cache(api, refresh_seconds=30):
+    return EmbeddingsCache(api.fetch, np.asarray, max_bytes=1 << 20, refresh_seconds=refresh_seconds)
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condição não atingida a tempo'
+        time.sleep(0.01)
+
+
+def test_cold_school_loads_once_for_concurrent_frames():
+    api = FakeApi()
+    api.gate.clear()
+    cache = _cache(api)
+    galleries = []
+    threads = [threading.Thread(target=lambda: galleries.append(cache.get('7'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    _wait_until(lambda: len(api.calls) == 1)
+    time.sleep(0.05)
+    api.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert api.calls == [0]
+    assert cache.loads == 1
+    assert len(galleries) == 8 and all(g is galleries[0] for g in galleries)
+    assert sorted(galleries[0].student_ids) == [1, 2]
+
+
+def test_failed_cold_load_reaches_every_waiter_and_retries():
+    api = FakeApi()
+    api.gate.clear()
+    api.error = RuntimeError('API fora do ar')
+    cache = _cache(api)
+    errors = []
+
+    def get():
+        try:
+            cache.get('7')
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    _wait_until(lambda: len(api.calls) == 1)
+    time.sleep(0.05)
+    api.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 4 and api.calls == [0]
+
+    # O erro não fica guardado: a próxima busca tenta de novo
+    api.error = None
+    assert len(cache.get('7')) == 2
+
+
+def test_stale_gallery_is_served_while_refresh_runs():
+    api = FakeApi()
+    cache = _cache(api, refresh_seconds=0)
+    first = cache.get('7')
+
+    api.version = 2
+    api.students = {3: _row(3, 3)}
+    api.removed = [1]
+    api.gate.clear()
+    # Vencida: volta na hora com a galeria atual e dispara uma única atualização
+    assert cache.get('7') is first
+    assert cache.get('7') is first
+    _wait_until(lambda: len(api.calls) == 2)
+    assert api.calls == [0, 1]
+
+    api.gate.set()
+    _wait_until(lambda: cache.refreshes == 1)
+    fresh = cache.get('7')
+    assert fresh is not first
+    assert sorted(fresh.student_ids) == [2, 3]
+    assert cache.stats()['versions'] == {'7': 2}
+
+
+def test_failed_refresh_keeps_current_gallery():
+    api = FakeApi()
+    cache = _cache(api, refresh_seconds=0)
+    first = cache.get('7')
+
+    api.error = RuntimeError('timeout')
+    assert cache.get('7') is first
+    _wait_until(lambda: len(api.calls) == 2)
+    _wait_until(lambda: not cache._entries['7'].refreshing)
+    assert cache.get('7') is first
+    assert cache.refreshes == 0
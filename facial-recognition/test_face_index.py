@@ -0,0 +1,68 @@
+"""
+Índices da galeria (face_index.py): o IVF acha o mesmo aluno que a busca
+exata na grande maioria das consultas, fica idêntico a ela sondando todas as
+listas, completa com (-1, -inf) quando as listas sondadas têm menos de k
+linhas e reporta o recall estimado em describe(). A galeria (gallery.py)
+casa vários rostos de uma vez com o mesmo resultado de um por um.
+
+    pytest test_face_index.py
+"""
+import numpy as np
+
+from benchmark_index import synthetic_gallery, synthetic_queries
+from face_index import BruteForceIndex, IVFIndex, build_index
+
+
+def _data(size=4000, queries=200, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = synthetic_gallery(size, rng)
+    return matrix, synthetic_queries(matrix, queries, rng)
+
+
+def test_ivf_recall_against_exact_search():
+    matrix, queries = _data()
+    exact, _ = BruteForceIndex(matrix).search(queries, k=1)
+    ivf = IVFIndex(matrix)
+    found, scores = ivf.search(queries, k=5)
+
+    assert found.shape == scores.shape == (len(queries), 5)
+    assert np.all(np.diff(scores, axis=1) <= 0)
+    assert np.mean(found[:, 0] == exact[:, 0]) >= 0.95
+
+
+def test_probing_every_list_is_exact():
+    matrix, queries = _data(size=1000)
+    ivf = IVFIndex(matrix, n_lists=16, n_probe=16)
+    exact, exact_scores = BruteForceIndex(matrix).search(queries, k=3)
+    found, scores = ivf.search(queries, k=3)
+    assert np.array_equal(found, exact)
+    assert np.allclose(scores, exact_scores, atol=1e-6)
+
+
+def test_short_probe_pads_missing_candidates():
+    matrix, queries = _data(size=64, queries=4)
+    ivf = IVFIndex(matrix, n_lists=32, n_probe=1)
+    found, scores = ivf.search(queries, k=64)
+    padded = found == -1
+    assert padded.any()
+    assert np.all(np.isneginf(scores[padded]))
+    assert np.all(found[~padded] >= 0)
+
+
+def test_describe_reports_recall_sample():
+    matrix, queries = _data(size=2000)
+    ivf = IVFIndex(matrix, recall_sample=1.0)
+    ivf.search(queries, k=1)
+    info = ivf.describe()
+    assert info['kind'] == 'ivf' and info['size'] == 2000
+    assert info['queries'] == len(queries) and info['recall_checks'] == len(queries)
+    assert info['n_probe'] <= info['n_lists']
+    assert 0.95 <= info['recall_at_1'] <= 1.0
+
+
+def test_build_index_kind():
+    matrix, _ = _data(size=100, queries=1)
+    assert build_index(matrix, 'brute').kind == 'brute'
+    assert build_index(matrix, 'ivf').kind == 'ivf'
+    # Galeria vazia não treina k-means
+    assert build_index(np.zeros((0, 512), dtype=np.float32), 'ivf').kind == 'brute'
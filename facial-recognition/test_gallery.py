@@ -0,0 +1,30 @@
+"""
+Galeria de uma escola (gallery.py): casar todos os rostos de um frame numa
+única busca dá o mesmo resultado que casar um rosto por vez, com a busca
+exata e com o IVF, e as linhas guardadas ficam normalizadas.
+
+    pytest test_gallery.py
+"""
+import numpy as np
+
+from benchmark_index import synthetic_gallery, synthetic_queries
+from gallery import FaceGallery, normalize_rows
+
+
+def test_gallery_batch_match_equals_single_faces():
+    rng = np.random.default_rng(0)
+    matrix = synthetic_gallery(300, rng)
+    queries = synthetic_queries(matrix, 6, rng)
+    students = {student_id: {'name': f'Aluno {student_id}', 'embedding': row * 3}
+                for student_id, row in enumerate(matrix, start=100)}
+    for kind in ('brute', 'ivf'):
+        gallery = FaceGallery(students, kind)
+        together = gallery.match(queries, k=3, threshold=0.2)
+        one_by_one = [gallery.match(face, k=3, threshold=0.2)[0] for face in queries]
+        assert [[c['id'] for c in faces] for faces in together] == [[c['id'] for c in faces] for faces in one_by_one]
+        assert np.allclose([c['similarity'] for faces in together for c in faces],
+                           [c['similarity'] for faces in one_by_one for c in faces], atol=1e-5)
+        # Embeddings guardados sem normalizar: a galeria normaliza as linhas
+        assert np.allclose(gallery.matrix, normalize_rows(matrix), atol=1e-6)
+        best = together[0][0]
+        assert best['name'] == f"Aluno {best['id']}" and best['similarity'] > 0.2
@@ -0,0 +1,110 @@
+"""
+Fila persistente de efeitos colaterais (side_effects.py): entrega com nova
+tentativa em falha temporária, desistência em PermanentError ou tentativas
+esgotadas, tarefa pendente sobrevive a um restart e dois processos na mesma
+fila não entregam a mesma tarefa duas vezes.
+
+    pytest test_side_effects.py
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from side_effects import PermanentError, SideEffectQueue
+
+
+def _queue(path, handlers, **kwargs):
+    options = {'workers': 2, 'base_delay': 0.01, 'max_delay': 0.05, 'poll_interval': 0.02}
+    options.update(kwargs)
+    return SideEffectQueue(str(path), handlers, **options)
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condição não atingida a tempo'
+        time.sleep(0.01)
+
+
+def _rows(path):
+    conn = sqlite3.connect(str(path))
+    try:
+        return conn.execute('SELECT kind, status, attempts FROM side_effects ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+def test_transient_failure_is_retried_until_delivered(tmp_path):
+    path = tmp_path / 'queue.db'
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        if len(calls) < 3:
+            raise ConnectionError('API fora do ar')
+
+    queue = _queue(path, {'entry': flaky})
+    queue.enqueue('entry', {'student_id': 7, 'timestamp': '2026-03-10T10:00:00+00:00'})
+    _wait_until(lambda: queue.delivered == 1)
+
+    assert len(calls) == 3 and calls[-1]['student_id'] == 7
+    assert queue.retried == 2 and queue.failed == 0
+    assert _rows(path) == []
+
+
+def test_permanent_error_and_exhausted_attempts_are_dead(tmp_path):
+    path = tmp_path / 'queue.db'
+
+    def rejected(payload):
+        raise PermanentError('400 aluno inexistente')
+
+    def down(payload):
+        raise TimeoutError('timeout')
+
+    queue = _queue(path, {'entry': rejected, 'whatsapp': down}, max_attempts=3)
+    queue.enqueue('entry', {'student_id': 1})
+    queue.enqueue('whatsapp', {'phone': '5511999999999'})
+    queue.enqueue('unknown', {})
+    _wait_until(lambda: queue.failed == 3)
+
+    assert sorted(_rows(path)) == [('entry', 'dead', 1), ('unknown', 'dead', 1), ('whatsapp', 'dead', 3)]
+    assert queue.stats()['queued'] == {'entry:dead': 1, 'unknown:dead': 1, 'whatsapp:dead': 1}
+
+
+def test_pending_task_survives_restart(tmp_path):
+    path = tmp_path / 'queue.db'
+    # Processo anterior morreu logo depois de reservar a tarefa: a reserva vence e ela volta
+    _queue(path, {}, poll_interval=60)
+    conn = sqlite3.connect(str(path))
+    now = time.time()
+    conn.execute('INSERT INTO side_effects (kind, payload, next_attempt_at, created_at, claimed_until) '
+                 'VALUES (?, ?, ?, ?, ?)', ('entry', json.dumps({'student_id': 9}), now, now, now + 0.3))
+    conn.commit()
+    conn.close()
+
+    delivered = []
+    queue = _queue(path, {'entry': delivered.append})
+    _wait_until(lambda: queue.delivered == 1)
+    assert delivered == [{'student_id': 9}]
+
+
+def test_two_consumers_deliver_each_task_once(tmp_path):
+    path = tmp_path / 'queue.db'
+    lock = threading.Lock()
+    delivered = []
+
+    def handler(payload):
+        time.sleep(0.002)
+        with lock:
+            delivered.append(payload['n'])
+
+    first = _queue(path, {'entry': handler})
+    second = _queue(path, {'entry': handler})
+    for n in range(60):
+        (first if n % 2 else second).enqueue('entry', {'n': n})
+    _wait_until(lambda: first.delivered + second.delivered == 60)
+    time.sleep(0.1)
+
+    assert sorted(delivered) == list(range(60))
+    assert _rows(path) == []
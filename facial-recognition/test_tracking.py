@@ -0,0 +1,75 @@
+"""
+Deduplicação de entradas (tracking.py): o mesmo rosto em frames seguidos
+gera uma entrada só, o aluno que sai e volta (ou aparece em outra câmera)
+fica no cooldown, e depois do cooldown entra de novo.
+
+    pytest test_tracking.py
+"""
+import pytest
+
+import tracking
+from tracking import CameraTracker, EntryDeduplicator, iou
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(tracking, 'time', fake)
+    return fake
+
+
+def test_iou():
+    assert iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert iou([0, 0, 10, 10], [20, 20, 30, 30]) == 0.0
+    assert iou([0, 0, 10, 10], [5, 0, 15, 10]) == pytest.approx(50 / 150)
+
+
+def test_tracker_follows_moving_faces():
+    tracker = CameraTracker(iou_threshold=0.3, max_idle=2.0)
+    a, b = tracker.update([[0, 0, 10, 10], [50, 50, 60, 60]], now=0.0)
+    # Caixas andam um pouco e chegam em outra ordem
+    b2, a2 = tracker.update([[51, 50, 61, 60], [1, 0, 11, 10]], now=0.1)
+    assert (a2.id, b2.id) == (a.id, b.id)
+    # Sumiu por mais que max_idle: trilha nova
+    (a3,) = tracker.update([[1, 0, 11, 10]], now=5.0)
+    assert a3.id not in (a.id, b.id)
+
+
+def test_one_entry_per_track_and_cooldown(clock):
+    dedup = EntryDeduplicator(cooldown_seconds=600, iou_threshold=0.3, max_idle=2.0)
+    box = [[100, 100, 200, 200]]
+
+    first = dedup.observe('1', 'portaria', box, [7])
+    assert first[0][1] is True
+    for _ in range(10):
+        clock.now += 0.2
+        assert dedup.observe('1', 'portaria', box, [7]) == [(first[0][0], False)]
+
+    # Saiu do quadro e voltou (trilha nova) ou passou em outra câmera: ainda no cooldown
+    clock.now += 30
+    assert dedup.observe('1', 'portaria', box, [7])[0][1] is False
+    assert dedup.observe('1', 'portao2', box, [7])[0][1] is False
+    # Outra escola não compartilha cooldown
+    assert dedup.observe('2', 'portaria', box, [7])[0][1] is True
+
+    clock.now += 600
+    assert dedup.observe('1', 'portao2', [[0, 0, 50, 50]], [7])[0][1] is True
+    assert dedup.stats()['entries'] == 3
+
+
+def test_unrecognized_face_then_recognized(clock):
+    dedup = EntryDeduplicator(cooldown_seconds=600)
+    box = [[100, 100, 200, 200]]
+    (track_id, new_entry), = dedup.observe('1', None, box, [None])
+    assert new_entry is False
+    clock.now += 0.2
+    # Mesma trilha, agora reconhecida: conta a entrada
+    assert dedup.observe('1', None, box, [7]) == [(track_id, True)]
@@ -0,0 +1,133 @@
+"""
+Deduplicação de entradas: rastreamento por IoU entre frames + cooldown por aluno.
+
+Um aluno parado na frente da câmera aparece em dezenas de frames seguidos.
+Cada câmera mantém trilhas (CameraTracker): um rosto cuja caixa sobrepõe a
+de uma trilha recente (IoU >= iou_threshold) é o mesmo rosto, e a trilha só
+gera uma entrada. Além disso, cada aluno tem um cooldown por escola: depois
+de uma entrada, novas trilhas do mesmo aluno (saiu e voltou ao quadro, outra
+câmera da portaria) não geram outra até o intervalo passar.
+"""
+import threading
+import time
+from itertools import count
+
+
+def iou(a, b):
+    """Interseção sobre união de duas caixas [x1, y1, x2, y2]."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, bbox, now):
+        self.id = track_id
+        self.bbox = bbox
+        self.last_seen = now
+        self.student_id = None  # aluno pelo qual a trilha já foi tratada (registrada ou suprimida)
+
+
+class CameraTracker:
+    def __init__(self, iou_threshold=0.3, max_idle=2.0):
+        self.iou_threshold = iou_threshold
+        self.max_idle = max_idle
+        self.tracks = []
+        self._ids = count(1)
+
+    def update(self, bboxes, now):
+        """Associa cada caixa a uma trilha (guloso por maior IoU); retorna as trilhas na ordem das caixas."""
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_idle]
+
+        pairs = sorted(
+            ((iou(bbox, track.bbox), i, track) for i, bbox in enumerate(bboxes) for track in self.tracks),
+            key=lambda p: p[0], reverse=True
+        )
+        assigned = [None] * len(bboxes)
+        used = set()
+        for overlap, i, track in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if assigned[i] is None and track.id not in used:
+                assigned[i] = track
+                used.add(track.id)
+
+        for i, bbox in enumerate(bboxes):
+            if assigned[i] is None:
+                assigned[i] = Track(next(self._ids), bbox, now)
+                self.tracks.append(assigned[i])
+            assigned[i].bbox = bbox
+            assigned[i].last_seen = now
+        return assigned
+
+
+class EntryDeduplicator:
+    def __init__(self, cooldown_seconds=600, iou_threshold=0.3, max_idle=2.0):
+        self.cooldown_seconds = cooldown_seconds
+        self.iou_threshold = iou_threshold
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._trackers = {}  # (school_id, camera_id) -> CameraTracker
+        self._last_entry = {}  # (school_id, student_id) -> instante da última entrada
+        self._last_prune = time.monotonic()
+        self.suppressed = 0
+        self.entries = 0
+
+    def observe(self, school_id, camera_id, bboxes, student_ids):
+        """Para cada rosto do frame, (track_id, nova_entrada).
+
+        student_ids traz o aluno reconhecido de cada caixa (None se nenhum).
+        nova_entrada é True só na primeira vez que a trilha reconhece um aluno
+        fora do cooldown; é o único caso em que a entrada deve ser registrada.
+        """
+        now = time.monotonic()
+        with self._lock:
+            key = (str(school_id), camera_id or 'default')
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = CameraTracker(self.iou_threshold, self.max_idle)
+            tracks = tracker.update([list(map(float, b)) for b in bboxes], now)
+
+            decisions = []
+            for track, student_id in zip(tracks, student_ids):
+                new_entry = False
+                if student_id is not None and track.student_id != student_id:
+                    track.student_id = student_id
+                    student_key = (str(school_id), student_id)
+                    last = self._last_entry.get(student_key)
+                    if last is None or now - last >= self.cooldown_seconds:
+                        self._last_entry[student_key] = now
+                        new_entry = True
+                        self.entries += 1
+                    else:
+                        self.suppressed += 1
+                elif student_id is not None:
+                    self.suppressed += 1
+                decisions.append((track.id, new_entry))
+
+            self._prune(now)
+            return decisions
+
+    def _prune(self, now):
+        """Esquece cooldowns vencidos e câmeras paradas (chamado com o lock, no máximo 1x/min)."""
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        self._last_entry = {k: t for k, t in self._last_entry.items() if now - t < self.cooldown_seconds}
+        self._trackers = {
+            k: tracker for k, tracker in self._trackers.items()
+            if any(now - t.last_seen <= tracker.max_idle for t in tracker.tracks)
+        }
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'entries': self.entries,
+                'suppressed': self.suppressed,
+                'cameras': len(self._trackers),
+                'students_in_cooldown': sum(1 for t in self._last_entry.values() if now - t < self.cooldown_seconds),
+                'cooldown_seconds': self.cooldown_seconds,
+            }
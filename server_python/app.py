@@ -1,7 +1,8 @@
 from flask import Flask, send_from_directory, jsonify, request
 from flask_cors import CORS
 import os
-from database import init_system_db
+from database import init_system_db, init_app as init_db_app
+from presence import warm_presence
 from routes.auth import auth_bp
 from routes.school import school_bp
 from routes.attendance import attendance_bp
@@ -30,6 +31,12 @@ def health_check():
 with app.app_context():
     init_system_db()
 
+# Devolver conexões das escolas ao pool no fim de cada requisição
+init_db_app(app)
+
+# Mapa de presença (quem está na escola agora) montado em segundo plano
+warm_presence()
+
 # Registrar Blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(attendance_bp)
@@ -0,0 +1,287 @@
+"""
+Modo ASGI: streams SSE do responsável em asyncio, resto do app em Flask.
+
+Cada aba do PWA aberta segura uma conexão SSE o dia todo; no gunicorn
+síncrono isso ocupa uma thread por conexão. Aqui as rotas de stream (as duas
+do responsável e a de presença das telas da escola) rodam no event loop (conexão ociosa = uma corrotina parada na fila) e só o
+acesso ao SQLite vai para o pool de threads. Qualquer outra rota segue para
+o app Flask via WsgiToAsgi.
+
+Rodar com:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker   (vários workers: NOTIFICATION_BROKER=sqlite)
+"""
+import asyncio
+import json
+import queue
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from notifications import hub, guardian_channel, SUBSCRIBER_QUEUE_SIZE
+from presence import get_presence, RESYNC
+from routes.school import PRESENCE_KEEPALIVE_SECONDS, presence_sse, presence_stream_school_id
+from routes.guardian import (
+    EVENTS_RECHECK_SECONDS,
+    SSE_KEEPALIVE_SECONDS,
+    GuardianEventsView,
+    NotificationCursor,
+    _sse_notification,
+    _stream_channels,
+    _stream_guardian_id,
+)
+
+class AsyncInbox:
+    """Fila asyncio que o broker alimenta de qualquer thread (mesma interface de put_nowait)."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put_nowait(self, message):
+        if self._queue.full():
+            raise queue.Full
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+async def _send_json(send, status, payload):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*')],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
+
+
+async def _deliver(cursor, notifications, write):
+    for n in notifications:
+        await write(_sse_notification(n, cursor.advance(n)).encode())
+        await asyncio.to_thread(cursor.save, n)
+
+
+async def _notifications_stream(guardian_id, last_event_id, write):
+    """Mesmo fluxo de routes.guardian.events()."""
+    await write(_sse({'type': 'connected'}))
+
+    channel = guardian_channel(guardian_id)
+    inbox = AsyncInbox(asyncio.get_running_loop())
+    hub.subscribe(channel, inbox)
+    try:
+        cursor = await asyncio.to_thread(NotificationCursor, guardian_id, last_event_id)
+        await _deliver(cursor, await asyncio.to_thread(cursor.pending), write)
+
+        while True:
+            try:
+                msg = await inbox.get(SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await write(b": keepalive\n\n")
+                continue
+
+            await _deliver(cursor, await asyncio.to_thread(cursor.on_message, msg['data']), write)
+    finally:
+        hub.unsubscribe(channel, inbox)
+
+
+async def _events_stream(guardian_id, last_event_id, write):
+    """Mesmo fluxo de routes.guardian.events_stream()."""
+    loop = asyncio.get_running_loop()
+    channels = await asyncio.to_thread(_stream_channels, guardian_id)
+    inbox = AsyncInbox(loop)
+    for channel in channels:
+        hub.subscribe(channel, inbox)
+    try:
+        await write(_sse({'type': 'connected'}))
+
+        cursor = await asyncio.to_thread(NotificationCursor, guardian_id, last_event_id)
+        await _deliver(cursor, await asyncio.to_thread(cursor.pending), write)
+
+        view = await asyncio.to_thread(GuardianEventsView, guardian_id)
+        try:
+            try:
+                await write(_sse({'type': 'events', 'data': await asyncio.to_thread(view.snapshot)}))
+            except Exception as e:
+                print(f"Erro no SSE de eventos: {e}")
+
+            last_check = loop.time()
+            while True:
+                changed_school = None
+                deadline = loop.time() + SSE_KEEPALIVE_SECONDS
+                while True:
+                    try:
+                        msg = await inbox.get(max(deadline - loop.time(), 0))
+                    except asyncio.TimeoutError:
+                        break
+                    if msg['type'] == 'events_changed':
+                        changed_school = msg['school_id']
+                        break
+                    await _deliver(cursor, await asyncio.to_thread(cursor.on_message, msg['data']), write)
+
+                if changed_school is not None:
+                    school_ids = [changed_school]
+                elif not hub.available and loop.time() - last_check >= EVENTS_RECHECK_SECONDS:
+                    school_ids = None
+                else:
+                    await write(b": keepalive\n\n")
+                    continue
+                last_check = loop.time()
+                try:
+                    delta = await asyncio.to_thread(view.refresh, school_ids)
+                    if delta:
+                        await write(_sse({'type': 'events_delta', 'data': delta}))
+                except Exception as e:
+                    print(f"Erro no SSE de eventos: {e}")
+        finally:
+            view.close()
+    finally:
+        for channel in channels:
+            hub.unsubscribe(channel, inbox)
+
+
+async def _presence_stream(presence, class_name, write):
+    """Mesmo fluxo de routes.school.school_presence_stream()."""
+    inbox = presence.subscribe(AsyncInbox(asyncio.get_running_loop()))
+    try:
+        await write((await asyncio.to_thread(presence_sse, presence, RESYNC, class_name)).encode())
+        while True:
+            try:
+                msg = await inbox.get(PRESENCE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(presence.check_day)
+                if not presence.take_resync(inbox):
+                    await write(b": keepalive\n\n")
+                    continue
+                msg = RESYNC
+            # RESYNC relê o snapshot (pode remontar o mapa); delta é só formatação
+            if msg is RESYNC or msg['type'] == 'resync':
+                event = await asyncio.to_thread(presence_sse, presence, msg, class_name)
+            else:
+                event = presence_sse(presence, msg, class_name)
+            if event:
+                await write(event.encode())
+    finally:
+        presence.unsubscribe(inbox)
+
+
+STREAMS = {
+    '/api/guardian/events': _notifications_stream,
+    '/api/guardian/events-stream': _events_stream,
+}
+
+# Stream das telas da escola: token de escola em vez de responsável (_serve_presence_stream)
+PRESENCE_STREAM_PATH = '/api/school/presence/stream'
+
+
+def _request_token(params, headers):
+    token = params.get('token', [None])[0]
+    if not token:
+        auth = headers.get(b'authorization', b'').decode()
+        if ' ' in auth:
+            token = auth.split(' ')[1]
+    return token
+
+
+async def _stream_response(receive, send, run):
+    """Responde 200 text/event-stream e roda run(write) até o fim ou até o cliente desconectar."""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+
+    async def write(chunk):
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    # O servidor não avisa a desconexão no send(); fica ouvindo o receive()
+    async def wait_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    producer = asyncio.ensure_future(run(write))
+    watcher = asyncio.ensure_future(wait_disconnect())
+    try:
+        done, _ = await asyncio.wait({producer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if producer in done:
+            producer.result()
+    finally:
+        for task in (producer, watcher):
+            task.cancel()
+        # Espera o finally do stream (unsubscribe) antes de devolver ao servidor
+        await asyncio.gather(producer, watcher, return_exceptions=True)
+
+
+async def _serve_stream(scope, receive, send, stream):
+    params = parse_qs(scope.get('query_string', b'').decode())
+    headers = dict(scope['headers'])
+    token = _request_token(params, headers)
+    if not token:
+        return await _send_json(send, 401, {'message': 'Token missing'})
+
+    guardian_id = _stream_guardian_id(token)
+    if guardian_id is None:
+        return await _send_json(send, 403, {'message': 'Invalid token'})
+
+    last_event_id = headers.get(b'last-event-id', b'').decode() or params.get('lastEventId', [None])[0]
+    await _stream_response(receive, send, lambda write: stream(guardian_id, last_event_id, write))
+
+
+async def _serve_presence_stream(scope, receive, send):
+    params = parse_qs(scope.get('query_string', b'').decode())
+    token = _request_token(params, dict(scope['headers']))
+    if not token:
+        return await _send_json(send, 401, {'message': 'Token ausente'})
+
+    school_id, error = await asyncio.to_thread(presence_stream_school_id, token, params.get('school_id', [None])[0])
+    if error:
+        return await _send_json(send, *error)
+
+    presence = await asyncio.to_thread(get_presence, school_id)
+    class_name = params.get('class_name', [None])[0]
+    await _stream_response(receive, send, lambda write: _presence_stream(presence, class_name, write))
+
+
+class StreamingApp:
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return await self.fallback(scope, receive, send)
+        if scope.get('path') == PRESENCE_STREAM_PATH:
+            return await _serve_presence_stream(scope, receive, send)
+        stream = STREAMS.get(scope.get('path'))
+        if stream is None:
+            return await self.fallback(scope, receive, send)
+        await _serve_stream(scope, receive, send, stream)
+
+    async def _lifespan(self, receive, send):
+        # Flask não tem startup/shutdown; só confirma para o servidor
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = StreamingApp(WsgiToAsgi(flask_app))
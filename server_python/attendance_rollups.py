@@ -0,0 +1,176 @@
+"""
+Resumos diários de frequência, mantidos junto com as gravações de presença.
+
+    attendance_daily        um registro por aluno por dia: primeira entrada,
+                            última saída (ts, epoch ms) e se esteve presente
+    attendance_class_daily  um registro por turma por dia letivo (dia com algum
+                            registro na escola): matriculados (alunos da turma
+                            no momento) e presentes; ausentes = matriculados -
+                            presentes, inclusive turma sem nenhum presente
+
+Os resumos são mantidos por triggers em access_logs (rollup_trigger_sql,
+migração 13), então toda entrada/saída conta, grave quem gravar: rotas do
+Python, servidor Node, serviço de câmeras ou scripts avulsos. O trigger roda
+na mesma transação do INSERT; o calendário do responsável e o painel por turma
+leem poucas linhas em vez de varrer o log bruto do mês.
+
+O dia é o local_date do evento (dia no fuso da escola, ver timestamps.py).
+Para recalcular a partir do histórico (access_logs):
+    python attendance_rollups.py                       # todas as escolas
+    python attendance_rollups.py --school 14 --since 2026-01-01
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ROLLUP_EVENTS = ('arrival', 'departure')
+
+
+# Corpo dos triggers: NEW é a linha de access_logs já com ts e local_date
+_ROLLUP_BODY = '''
+            -- Primeiro evento da escola no dia: uma linha por turma com presentes = 0
+            -- (senão a turma em que ninguém chegou sumiria do resumo)
+            INSERT OR IGNORE INTO attendance_class_daily (class_name, day, enrolled, present)
+            SELECT class_name, NEW.local_date, COUNT(*), 0 FROM students
+            WHERE class_name IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM attendance_class_daily WHERE day = NEW.local_date)
+            GROUP BY class_name;
+
+            -- Turma só conta a primeira entrada do aluno no dia
+            INSERT INTO attendance_class_daily (class_name, day, enrolled, present)
+            SELECT c.class_name, NEW.local_date,
+                   (SELECT COUNT(*) FROM students WHERE class_name = c.class_name), 1
+            FROM (SELECT COALESCE(
+                    (SELECT class_name FROM attendance_daily WHERE student_id = NEW.student_id AND day = NEW.local_date),
+                    (SELECT class_name FROM students WHERE id = NEW.student_id)) AS class_name) c
+            WHERE NEW.event_type = 'arrival' AND c.class_name IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM attendance_daily
+                              WHERE student_id = NEW.student_id AND day = NEW.local_date AND present)
+            ON CONFLICT(class_name, day) DO UPDATE SET
+                present = present + 1,
+                enrolled = excluded.enrolled;
+
+            INSERT INTO attendance_daily (student_id, day, class_name, first_arrival, last_departure, present)
+            VALUES (NEW.student_id, NEW.local_date,
+                    (SELECT class_name FROM students WHERE id = NEW.student_id),
+                    CASE WHEN NEW.event_type = 'arrival' THEN NEW.ts END,
+                    CASE WHEN NEW.event_type = 'departure' THEN NEW.ts END,
+                    NEW.event_type = 'arrival')
+            ON CONFLICT(student_id, day) DO UPDATE SET
+                first_arrival = MIN(COALESCE(first_arrival, excluded.first_arrival),
+                                    COALESCE(excluded.first_arrival, first_arrival)),
+                last_departure = MAX(COALESCE(last_departure, excluded.last_departure),
+                                     COALESCE(excluded.last_departure, last_departure)),
+                present = MAX(present, excluded.present);
+'''
+
+_ROLLUP_WHEN = '''NEW.local_date IS NOT NULL AND NEW.ts IS NOT NULL AND NEW.student_id IS NOT NULL
+            AND NEW.event_type IN ('arrival', 'departure')'''
+
+ROLLUP_TRIGGERS = ('trg_access_logs_rollup', 'trg_access_logs_rollup_derived')
+
+
+def rollup_trigger_sql():
+    """Triggers que aplicam cada entrada/saída de access_logs aos resumos.
+
+    Um dispara no INSERT que já traz local_date (rotas do Python); o outro
+    quando o trigger de horário (migrations.timestamp_trigger_sql) preenche
+    local_date de quem gravou só timestamp (Node, scripts).
+    """
+    return [
+        f'''CREATE TRIGGER trg_access_logs_rollup AFTER INSERT ON access_logs
+        WHEN {_ROLLUP_WHEN}
+        BEGIN{_ROLLUP_BODY}        END''',
+        f'''CREATE TRIGGER trg_access_logs_rollup_derived AFTER UPDATE OF local_date ON access_logs
+        WHEN OLD.local_date IS NULL AND {_ROLLUP_WHEN}
+        BEGIN{_ROLLUP_BODY}        END''',
+    ]
+
+
+def create_rollup_triggers(cur):
+    for name in ROLLUP_TRIGGERS:
+        cur.execute(f'DROP TRIGGER IF EXISTS {name}')
+    for sql in rollup_trigger_sql():
+        cur.execute(sql)
+
+
+def rebuild_rollups(conn, since=None):
+    """Recalcula os resumos a partir de access_logs (todos, ou a partir do dia local `since`)."""
+    day_filter, params = ('AND day >= ?', (since,)) if since else ('', ())
+    conn.execute(f'DELETE FROM attendance_daily WHERE 1=1 {day_filter}', params)
+    conn.execute(f'DELETE FROM attendance_class_daily WHERE 1=1 {day_filter}', params)
+    conn.execute(f'''
+        INSERT INTO attendance_daily (student_id, day, class_name, first_arrival, last_departure, present)
+        SELECT al.student_id, al.local_date, s.class_name,
+               MIN(CASE WHEN al.event_type = 'arrival' THEN al.ts END),
+               MAX(CASE WHEN al.event_type = 'departure' THEN al.ts END),
+               MAX(al.event_type = 'arrival')
+        FROM access_logs al
+        LEFT JOIN students s ON s.id = al.student_id
+        WHERE al.event_type IN ('arrival', 'departure') AND al.student_id IS NOT NULL
+          AND al.local_date IS NOT NULL {'AND al.local_date >= ?' if since else ''}
+        GROUP BY al.student_id, al.local_date
+    ''', params)
+    conn.execute(f'''
+        INSERT INTO attendance_class_daily (class_name, day, enrolled, present)
+        SELECT d.class_name, d.day,
+               (SELECT COUNT(*) FROM students s WHERE s.class_name = d.class_name),
+               SUM(d.present)
+        FROM attendance_daily d
+        WHERE d.class_name IS NOT NULL {day_filter}
+        GROUP BY d.class_name, d.day
+    ''', params)
+    # Turmas sem ninguém presente nos dias com registro (ver _ROLLUP_BODY)
+    conn.execute(f'''
+        INSERT OR IGNORE INTO attendance_class_daily (class_name, day, enrolled, present)
+        SELECT c.class_name, d.day, c.enrolled, 0
+        FROM (SELECT DISTINCT day FROM attendance_daily WHERE 1=1 {day_filter}) d
+        CROSS JOIN (SELECT class_name, COUNT(*) AS enrolled FROM students
+                    WHERE class_name IS NOT NULL GROUP BY class_name) c
+    ''', params)
+
+
+def _rebuild_file(db_path, since):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        from migrations import migrate_school_db
+        migrate_school_db(conn)
+        with conn:
+            rebuild_rollups(conn, since)
+        return conn.execute('SELECT COUNT(*) FROM attendance_daily').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    from database import DB_DIR
+
+    parser = argparse.ArgumentParser(description='Recalcula attendance_daily/attendance_class_daily a partir de access_logs')
+    parser.add_argument('--school', help='só esta escola (id)')
+    parser.add_argument('--since', help='só a partir deste dia (YYYY-MM-DD)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args(argv)
+
+    if args.school:
+        paths = [os.path.join(DB_DIR, f'school_{args.school}.db')]
+    else:
+        paths = sorted(glob.glob(os.path.join(DB_DIR, 'school_*.db')))
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(_rebuild_file, path, args.since): path for path in paths if os.path.exists(path)}
+        for future in as_completed(futures):
+            name = os.path.basename(futures[future])
+            try:
+                print(f"✅ {name}: {future.result()} aluno-dia(s)")
+            except Exception as e:
+                failures += 1
+                print(f"❌ {name}: {e}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
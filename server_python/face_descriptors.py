@@ -0,0 +1,220 @@
+"""
+Formato binário dos descritores faciais (students.face_descriptor,
+employees.face_descriptor e face_descriptors.descriptor).
+
+Em JSON um descritor de 512 floats ocupa ~10 KB de texto e custa um
+json.loads a cada leitura; em BLOB são 2 KB (float32) ou 1 KB (float16).
+
+Layout: cabeçalho '<2sBBH' (b'FD', versão do formato, tipo 1=float32 /
+2=float16, dimensão) seguido dos valores em little-endian. A mesma leitura é
+feita no serviço de reconhecimento (facial-recognition/db_loader.py).
+
+A leitura aceita os dois formatos (BLOB ou o JSON antigo), então linhas ainda
+não convertidas continuam funcionando. Para o frontend os descritores saem
+sempre como texto JSON, como antes (descriptor_json / serialize_face_fields).
+
+O servidor Node (server/) abre os mesmos school_*.db e faz JSON.parse nessas
+colunas, então o BLOB é opcional: FACE_DESCRIPTOR_STORAGE=binary grava em
+BLOB (padrão: json) e a conversão das linhas existentes é um comando explícito,
+só para quando o Node não estiver mais em uso:
+    python face_descriptors.py --to binary [--school 14]
+    python face_descriptors.py --to json               # volta para JSON
+"""
+import argparse
+import glob
+import sqlite3
+import sys
+import base64
+import json
+import math
+import os
+import struct
+
+MAGIC = b'FD'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<2sBBH')
+DTYPES = {'float32': (1, 'f'), 'float16': (2, 'e')}
+_FORMATS = {code: fmt for code, fmt in DTYPES.values()}
+_DIGITS = {'f': 9, 'e': 5}  # dígitos suficientes para reler o mesmo valor
+
+# float16 reduz pela metade, com perda de precisão irrelevante para similaridade de cosseno
+STORAGE_DTYPE = os.environ.get('FACE_DESCRIPTOR_DTYPE', 'float32')
+
+# json (padrão, compatível com o servidor Node) ou binary
+STORAGE_FORMAT = os.environ.get('FACE_DESCRIPTOR_STORAGE', 'json')
+
+# (tabela, coluna do descritor)
+FACE_DESCRIPTOR_COLUMNS = (
+    ('students', 'face_descriptor'),
+    ('employees', 'face_descriptor'),
+    ('face_descriptors', 'descriptor'),
+)
+
+FACE_FIELDS = ('face_descriptor', 'descriptor')
+
+
+def is_encoded(value):
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:2]) == MAGIC
+
+
+def _unpack(blob):
+    """BLOB -> (formato struct, valores). ValueError se o cabeçalho ou o tamanho não baterem."""
+    blob = bytes(blob)
+    if len(blob) < HEADER.size:
+        raise ValueError('descritor binário truncado')
+    magic, version, code, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != FORMAT_VERSION or code not in _FORMATS:
+        raise ValueError('cabeçalho de descritor desconhecido')
+    fmt = _FORMATS[code]
+    body = struct.Struct(f'<{dim}{fmt}')
+    if len(blob) != HEADER.size + body.size:
+        raise ValueError('tamanho do descritor não confere com a dimensão')
+    return fmt, body.unpack_from(blob, HEADER.size)
+
+
+def _values(value):
+    """Lista, texto JSON ("[...]" ou {"0": ...} do Float32Array) ou BLOB -> lista de floats."""
+    if is_encoded(value):
+        return list(_unpack(value)[1])
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value).decode('utf-8')
+    if isinstance(value, str):
+        value = json.loads(value)
+    if isinstance(value, dict):
+        value = [value[k] for k in sorted(value, key=int)]
+    if not isinstance(value, (list, tuple)):
+        raise ValueError('descritor facial deve ser uma lista de números')
+    return [float(v) for v in value]
+
+
+def encode_descriptor(value, dtype=None):
+    """Descritor em qualquer formato aceito -> BLOB (None se vazio). ValueError se inválido."""
+    if value is None or value == '' or value == []:
+        return None
+    dtype = dtype or STORAGE_DTYPE
+    if dtype not in DTYPES:
+        raise ValueError(f'tipo de descritor desconhecido: {dtype}')
+    code, fmt = DTYPES[dtype]
+    if is_encoded(value):
+        blob = bytes(value)
+        if blob[3] == code:
+            _unpack(blob)  # valida
+            return blob
+    try:
+        values = _values(value)
+    except (TypeError, KeyError) as e:
+        raise ValueError(f'descritor facial inválido: {e}') from e
+    if not values or len(values) > 0xFFFF or not all(math.isfinite(v) for v in values):
+        raise ValueError('descritor facial inválido')
+    return HEADER.pack(MAGIC, FORMAT_VERSION, code, len(values)) + struct.pack(f'<{len(values)}{fmt}', *values)
+
+
+def store_descriptor(value, storage=None):
+    """Descritor recebido -> valor para gravar no banco, no formato de FACE_DESCRIPTOR_STORAGE.
+
+    'json' grava texto "[...]" (o que o Node lê), 'binary' o BLOB. None se vazio;
+    ValueError se inválido (nos dois casos).
+    """
+    blob = encode_descriptor(value)  # valida nos dois formatos
+    if blob is None or (storage or STORAGE_FORMAT) == 'binary':
+        return blob
+    if is_encoded(value):
+        return descriptor_json(blob)
+    # JSON com a precisão recebida, como era gravado antes
+    return json.dumps(_values(value), separators=(',', ':'))
+
+
+def decode_descriptor(value):
+    """BLOB ou JSON -> lista de floats (None se vazio ou ilegível)."""
+    if not value:
+        return None
+    try:
+        return _values(value)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def descriptor_json(value):
+    """Descritor armazenado -> texto JSON, o formato que o frontend sempre recebeu."""
+    if not is_encoded(value):
+        return value
+    try:
+        fmt, values = _unpack(value)
+    except ValueError:
+        return None
+    digits = _DIGITS[fmt]
+    return '[' + ','.join(f'{v:.{digits}g}' for v in values) + ']'
+
+
+def descriptor_base64(value):
+    """Descritor armazenado -> BLOB em base64 (JSON antigo é convertido; None se inválido)."""
+    try:
+        blob = encode_descriptor(value)
+    except ValueError:
+        return None
+    return base64.b64encode(blob).decode('ascii') if blob else None
+
+
+def serialize_face_fields(row):
+    """dict de uma linha (students/employees/face_descriptors) pronto para jsonify."""
+    for field in FACE_FIELDS:
+        if field in row:
+            row[field] = descriptor_json(row[field])
+    return row
+
+
+def convert_descriptors(conn, storage):
+    """Regrava os descritores de um banco de escola em 'binary' ou 'json'. Retorna quantas linhas mudaram."""
+    changed = 0
+    for table, column in FACE_DESCRIPTOR_COLUMNS:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is None:
+            continue
+        source_type = 'text' if storage == 'binary' else 'blob'
+        rows = conn.execute(f'SELECT rowid, {column} FROM {table} WHERE typeof({column}) = ?',
+                            (source_type,)).fetchall()
+        converted = []
+        for rowid, descriptor in rows:
+            if not descriptor:
+                continue
+            try:
+                converted.append((store_descriptor(descriptor, storage), rowid))
+            except ValueError:
+                pass  # descritor corrompido fica como está (a leitura ignora)
+        conn.executemany(f'UPDATE {table} SET {column} = ? WHERE rowid = ?', converted)
+        changed += len(converted)
+    return changed
+
+
+def main(argv=None):
+    from database import DB_DIR
+
+    parser = argparse.ArgumentParser(description='Converte os descritores faciais dos school_*.db entre JSON e BLOB')
+    parser.add_argument('--to', choices=('binary', 'json'), required=True)
+    parser.add_argument('--school', help='só esta escola (id)')
+    args = parser.parse_args(argv)
+
+    if args.to == 'binary':
+        print("⚠️ O servidor Node não lê descritores em BLOB; converta só se ele não usa mais estes bancos")
+    paths = ([os.path.join(DB_DIR, f'school_{args.school}.db')] if args.school
+             else sorted(glob.glob(os.path.join(DB_DIR, 'school_*.db'))))
+    failures = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            with conn:
+                changed = convert_descriptors(conn, args.to)
+            print(f"✅ {os.path.basename(path)}: {changed} descritor(es) em {args.to}")
+        except sqlite3.Error as e:
+            failures += 1
+            print(f"❌ {os.path.basename(path)}: {e}")
+        finally:
+            conn.close()
+    if args.to == 'binary' and STORAGE_FORMAT != 'binary':
+        print("ℹ️ Defina FACE_DESCRIPTOR_STORAGE=binary para as novas gravações também saírem em BLOB")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Ressincroniza o diretório guardian_school_links (system.db) com a tabela
+student_guardians de cada school_*.db.
+
+As rotas do responsável só abrem as escolas listadas no diretório, então todo
+código que grava ou apaga em student_guardians precisa chamar
+link_guardian_school / unlink_student (routes/guardian_helpers.py). Hoje fazem
+isso create_student, delete_student (routes/school.py) e link_student
+(routes/guardian.py).
+
+O servidor Node (server/server.js, server/endpoints_guardian.js) e os scripts
+avulsos (create_guardian.py, fix_student_link.py, setup_test_data.py...) não
+chamam: depois deles, rode este comando (pode rodar quantas vezes quiser).
+Responsável sem nenhum vínculo no diretório também é recuperado sozinho na
+primeira requisição (get_guardian_schools), mas vínculo a mais numa escola
+nova só aparece pelo comando.
+
+    python guardian_links.py                  # todas as escolas
+    python guardian_links.py --school 14      # só uma
+    python guardian_links.py --prune          # também remove vínculos que não existem mais
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+
+
+def _school_links(path):
+    """{(guardian_id, student_id)} de student_guardians do banco da escola (somente leitura)."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'student_guardians'").fetchone() is None:
+            return set()
+        return set(conn.execute('''
+            SELECT DISTINCT guardian_id, student_id FROM student_guardians
+            WHERE guardian_id IS NOT NULL AND student_id IS NOT NULL
+        ''').fetchall())
+    finally:
+        conn.close()
+
+
+def resync_guardian_links(sys_db, db_dir, school_ids=None, prune=False):
+    """Acrescenta (e com prune, remove) vínculos para bater com student_guardians. Retorna (adicionados, removidos)."""
+    added = removed = 0
+    for path in sorted(glob.glob(os.path.join(db_dir, 'school_*.db'))):
+        school_id = os.path.basename(path)[len('school_'):-len('.db')]
+        if not school_id.isdigit() or (school_ids and school_id not in school_ids):
+            continue
+        school_id = int(school_id)
+        links = _school_links(path)
+        current = set(sys_db.execute(
+            'SELECT guardian_id, student_id FROM guardian_school_links WHERE school_id = ?', (school_id,)
+        ).fetchall())
+
+        missing = links - current
+        sys_db.executemany(
+            'INSERT OR IGNORE INTO guardian_school_links (guardian_id, school_id, student_id) VALUES (?, ?, ?)',
+            [(guardian_id, school_id, student_id) for guardian_id, student_id in missing]
+        )
+        added += len(missing)
+        if prune:
+            stale = current - links
+            sys_db.executemany(
+                'DELETE FROM guardian_school_links WHERE guardian_id = ? AND school_id = ? AND student_id = ?',
+                [(guardian_id, school_id, student_id) for guardian_id, student_id in stale]
+            )
+            removed += len(stale)
+    return added, removed
+
+
+def main(argv=None):
+    from database import DB_DIR, SYSTEM_DB_PATH
+    from migrations import SYSTEM_MIGRATIONS, apply_migrations
+
+    parser = argparse.ArgumentParser(description='Ressincroniza guardian_school_links com student_guardians das escolas')
+    parser.add_argument('--school', action='append', help='só esta escola (id); pode repetir')
+    parser.add_argument('--prune', action='store_true', help='remove vínculos que não existem mais nas escolas')
+    args = parser.parse_args(argv)
+
+    sys_db = sqlite3.connect(SYSTEM_DB_PATH, timeout=30)
+    try:
+        apply_migrations(sys_db, SYSTEM_MIGRATIONS)
+        with sys_db:
+            added, removed = resync_guardian_links(sys_db, DB_DIR, set(args.school or ()), args.prune)
+    finally:
+        sys_db.close()
+    print(f"✅ guardian_school_links: {added} vínculo(s) adicionado(s), {removed} removido(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
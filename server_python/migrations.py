@@ -0,0 +1,1017 @@
+"""
+Migrações versionadas dos bancos SQLite (system.db e school_*.db).
+
+Cada arquivo guarda a última migração aplicada em PRAGMA user_version, então
+abrir um banco já atualizado custa uma única leitura de PRAGMA.
+
+Uso (a partir de server_python/):
+    python migrations.py               # atualiza system.db e todos os school_*.db
+    python migrations.py --workers 8   # quantidade de bancos migrados em paralelo
+    python migrations.py --status      # só mostra a versão de cada arquivo
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+SYSTEM_MIGRATIONS = []
+SCHOOL_MIGRATIONS = []
+
+
+def system_migration(version, description):
+    def register(fn):
+        SYSTEM_MIGRATIONS.append((version, description, fn))
+        SYSTEM_MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def school_migration(version, description):
+    def register(fn):
+        SCHOOL_MIGRATIONS.append((version, description, fn))
+        SCHOOL_MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def get_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version(migrations):
+    return migrations[-1][0] if migrations else 0
+
+
+def table_exists(cur, table):
+    return cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def add_column(cur, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN apenas se a tabela existir e a coluna ainda não."""
+    if not table_exists(cur, table):
+        return
+    columns = [row[1] for row in cur.execute(f'PRAGMA table_info({table})').fetchall()]
+    if column not in columns:
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def create_index(cur, name, table, columns):
+    """CREATE INDEX apenas se a tabela e todas as colunas existirem (bancos antigos divergem)."""
+    if not table_exists(cur, table):
+        return
+    existing = {row[1] for row in cur.execute(f'PRAGMA table_info({table})').fetchall()}
+    if not set(columns) <= existing:
+        return
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table}({", ".join(columns)})')
+
+
+def apply_migrations(conn, migrations):
+    """Aplica as migrações pendentes, cada uma em sua própria transação.
+
+    BEGIN IMMEDIATE serializa processos que migram o mesmo arquivo ao mesmo
+    tempo (ex.: vários workers do gunicorn); a versão é relida já com o lock.
+    """
+    if get_version(conn) >= latest_version(migrations):
+        return get_version(conn)
+
+    if conn.in_transaction:
+        conn.commit()
+
+    for version, description, fn in migrations:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            fn(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return get_version(conn)
+
+
+def migrate_system_db(conn):
+    return apply_migrations(conn, SYSTEM_MIGRATIONS)
+
+
+def migrate_school_db(conn):
+    version = apply_migrations(conn, SCHOOL_MIGRATIONS)
+    sync_school_timezone(conn)
+    return version
+
+
+# ====== SYSTEM.DB ======
+
+@system_migration(1, 'esquema base')
+def _system_base(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS super_admins (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE,
+        password TEXT
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS schools (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        admin_name TEXT,
+        email TEXT UNIQUE,
+        password TEXT,
+        cnpj TEXT,
+        address TEXT,
+        latitude REAL,
+        longitude REAL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS teachers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        email TEXT UNIQUE,
+        password TEXT,
+        subject TEXT,
+        school_id INTEGER,
+        status TEXT DEFAULT 'pending',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS guardians (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        email TEXT UNIQUE,
+        password TEXT,
+        phone TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS technicians (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        email TEXT UNIQUE,
+        password TEXT,
+        phone TEXT
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS inspectors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        school_id INTEGER,
+        name TEXT,
+        email TEXT UNIQUE,
+        password TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS representatives (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        email TEXT UNIQUE,
+        password TEXT,
+        commission_rate REAL
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS cameras (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        school_id INTEGER,
+        camera_name TEXT,
+        camera_purpose TEXT,
+        camera_ip TEXT,
+        camera_url TEXT,
+        camera_port TEXT,
+        camera_username TEXT,
+        camera_password TEXT,
+        notes TEXT,
+        status TEXT DEFAULT 'active'
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS support_tickets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        user_type TEXT,
+        user_id INTEGER,
+        status TEXT DEFAULT 'open',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS support_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ticket_id INTEGER,
+        school_id INTEGER,
+        user_type TEXT,
+        user_id INTEGER,
+        message TEXT,
+        timestamp DATETIME,
+        is_internal INTEGER DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(ticket_id) REFERENCES support_tickets(id)
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS camera_removal_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        camera_id INTEGER,
+        school_id INTEGER,
+        requester_type TEXT,
+        reason TEXT,
+        status TEXT DEFAULT 'pending',
+        requested_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS whatsapp_notifications (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        school_id INTEGER,
+        student_id INTEGER,
+        phone TEXT,
+        message_type TEXT,
+        sent_at DATETIME,
+        status TEXT
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS school_affiliates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parent_school_id INTEGER,
+        affiliate_school_id INTEGER,
+        token TEXT UNIQUE,
+        status TEXT DEFAULT 'active',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(parent_school_id) REFERENCES schools(id),
+        FOREIGN KEY(affiliate_school_id) REFERENCES schools(id)
+    )''')
+
+    add_column(cur, 'schools', 'cnpj', 'TEXT')
+
+
+@system_migration(2, 'colunas dos scripts avulsos (update_saas_schema, update_employee_table, add_address_columns)')
+def _system_loose_columns(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS system_settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )''')
+    cur.execute("INSERT OR IGNORE INTO system_settings (key, value) VALUES ('saas_default_price', '6.50')")
+
+    add_column(cur, 'schools', 'custom_price', 'REAL')
+    add_column(cur, 'schools', 'latitude', 'REAL')
+    add_column(cur, 'schools', 'longitude', 'REAL')
+    add_column(cur, 'schools', 'address', 'TEXT')
+    add_column(cur, 'schools', 'number', 'TEXT')
+    add_column(cur, 'schools', 'zip_code', 'TEXT')
+
+    add_column(cur, 'guardians', 'role', "TEXT DEFAULT 'guardian'")
+
+    add_column(cur, 'support_tickets', 'priority', "TEXT DEFAULT 'normal'")
+    add_column(cur, 'support_tickets', 'category', "TEXT DEFAULT 'geral'")
+    add_column(cur, 'support_messages', 'school_id', 'INTEGER')
+    add_column(cur, 'support_messages', 'timestamp', 'DATETIME')
+
+
+@system_migration(3, 'diretório guardian_school_links (responsável -> escolas dos filhos)')
+def _system_guardian_school_links(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS guardian_school_links (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guardian_id INTEGER NOT NULL,
+        school_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        linked_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(guardian_id, school_id, student_id)
+    )''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_guardian_school_links_student ON guardian_school_links(school_id, student_id)')
+
+    # Popular a partir dos vínculos já existentes em cada school_*.db (guardian_links.py)
+    db_path = cur.execute('PRAGMA database_list').fetchone()[2]
+    if db_path:
+        from guardian_links import resync_guardian_links
+        resync_guardian_links(cur, os.path.dirname(db_path))
+
+
+@system_migration(4, 'cursores de entrega de notificações (substituem access_logs.notified_guardian)')
+def _system_notification_cursors(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS guardian_notification_cursors (
+        guardian_id INTEGER NOT NULL,
+        school_id INTEGER NOT NULL,
+        last_log_id INTEGER NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (guardian_id, school_id)
+    )''')
+
+    db_path = cur.execute('PRAGMA database_list').fetchone()[2]
+    if db_path:
+        backfill_notification_cursors(cur, os.path.dirname(db_path))
+
+
+def backfill_notification_cursors(cur, db_dir):
+    """Cursor inicial = logo antes do primeiro access_log ainda não notificado
+    do responsável (ou o último da escola), para não reenviar nem perder nada."""
+    links = cur.execute('SELECT DISTINCT guardian_id, school_id FROM guardian_school_links').fetchall()
+    by_school = {}
+    for guardian_id, school_id in links:
+        by_school.setdefault(school_id, []).append(guardian_id)
+
+    for school_id, guardian_ids in by_school.items():
+        path = os.path.join(db_dir, f'school_{school_id}.db')
+        if not os.path.exists(path):
+            continue
+        school_conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            if not table_exists(school_conn, 'access_logs'):
+                continue
+            last_id = school_conn.execute('SELECT COALESCE(MAX(id), 0) FROM access_logs').fetchone()[0]
+            rows = []
+            for guardian_id in guardian_ids:
+                first_pending = school_conn.execute('''
+                    SELECT MIN(al.id) FROM access_logs al
+                    JOIN student_guardians sg ON sg.student_id = al.student_id
+                    WHERE sg.guardian_id = ? AND al.notified_guardian = 0
+                ''', (guardian_id,)).fetchone()[0]
+                rows.append((guardian_id, school_id, first_pending - 1 if first_pending else last_id))
+        finally:
+            school_conn.close()
+        cur.executemany(
+            'INSERT OR IGNORE INTO guardian_notification_cursors (guardian_id, school_id, last_log_id) VALUES (?, ?, ?)',
+            rows
+        )
+
+
+# ====== SCHOOL_*.DB ======
+
+@school_migration(1, 'esquema base')
+def _school_base(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        parent_email TEXT,
+        phone TEXT,
+        photo_url TEXT,
+        class_name TEXT,
+        age INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        timestamp DATETIME,
+        type TEXT,
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS classes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        description TEXT
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS teacher_classes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        teacher_id INTEGER,
+        class_id INTEGER
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS teacher_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        school_id INTEGER,
+        teacher_id INTEGER,
+        sender_type TEXT,
+        message TEXT,
+        read INTEGER DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS student_guardians (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        guardian_id INTEGER,
+        linked_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS student_grades (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        subject TEXT,
+        value REAL,
+        term TEXT,
+        teacher_id INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS student_reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        title TEXT,
+        content TEXT,
+        teacher_id INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS face_descriptors (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        descriptor TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS access_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        event_type TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        notified_guardian INTEGER DEFAULT 0
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS pickup_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        guardian_id INTEGER,
+        status TEXT DEFAULT 'waiting',
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        role TEXT,
+        photo_url TEXT,
+        face_descriptor TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS employee_attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER,
+        timestamp DATETIME,
+        FOREIGN KEY(employee_id) REFERENCES employees(id)
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        description TEXT,
+        event_date DATE,
+        cost REAL,
+        class_name TEXT,
+        pix_key TEXT,
+        payment_deadline DATE,
+        type TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS event_participations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id INTEGER,
+        student_id INTEGER,
+        status TEXT,
+        receipt_url TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(event_id) REFERENCES events(id),
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS financial_config (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        gateway_provider TEXT DEFAULT 'inter',
+        api_key TEXT, -- Usado para Asaas ou Legacy
+        client_id TEXT, -- Inter
+        client_secret TEXT, -- Inter
+        pix_key TEXT, -- Inter (Chave Pix da conta)
+        wallet_id TEXT,
+        webhook_token TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        description TEXT,
+        amount REAL,
+        status TEXT DEFAULT 'PENDING', -- PENDING, RECEIVED, OVERDUE
+        payment_method TEXT, -- PIX, BOLETO, CREDIT_CARD
+        due_date DATE,
+        external_id TEXT, -- ID no Asaas
+        payment_url TEXT, -- Link para boleto/pix
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        paid_at DATETIME,
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )''')
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        school_id INTEGER,
+        sender_type TEXT,
+        sender_id INTEGER,
+        message_type TEXT DEFAULT 'text',
+        content TEXT,
+        file_url TEXT,
+        file_name TEXT,
+        read INTEGER DEFAULT 0,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )''')
+
+    # Colunas que bancos antigos (criados pelo backend Node) podem não ter
+    add_column(cur, 'financial_config', 'client_id', 'TEXT')
+    add_column(cur, 'financial_config', 'client_secret', 'TEXT')
+    add_column(cur, 'financial_config', 'pix_key', 'TEXT')
+    add_column(cur, 'financial_config', 'gateway_provider', "TEXT DEFAULT 'inter'")
+
+    add_column(cur, 'events', 'event_date', 'DATE')
+    add_column(cur, 'events', 'cost', 'REAL')
+    add_column(cur, 'events', 'class_name', 'TEXT')
+    add_column(cur, 'events', 'pix_key', 'TEXT')
+    add_column(cur, 'events', 'payment_deadline', 'DATE')
+    add_column(cur, 'events', 'type', 'TEXT')
+
+    add_column(cur, 'students', 'face_descriptor', 'TEXT')
+    add_column(cur, 'event_participations', 'student_id', 'INTEGER')
+    add_column(cur, 'event_participations', 'status', "TEXT DEFAULT 'pending'")
+    add_column(cur, 'event_participations', 'receipt_url', 'TEXT')
+    add_column(cur, 'chat_messages', 'read', 'INTEGER DEFAULT 0')
+
+
+@school_migration(2, 'colunas dos scripts avulsos (update_employee_table, migrate_chat_read, ponto do funcionário)')
+def _school_loose_columns(cur):
+    add_column(cur, 'employees', 'email', 'TEXT')
+    add_column(cur, 'employees', 'phone', 'TEXT')
+    add_column(cur, 'employees', 'employee_id', 'TEXT')
+    add_column(cur, 'employees', 'work_start_time', 'TEXT')
+    add_column(cur, 'employees', 'work_end_time', 'TEXT')
+    add_column(cur, 'employees', 'guardian_id', 'INTEGER')
+
+    add_column(cur, 'employee_attendance', 'type', 'TEXT')
+    add_column(cur, 'employee_attendance', 'latitude', 'REAL')
+    add_column(cur, 'employee_attendance', 'longitude', 'REAL')
+    add_column(cur, 'employee_attendance', 'photo_url', 'TEXT')
+    add_column(cur, 'employee_attendance', 'verified', 'INTEGER DEFAULT 0')
+
+    add_column(cur, 'chat_messages', 'is_read_by_guardian', 'INTEGER DEFAULT 0')
+    add_column(cur, 'chat_messages', 'is_read_by_school', 'INTEGER DEFAULT 0')
+
+
+@school_migration(3, 'data_versions (versão da agenda de eventos para os streams SSE)')
+def _school_data_versions(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )''')
+
+
+# Índices das consultas quentes; conferidos por `python query_plans.py`
+SCHOOL_INDEXES = [
+    ('idx_students_class_name', 'students', ('class_name',)),
+    ('idx_student_guardians_guardian', 'student_guardians', ('guardian_id', 'student_id')),
+    ('idx_student_guardians_student', 'student_guardians', ('student_id', 'guardian_id')),
+    ('idx_access_logs_student_timestamp', 'access_logs', ('student_id', 'timestamp')),
+    ('idx_attendance_timestamp', 'attendance', ('timestamp',)),
+    ('idx_attendance_student_timestamp', 'attendance', ('student_id', 'timestamp')),
+    ('idx_chat_messages_student_timestamp', 'chat_messages', ('student_id', 'timestamp')),
+    ('idx_invoices_external_id', 'invoices', ('external_id',)),
+    ('idx_invoices_student', 'invoices', ('student_id',)),
+    ('idx_student_grades_student', 'student_grades', ('student_id',)),
+    ('idx_student_reports_student', 'student_reports', ('student_id',)),
+    ('idx_employees_guardian', 'employees', ('guardian_id',)),
+    ('idx_employee_attendance_employee_timestamp', 'employee_attendance', ('employee_id', 'timestamp')),
+    ('idx_event_participations_event_student', 'event_participations', ('event_id', 'student_id')),
+    ('idx_pickup_requests_timestamp', 'pickup_requests', ('timestamp',)),
+    ('idx_teacher_classes_teacher', 'teacher_classes', ('teacher_id', 'class_id')),
+    ('idx_teacher_messages_teacher', 'teacher_messages', ('teacher_id', 'created_at')),
+]
+
+
+@school_migration(4, 'índices das consultas quentes (SCHOOL_INDEXES)')
+def _school_indexes(cur):
+    for name, table, columns in SCHOOL_INDEXES:
+        create_index(cur, name, table, columns)
+
+
+@school_migration(5, 'versão dos rostos (students.face_version + face_removals) para o cache do reconhecimento')
+def _school_face_versions(cur):
+    add_column(cur, 'students', 'face_version', 'INTEGER DEFAULT 0')
+    create_index(cur, 'idx_students_face_version', 'students', ('face_version',))
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS face_removals (
+        student_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    )''')
+    create_index(cur, 'idx_face_removals_version', 'face_removals', ('version',))
+
+
+@school_migration(6, 'descritores faciais em BLOB: só sob demanda (face_descriptors.py --to binary)')
+def _school_binary_face_descriptors(cur):
+    # Esta migração convertia os descritores para BLOB, mas o servidor Node lê os mesmos
+    # bancos com JSON.parse; a conversão virou um comando explícito (face_descriptors.py)
+    pass
+
+
+@school_migration(7, 'attendance.idempotency_key (lote de presenças sem duplicar reenvios)')
+def _school_attendance_idempotency(cur):
+    add_column(cur, 'attendance', 'idempotency_key', 'TEXT')
+    if table_exists(cur, 'attendance'):
+        cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_idempotency_key
+        ON attendance(idempotency_key) WHERE idempotency_key IS NOT NULL
+        ''')
+
+
+@school_migration(8, 'resumos diários de frequência por aluno e por turma (attendance_rollups.py)')
+def _school_attendance_rollups(cur):
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_daily (
+        student_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        class_name TEXT,
+        first_arrival TEXT,
+        last_departure TEXT,
+        present INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (student_id, day)
+    )''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_class_daily (
+        class_name TEXT NOT NULL,
+        day TEXT NOT NULL,
+        enrolled INTEGER NOT NULL DEFAULT 0,
+        present INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (class_name, day)
+    )''')
+    create_index(cur, 'idx_attendance_class_daily_day', 'attendance_class_daily', ('day', 'class_name'))
+    # preenchidas pela migração 9, que recria attendance_daily com os horários em ts
+
+
+# Tabelas de eventos com horário canônico (timestamps.py)
+TIMESTAMPED_TABLES = ('attendance', 'access_logs', 'employee_attendance')
+
+
+def _derive_timestamps(cur, table, only_missing=True, tz=None):
+    """Preenche ts/local_date a partir de timestamp (timestamps.parse_timestamp), com o dia no fuso tz.
+
+    Com only_missing=False recalcula tudo e só grava as linhas que mudaram.
+    Retorna o menor local_date alterado (None se nada mudou).
+    """
+    from timestamps import parse_timestamp, to_epoch_ms, local_date
+
+    where = 'ts IS NULL AND ' if only_missing else ''
+    rows = cur.execute(f'SELECT rowid, timestamp, ts, local_date FROM {table} WHERE {where}timestamp IS NOT NULL').fetchall()
+    updates, days = [], []
+    for rowid, timestamp, ts, day in rows:
+        moment = parse_timestamp(timestamp)
+        if moment is None:
+            continue
+        values = (to_epoch_ms(moment), local_date(moment, tz))
+        if values != (ts, day):
+            updates.append(values + (rowid,))
+            days.extend(d for d in (day, values[1]) if d)
+    cur.executemany(f'UPDATE {table} SET ts = ?, local_date = ? WHERE rowid = ?', updates)
+    return min(days, default=None)
+
+
+@school_migration(9, 'ts (epoch ms) + local_date nas tabelas de presença, com backfill (timestamps.py)')
+def _school_canonical_timestamps(cur):
+    for table in TIMESTAMPED_TABLES:
+        if not table_exists(cur, table):
+            continue
+        add_column(cur, table, 'ts', 'INTEGER')
+        add_column(cur, table, 'local_date', 'TEXT')
+        _derive_timestamps(cur, table)
+
+    create_index(cur, 'idx_attendance_local_date', 'attendance', ('local_date', 'ts'))
+    create_index(cur, 'idx_access_logs_student_local_date', 'access_logs', ('student_id', 'local_date'))
+    create_index(cur, 'idx_access_logs_local_date', 'access_logs', ('local_date',))
+    create_index(cur, 'idx_employee_attendance_local_date', 'employee_attendance', ('local_date', 'ts'))
+    create_index(cur, 'idx_employee_attendance_employee_ts', 'employee_attendance', ('employee_id', 'ts'))
+
+    # Resumos por dia local, com primeira entrada/última saída em ts
+    cur.execute('DROP TABLE IF EXISTS attendance_daily')
+    cur.execute('''
+    CREATE TABLE attendance_daily (
+        student_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        class_name TEXT,
+        first_arrival INTEGER,
+        last_departure INTEGER,
+        present INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (student_id, day)
+    )''')
+    if table_exists(cur, 'access_logs') and table_exists(cur, 'students'):
+        from attendance_rollups import rebuild_rollups
+        rebuild_rollups(cur)
+
+
+
+# Mesma regra de timestamps.parse_timestamp: com fuso ('Z', '+00:00', '-03:00') é exato;
+# 'YYYY-MM-DD HH:MM:SS' sem fração é CURRENT_TIMESTAMP (UTC); o resto é hora local do servidor
+_TS_EXPR = '''CAST(ROUND((CASE
+                WHEN substr(NEW.timestamp, 20) GLOB '*[Z+-]*' THEN julianday(NEW.timestamp)
+                WHEN instr(NEW.timestamp, ' ') > 0 AND instr(NEW.timestamp, '.') = 0 THEN julianday(NEW.timestamp)
+                ELSE julianday(NEW.timestamp, 'utc')
+            END - 2440587.5) * 86400000) AS INTEGER)'''
+
+# Dia no fuso da escola com o deslocamento em vigor naquele instante (tz_offsets)
+_LOCAL_DATE_EXPR = '''date((ts + 60000 * (SELECT offset_minutes FROM tz_offsets
+                              WHERE starts_at <= ts ORDER BY starts_at DESC LIMIT 1)) / 1000, 'unixepoch')'''
+
+
+def timestamp_trigger_sql(table):
+    """Trigger que preenche ts/local_date para quem grava só timestamp (servidor Node, scripts avulsos).
+
+    O deslocamento sai de tz_offsets (transições do fuso da escola, horário
+    de verão incluído) linha a linha, então o trigger não muda com a data.
+    """
+    return f'''CREATE TRIGGER trg_{table}_ts AFTER INSERT ON {table}
+        WHEN NEW.local_date IS NULL AND NEW.timestamp IS NOT NULL
+        BEGIN
+            UPDATE {table} SET ts = COALESCE(ts, {_TS_EXPR}) WHERE rowid = NEW.rowid;
+            UPDATE {table} SET local_date = {_LOCAL_DATE_EXPR} WHERE rowid = NEW.rowid;
+        END'''
+
+
+def _create_timestamp_triggers(cur):
+    for table in TIMESTAMPED_TABLES:
+        if not table_exists(cur, table):
+            continue
+        cur.execute(f'DROP TRIGGER IF EXISTS trg_{table}_ts')
+        cur.execute(timestamp_trigger_sql(table))
+
+
+@school_migration(10, 'triggers de ts/local_date + correção das linhas gravadas pelo trigger antigo')
+def _school_timestamp_triggers(cur):
+    # O trigger da migração 9 tirava o dia do fuso do servidor ('localtime') e tratava
+    # todo texto sem fuso como UTC: recalcula o que ele gravou errado. Os triggers
+    # definitivos (com tz_offsets) são criados pela migração 12.
+    for table in TIMESTAMPED_TABLES:
+        cur.execute(f'DROP TRIGGER IF EXISTS trg_{table}_ts')
+    changed = [_derive_timestamps(cur, table, only_missing=False)
+               for table in TIMESTAMPED_TABLES if table_exists(cur, table)]
+    since = min((day for day in changed if day), default=None)
+    if since and table_exists(cur, 'attendance_daily') and table_exists(cur, 'students'):
+        from attendance_rollups import rebuild_rollups
+        rebuild_rollups(cur, since)
+
+
+@school_migration(11, 'attendance_class_daily com todas as turmas nos dias letivos (turma sem presentes)')
+def _school_rollups_all_classes(cur):
+    if table_exists(cur, 'attendance_daily') and table_exists(cur, 'students') and table_exists(cur, 'access_logs'):
+        from attendance_rollups import rebuild_rollups
+        rebuild_rollups(cur)
+
+
+def _store_timezone(cur, name):
+    """Grava o fuso e as transições dele (tz_offsets).
+
+    Retorna o primeiro instante (ms) em que o deslocamento mudou em relação ao
+    que estava gravado, ou None se nada mudou.
+    """
+    from timestamps import tz_transitions
+
+    transitions = tz_transitions(name)
+    stored = cur.execute('SELECT starts_at, offset_minutes FROM tz_offsets ORDER BY starts_at').fetchall()
+    if [tuple(row) for row in stored] == transitions:
+        cur.execute('UPDATE school_timezone SET name = ?', (name,))
+        return None
+
+    # Primeiro ponto em que as duas tabelas discordam
+    changed_at = None
+    for old, new in zip(stored, transitions):
+        if tuple(old) != new:
+            changed_at = min(old[0], new[0])
+            break
+    else:
+        longer = stored if len(stored) > len(transitions) else transitions
+        changed_at = longer[min(len(stored), len(transitions))][0]
+
+    cur.execute('DELETE FROM tz_offsets')
+    cur.executemany('INSERT INTO tz_offsets (starts_at, offset_minutes) VALUES (?, ?)', transitions)
+    cur.execute('DELETE FROM school_timezone')
+    cur.execute('INSERT INTO school_timezone (id, name) VALUES (1, ?)', (name,))
+    return changed_at
+
+
+def _recompute_local_dates(cur, name, since_ms):
+    """Refaz local_date (a partir de ts) das linhas desde since_ms no fuso `name`, e os resumos desses dias."""
+    import datetime
+    from timestamps import load_timezone, local_date
+
+    tz = load_timezone(name)
+    days = []
+    for table in TIMESTAMPED_TABLES:
+        if not table_exists(cur, table):
+            continue
+        rows = cur.execute(f'SELECT rowid, ts, local_date FROM {table} WHERE ts >= ?', (since_ms,)).fetchall()
+        updates = []
+        for rowid, ts, day in rows:
+            new_day = local_date(datetime.datetime.fromtimestamp(ts / 1000, datetime.timezone.utc), tz)
+            if new_day != day:
+                updates.append((new_day, rowid))
+                days.extend(d for d in (day, new_day) if d)
+        cur.executemany(f'UPDATE {table} SET local_date = ? WHERE rowid = ?', updates)
+    since = min(days, default=None)
+    if since and table_exists(cur, 'attendance_daily') and table_exists(cur, 'students') \
+            and table_exists(cur, 'access_logs'):
+        from attendance_rollups import rebuild_rollups
+        rebuild_rollups(cur, since)
+
+
+@school_migration(12, 'fuso por escola (school_timezone + tz_offsets) e triggers com o deslocamento de cada instante')
+def _school_timezone(cur):
+    from timestamps import SCHOOL_TIMEZONE
+
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS school_timezone (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        name TEXT NOT NULL
+    )''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS tz_offsets (
+        starts_at INTEGER PRIMARY KEY,
+        offset_minutes INTEGER NOT NULL
+    )''')
+    _store_timezone(cur, SCHOOL_TIMEZONE)
+    _create_timestamp_triggers(cur)
+    # O trigger da migração 10 usava um deslocamento fixo: refaz o dia de tudo no fuso da escola
+    _recompute_local_dates(cur, SCHOOL_TIMEZONE, -(2 ** 62))
+
+
+@school_migration(13, 'resumos de frequência mantidos por triggers em access_logs (inclusive gravações do Node)')
+def _school_rollup_triggers(cur):
+    if not (table_exists(cur, 'access_logs') and table_exists(cur, 'attendance_daily') and table_exists(cur, 'students')):
+        return
+    from attendance_rollups import create_rollup_triggers, rebuild_rollups
+    create_rollup_triggers(cur)
+    # Entradas gravadas por fora (Node, câmeras, scripts) até aqui não tinham entrado nos resumos
+    rebuild_rollups(cur)
+
+
+@school_migration(14, 'data_versions[events] incrementada por triggers na tabela events (inclusive escritas do Node)')
+def _school_events_version_triggers(cur):
+    if not table_exists(cur, 'events'):
+        return
+    # Mesma chave de routes/event_helpers.EVENTS_VERSION_KEY
+    for action in ('INSERT', 'UPDATE', 'DELETE'):
+        cur.execute(f'DROP TRIGGER IF EXISTS trg_events_version_{action.lower()}')
+        cur.execute(f'''CREATE TRIGGER trg_events_version_{action.lower()} AFTER {action} ON events
+        BEGIN
+            INSERT INTO data_versions (name, version) VALUES ('events', 1)
+            ON CONFLICT(name) DO UPDATE SET version = version + 1;
+        END''')
+
+
+def sync_school_timezone(conn):
+    """Confere, ao abrir o banco, se tz_offsets e os triggers batem com o tzdata atual.
+
+    Quando o tzdata muda (país abole ou cria horário de verão), regrava as
+    transições e recalcula local_date a partir da primeira diferença.
+    """
+    if get_version(conn) < 12:
+        return
+    row = conn.execute('SELECT name FROM school_timezone').fetchone()
+    if row is None:
+        return
+    name = row[0]
+    try:
+        from timestamps import tz_transitions
+        transitions = tz_transitions(name)
+    except ValueError as e:
+        print(f"⚠️ {e} (tz_offsets mantido)")
+        return
+    stored = [tuple(r) for r in conn.execute('SELECT starts_at, offset_minutes FROM tz_offsets ORDER BY starts_at')]
+    stale = []
+    for table in TIMESTAMPED_TABLES:
+        if not table_exists(conn, table):
+            continue
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                           (f'trg_{table}_ts',)).fetchone()
+        if row is None or row[0] != timestamp_trigger_sql(table):
+            stale.append(table)
+    if stored == transitions and not stale:
+        return
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.cursor()
+        changed_at = _store_timezone(cur, name)
+        if changed_at is not None:
+            _recompute_local_dates(cur, name, changed_at)
+        for table in stale:
+            cur.execute(f'DROP TRIGGER IF EXISTS trg_{table}_ts')
+            cur.execute(timestamp_trigger_sql(table))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"🕒 Fuso {name} atualizado (tz_offsets/triggers)")
+
+
+def set_school_timezone(conn, name):
+    """Troca o fuso da escola: tz_offsets, local_date de todas as linhas e os resumos."""
+    from timestamps import load_timezone
+
+    load_timezone(name)
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.cursor()
+        _store_timezone(cur, name)
+        _recompute_local_dates(cur, name, -(2 ** 62))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# ====== CLI ======
+
+def _migrate_file(db_path, migrations):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        before = get_version(conn)
+        after = apply_migrations(conn, migrations)
+        return before, after
+    finally:
+        conn.close()
+
+
+def _read_version(db_path):
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        return get_version(conn)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    from database import DB_DIR, SYSTEM_DB_PATH
+
+    parser = argparse.ArgumentParser(description='Aplica as migrações pendentes em system.db e school_*.db')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                        help='bancos de escola migrados em paralelo')
+    parser.add_argument('--status', action='store_true', help='apenas lista a versão de cada banco')
+    args = parser.parse_args(argv)
+
+    school_paths = sorted(glob.glob(os.path.join(DB_DIR, 'school_*.db')))
+
+    if args.status:
+        print(f"system.db: v{_read_version(SYSTEM_DB_PATH)} (última v{latest_version(SYSTEM_MIGRATIONS)})")
+        for path in school_paths:
+            print(f"{os.path.basename(path)}: v{_read_version(path)} (última v{latest_version(SCHOOL_MIGRATIONS)})")
+        return 0
+
+    before, after = _migrate_file(SYSTEM_DB_PATH, SYSTEM_MIGRATIONS)
+    print(f"✅ system.db: v{before} -> v{after}")
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(_migrate_file, path, SCHOOL_MIGRATIONS): path for path in school_paths}
+        for future in as_completed(futures):
+            name = os.path.basename(futures[future])
+            try:
+                before, after = future.result()
+                print(f"✅ {name}: v{before} -> v{after}")
+            except Exception as e:
+                failures += 1
+                print(f"❌ {name}: {e}")
+
+    print(f"Migração concluída: {len(school_paths) - failures}/{len(school_paths)} bancos de escola atualizados.")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
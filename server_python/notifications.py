@@ -0,0 +1,226 @@
+"""
+Broker de notificações para os streams SSE dos responsáveis.
+
+Quem grava em access_logs (ou altera eventos) publica aqui depois do commit;
+cada conexão SSE assina os canais que interessam e fica bloqueada na própria
+fila, sem consultar o banco enquanto nada acontece.
+
+Implementações (variável NOTIFICATION_BROKER):
+    memory  - só dentro do processo (padrão; um único worker)
+    sqlite  - journal em um arquivo SQLite compartilhado, para vários workers
+              do gunicorn na mesma máquina (NOTIFICATION_BROKER_DB)
+
+Mensagens: {'type': 'notification', 'data': {...access_log...}} no canal
+guardian:<id>, {'type': 'events_changed', 'school_id': <id>} no canal
+school-events:<id> e {'type': 'presence', ...entrada/saída...} no canal
+school-presence:<id> (presence.py).
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from database import DB_DIR
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def guardian_channel(guardian_id):
+    return f'guardian:{int(guardian_id)}'
+
+
+def school_events_channel(school_id):
+    return f'school-events:{int(school_id)}'
+
+
+def presence_channel(school_id):
+    return f'school-presence:{int(school_id)}'
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # canal -> {Queue}
+
+    def subscribe(self, channel, q=None):
+        """Assina um canal; passe a mesma fila para juntar vários canais em uma só."""
+        if q is None:
+            q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[channel].add(q)
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    # False quando a entrega entre processos está falhando (os streams voltam a conferir por intervalo)
+    available = True
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def publish_local(self, channel, message):
+        """Só para os assinantes deste processo (sinais que cada worker gera sozinho)."""
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for q in targets:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Cliente parado: o registro segue pendente no banco e volta na reconexão
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+class SQLiteJournalBroker(InProcessBroker):
+    """Entrega entre processos através de uma tabela append-only em SQLite.
+
+    publish() entrega na hora para os assinantes locais e grava no journal;
+    uma thread por processo lê as linhas novas (id > último visto) de outros
+    processos e repassa para os assinantes locais.
+    """
+
+    def __init__(self, path, poll_interval=0.2, retention_seconds=300):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._origin = uuid.uuid4().hex
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._poller = None
+        self._poller_lock = threading.Lock()
+        self._ensure_schema()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _ensure_schema(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS notification_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT,
+                    channel TEXT,
+                    payload TEXT,
+                    created_at REAL
+                )''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            self._writer.execute(
+                'INSERT INTO notification_journal (origin, channel, payload, created_at) VALUES (?, ?, ?, ?)',
+                (self._origin, channel, json.dumps(message), time.time())
+            )
+            self._writer.commit()
+
+    def subscribe(self, channel, q=None):
+        self._start_poller()
+        return super().subscribe(channel, q)
+
+    def _start_poller(self):
+        with self._poller_lock:
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, name='notification-journal', daemon=True)
+                self._poller.start()
+
+    def _poll_loop(self):
+        conn = self._connect()
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM notification_journal').fetchone()[0]
+        last_prune = time.monotonic()
+        while True:
+            try:
+                rows = conn.execute(
+                    'SELECT id, origin, channel, payload FROM notification_journal WHERE id > ? ORDER BY id',
+                    (last_id,)
+                ).fetchall()
+                for row_id, origin, channel, payload in rows:
+                    last_id = row_id
+                    if origin != self._origin:
+                        self._deliver(channel, json.loads(payload))
+
+                if time.monotonic() - last_prune > self.retention_seconds:
+                    conn.execute('DELETE FROM notification_journal WHERE created_at < ?',
+                                 (time.time() - self.retention_seconds,))
+                    conn.commit()
+                    last_prune = time.monotonic()
+                self.available = True
+            except sqlite3.Error as e:
+                self.available = False
+                print(f"Erro no journal de notificações: {e}")
+            time.sleep(self.poll_interval)
+
+
+def create_broker(kind=None):
+    kind = kind or os.environ.get('NOTIFICATION_BROKER', 'memory')
+    if kind == 'sqlite':
+        path = os.environ.get('NOTIFICATION_BROKER_DB', os.path.join(DB_DIR, 'notification_journal.db'))
+        return SQLiteJournalBroker(path)
+    if kind == 'memory':
+        return InProcessBroker()
+    raise ValueError(f'NOTIFICATION_BROKER desconhecido: {kind}')
+
+
+hub = create_broker()
+
+
+def publish_access_log(db, school_id, log_id):
+    """Publica um registro de access_logs para os responsáveis do aluno.
+
+    Chamar depois do commit, com a mesma conexão da escola usada na escrita.
+    """
+    row = db.execute('''
+        SELECT al.id, al.student_id, s.name as student_name, s.photo_url, al.event_type, al.timestamp
+        FROM access_logs al
+        JOIN students s ON al.student_id = s.id
+        WHERE al.id = ?
+    ''', (log_id,)).fetchone()
+    if not row:
+        return
+
+    guardian_ids = {r['guardian_id'] for r in db.execute(
+        'SELECT guardian_id FROM student_guardians WHERE student_id = ?', (row['student_id'],)
+    ).fetchall() if r['guardian_id'] is not None}
+
+    data = dict(row)
+    data['school_id'] = int(school_id)
+    for guardian_id in guardian_ids:
+        hub.publish(guardian_channel(guardian_id), {'type': 'notification', 'data': data})
+
+
+def publish_events_changed(school_id):
+    """Avisa os streams de eventos que a agenda da escola mudou."""
+    hub.publish(school_events_channel(school_id), {'type': 'events_changed', 'school_id': int(school_id)})
+
+
+def publish_presence(school_id, student_id, event_type, ts, local_date):
+    """Entrada/saída gravada, para o mapa de presença (presence.py) de cada worker."""
+    hub.publish(presence_channel(school_id), {
+        'type': 'presence', 'student_id': int(student_id), 'event_type': event_type,
+        'ts': ts, 'local_date': local_date,
+    })
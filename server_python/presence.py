@@ -0,0 +1,365 @@
+"""
+Quem está na escola agora: mapa de presença em memória, por escola.
+
+Antes cada tela (portaria, retirada, chamada de emergência) recalculava isso
+lendo o log de presenças do dia. Aqui cada escola tem um SchoolPresence com
+os alunos dentro (última entrada sem saída depois) e a contagem por turma:
+
+    - montado a partir do access_logs de hoje (local_date, ver timestamps.py)
+      no primeiro acesso, no início do app (warm_presence) e na virada do dia;
+    - atualizado pelo canal school-presence:<id> do hub (notifications.py),
+      que record_access e o lote de presenças publicam depois do COMMIT. Com
+      NOTIFICATION_BROKER=sqlite os mapas dos outros workers recebem também;
+    - e, a cada PRESENCE_RESYNC_SECONDS, pelas linhas novas de access_logs
+      (id maior que o último lido), para pegar quem grava sem publicar no hub:
+      servidor Node, serviço de câmeras, scripts avulsos.
+
+As mensagens do hub só entram numa fila: quem aplica (e lê o banco quando
+precisa, ex. aluno novo ou virada do dia) é a thread presence-worker, não a
+requisição que acabou de gravar.
+
+As telas leem snapshot() (GET /api/school/presence) ou assinam as mudanças
+(subscribe(), usado pelo SSE /api/school/presence/stream, em asyncio no asgi.py).
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from database import SYSTEM_DB_PATH, _connect_school_db, get_school_db_path
+from notifications import hub, presence_channel, SUBSCRIBER_QUEUE_SIZE
+from timestamps import today, format_local, school_tz
+
+PRESENCE_EVENTS = ('arrival', 'departure')
+RESYNC = {'type': 'resync'}
+
+# Intervalo da leitura das linhas novas de access_logs (gravações fora do Python)
+PRESENCE_RESYNC_SECONDS = float(os.environ.get('PRESENCE_RESYNC_SECONDS', '5'))
+
+
+class SchoolPresence:
+    def __init__(self, school_id):
+        self.school_id = str(school_id)
+        self.tz = school_tz(self.school_id)
+        self._lock = threading.Lock()
+        self._load_lock = threading.RLock()
+        self._listeners = set()
+        self._lagging = set()  # assinantes com a fila cheia, que precisam de RESYNC
+        self._buffer = None  # eventos recebidos durante um rebuild, reaplicados no fim
+        self.day = None
+        self.version = 0
+        self.students = {}  # aluno -> {'name', 'class_name'} (sem foto: photo_url pode ser um data URL enorme)
+        self.enrolled = {}  # turma -> matriculados
+        self.present = {}  # turma -> presentes
+        self.inside = {}  # aluno -> (ts da entrada, turma)
+        self.last_event = {}  # aluno -> ts do último evento do dia
+        self.last_log_id = 0  # maior access_logs.id já lido do banco (catch_up)
+        self._poll_conn = None  # conexão da thread presence-worker
+        hub.subscribe(presence_channel(self.school_id), self)
+
+    def rebuild(self):
+        """Relê alunos e o access_logs de hoje; avisa os assinantes para recarregar."""
+        with self._load_lock:
+            with self._lock:
+                self._buffer = []
+            day = today(self.tz)
+            try:
+                conn = _connect_school_db(self.school_id)
+                try:
+                    roster = conn.execute('SELECT id, name, class_name FROM students').fetchall()
+                    # Até este id vem daqui; o que entrar depois, catch_up() lê
+                    last_log_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM access_logs').fetchone()[0]
+                    events = conn.execute('''
+                        SELECT student_id, event_type, ts FROM access_logs
+                        WHERE local_date = ? AND event_type IN ('arrival', 'departure') AND id <= ?
+                        ORDER BY ts, id
+                    ''', (day, last_log_id)).fetchall()
+                finally:
+                    conn.close()
+            except Exception:
+                with self._lock:
+                    self._buffer = None
+                raise
+
+            students = {r['id']: {'name': r['name'], 'class_name': r['class_name']} for r in roster}
+            enrolled = {}
+            for s in students.values():
+                enrolled[s['class_name']] = enrolled.get(s['class_name'], 0) + 1
+
+            with self._lock:
+                self.day = day
+                self.last_log_id = max(self.last_log_id, last_log_id)
+                self.students, self.enrolled = students, enrolled
+                self.present, self.inside, self.last_event = {}, {}, {}
+                for e in events:
+                    self._apply(e['student_id'], e['event_type'], e['ts'])
+                buffered, self._buffer = self._buffer, None
+                for student_id, event_type, ts, local_date in buffered:
+                    if local_date == day:
+                        self._apply(student_id, event_type, ts)
+                self.version += 1
+                listeners = list(self._listeners)
+            for q in listeners:
+                self._send(q, RESYNC)
+        print(f"👥 Presença da escola {self.school_id} montada: {len(self.inside)} aluno(s) dentro")
+
+    def check_day(self):
+        """Remonta na virada do dia (todo mundo sai). True se remontou."""
+        if self.day == today(self.tz):
+            return False
+        self.rebuild()
+        return True
+
+    def put_nowait(self, message):
+        """Entrega do hub (mesma interface de fila dos assinantes): só enfileira para a presence-worker."""
+        _updates.put((self, message))
+        _start_worker()
+
+    def apply_message(self, message):
+        try:
+            self.record(message['student_id'], message['event_type'], message['ts'], message['local_date'])
+        except Exception as e:
+            print(f"Erro ao atualizar presença da escola {self.school_id}: {e}")
+
+    def catch_up(self):
+        """Aplica as linhas de access_logs gravadas depois da última leitura (roda na presence-worker).
+
+        Reaplicar um evento que já veio pelo hub não muda nada (_apply ignora
+        entrada de quem já está dentro e evento mais antigo que o último).
+        """
+        if self.day is None or self.check_day():
+            return
+        if self._poll_conn is None:
+            self._poll_conn = _connect_school_db(self.school_id)
+        with self._lock:
+            last_log_id = self.last_log_id
+        rows = self._poll_conn.execute('''
+            SELECT id, student_id, event_type, ts, local_date FROM access_logs WHERE id > ? ORDER BY id
+        ''', (last_log_id,)).fetchall()
+        for row in rows:
+            if row['student_id'] is not None:
+                self.record(row['student_id'], row['event_type'], row['ts'], row['local_date'])
+        if rows:
+            with self._lock:
+                self.last_log_id = max(self.last_log_id, rows[-1]['id'])
+
+    def record(self, student_id, event_type, ts, local_date):
+        if event_type not in PRESENCE_EVENTS or ts is None:
+            return
+        with self._lock:
+            if self._buffer is not None:
+                self._buffer.append((student_id, event_type, ts, local_date))
+                return
+        if local_date != self.day:
+            # Evento de outro dia: só importa se hoje virou (remonta a partir do banco)
+            if local_date != today(self.tz) or not self.check_day():
+                return
+        if student_id not in self.students:
+            self._load_student(student_id)
+
+        with self._lock:
+            if self._buffer is not None:
+                self._buffer.append((student_id, event_type, ts, local_date))
+                return
+            if local_date != self.day or not self._apply(student_id, event_type, ts):
+                return
+            self.version += 1
+            delta = self._delta(student_id)
+            listeners = list(self._listeners)
+        for q in listeners:
+            self._send(q, delta)
+
+    def _apply(self, student_id, event_type, ts):
+        """Aplica um evento (com o lock); False se não mudou nada."""
+        if ts < self.last_event.get(student_id, ts):
+            return False  # chegou atrasado (lote reenviado): vale o evento mais recente
+        self.last_event[student_id] = ts
+        if event_type == 'arrival':
+            if student_id in self.inside:
+                return False
+            class_name = self.students.get(student_id, {}).get('class_name')
+            self.inside[student_id] = (ts, class_name)
+            self.present[class_name] = self.present.get(class_name, 0) + 1
+            return True
+        entry = self.inside.pop(student_id, None)
+        if entry is None:
+            return False
+        self.present[entry[1]] -= 1
+        return True
+
+    def _load_student(self, student_id):
+        # Aluno cadastrado depois da montagem
+        conn = _connect_school_db(self.school_id)
+        try:
+            row = conn.execute('SELECT name, class_name FROM students WHERE id = ?', (student_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return
+        with self._lock:
+            if student_id not in self.students:
+                self.students[student_id] = dict(row)
+                self.enrolled[row['class_name']] = self.enrolled.get(row['class_name'], 0) + 1
+
+    def _student(self, student_id):
+        info = self.students.get(student_id, {})
+        entry = self.inside.get(student_id)
+        return {
+            'id': student_id,
+            'name': info.get('name'),
+            'class_name': info.get('class_name'),
+            'inside': entry is not None,
+            'since': format_local(entry[0], self.tz) if entry else None,
+        }
+
+    def _class(self, class_name):
+        enrolled = self.enrolled.get(class_name, 0)
+        present = self.present.get(class_name, 0)
+        return {'class_name': class_name, 'enrolled': enrolled, 'present': present,
+                'absent': max(enrolled - present, 0)}
+
+    def _delta(self, student_id):
+        return {
+            'type': 'presence_delta',
+            'version': self.version,
+            'day': self.day,
+            'student': self._student(student_id),
+            'class': self._class(self.inside.get(student_id, (None, None))[1]
+                                 or self.students.get(student_id, {}).get('class_name')),
+            'total_present': len(self.inside),
+        }
+
+    def snapshot(self, class_name=None):
+        """Estado completo: alunos dentro e contagem por turma (opcionalmente de uma turma só)."""
+        self.check_day()
+        with self._lock:
+            classes = sorted(set(self.enrolled) | {c for c, n in self.present.items() if n},
+                             key=lambda c: (c is None, c or ''))
+            if class_name is not None:
+                classes = [c for c in classes if c == class_name]
+            students = [self._student(student_id) for student_id, (ts, c) in
+                        sorted(self.inside.items(), key=lambda item: item[1][0])
+                        if class_name is None or c == class_name]
+            return {
+                'school_id': int(self.school_id),
+                'day': self.day,
+                'version': self.version,
+                'total_present': len(self.inside),
+                'total_enrolled': sum(self.enrolled.values()),
+                'classes': [self._class(c) for c in classes],
+                'students': students,
+            }
+
+    def subscribe(self, q=None):
+        """Assina as mudanças (presence_delta, ou RESYNC quando é preciso reler o snapshot).
+
+        q pode ser qualquer fila com put_nowait (ex.: AsyncInbox do asgi.py).
+        """
+        if q is None:
+            q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._listeners.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._listeners.discard(q)
+            self._lagging.discard(q)
+
+    def take_resync(self, q):
+        """True (uma vez) se o assinante perdeu mudanças com a fila cheia e deve reler o snapshot."""
+        with self._lock:
+            if q in self._lagging:
+                self._lagging.discard(q)
+                return True
+        return False
+
+    def _send(self, q, message):
+        # Cliente parado: em vez de empilhar mudanças velhas, a próxima entrega vira RESYNC
+        with self._lock:
+            if q in self._lagging:
+                message = RESYNC
+        try:
+            q.put_nowait(message)
+        except queue.Full:
+            with self._lock:
+                self._lagging.add(q)
+            return
+        if message is RESYNC:
+            with self._lock:
+                self._lagging.discard(q)
+
+
+_presence_lock = threading.Lock()
+_presence = {}  # school_id -> SchoolPresence
+
+_updates = queue.Queue()  # (SchoolPresence, mensagem do hub)
+_worker_lock = threading.Lock()
+_worker = None
+
+
+def _start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_work, name='presence-worker', daemon=True)
+            _worker.start()
+
+
+def _work():
+    """Aplica as mensagens do hub e, a cada PRESENCE_RESYNC_SECONDS, as linhas novas de cada escola."""
+    next_sync = time.monotonic() + PRESENCE_RESYNC_SECONDS
+    while True:
+        try:
+            presence, message = _updates.get(timeout=max(0.0, next_sync - time.monotonic()))
+            presence.apply_message(message)
+        except queue.Empty:
+            pass
+        if time.monotonic() < next_sync:
+            continue
+        with _presence_lock:
+            schools = list(_presence.values())
+        for presence in schools:
+            try:
+                presence.catch_up()
+            except Exception as e:
+                print(f"Erro ao ler access_logs novos da escola {presence.school_id}: {e}")
+        next_sync = time.monotonic() + PRESENCE_RESYNC_SECONDS
+
+
+def get_presence(school_id):
+    """Mapa de presença da escola, montado no primeiro acesso."""
+    key = str(school_id)
+    with _presence_lock:
+        presence = _presence.get(key)
+        if presence is None:
+            presence = _presence[key] = SchoolPresence(key)
+    with presence._load_lock:
+        if presence.day is None:
+            presence.rebuild()
+    _start_worker()
+    return presence
+
+
+def warm_presence():
+    """Monta os mapas de todas as escolas em segundo plano (início do app)."""
+    def run():
+        try:
+            conn = sqlite3.connect(SYSTEM_DB_PATH)
+            try:
+                school_ids = [r[0] for r in conn.execute('SELECT id FROM schools').fetchall()]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Presença: não foi possível listar as escolas: {e}")
+            return
+        for school_id in school_ids:
+            if not os.path.exists(get_school_db_path(school_id)):
+                continue
+            try:
+                get_presence(school_id)
+            except Exception as e:
+                print(f"⚠️ Presença da escola {school_id} não montada: {e}")
+
+    threading.Thread(target=run, name='presence-warmup', daemon=True).start()
@@ -0,0 +1,241 @@
+"""
+Conferência dos planos das consultas quentes dos school_*.db.
+
+Roda EXPLAIN QUERY PLAN em cada consulta de HOT_QUERIES e falha (exit 1) se
+alguma cair em varredura completa (SCAN) de uma tabela. Sem --db usa um banco
+em memória com o esquema atual de migrations.py, então serve de teste de
+regressão para os índices de SCHOOL_INDEXES.
+
+Uso (a partir de server_python/):
+    python query_plans.py                              # esquema atual em memória
+    python query_plans.py --db ../database/school_14.db  # arquivos reais (só leitura)
+    python query_plans.py --verbose                    # mostra o plano de cada consulta
+
+Ao criar ou alterar uma consulta com filtro em routes/, inclua-a aqui.
+"""
+import argparse
+import sqlite3
+import sys
+
+from migrations import migrate_school_db
+
+# (origem, sql, aliases em que o SCAN é intencional, ex.: ORDER BY ... LIMIT pelo índice)
+HOT_QUERIES = [
+    ('guardian.get_students / _school_events', '''
+        SELECT s.id, s.name, s.photo_url, s.class_name, sg.linked_at
+        FROM students s
+        JOIN student_guardians sg ON s.id = sg.student_id
+        WHERE sg.guardian_id = ?
+    ''', ()),
+    ('guardian.get_notifications', '''
+        SELECT al.id, al.student_id, s.name as student_name, al.event_type, al.timestamp
+        FROM access_logs al
+        JOIN students s ON al.student_id = s.id
+        JOIN student_guardians sg ON s.id = sg.student_id
+        WHERE sg.guardian_id = ?
+        ORDER BY al.timestamp DESC LIMIT 20
+    ''', ()),
+    ('guardian.NotificationCursor.pending', '''
+        SELECT al.id, al.student_id, s.name as student_name, s.photo_url, al.event_type, al.timestamp
+        FROM access_logs al
+        JOIN students s ON al.student_id = s.id
+        WHERE al.id > ?
+          AND al.student_id IN (SELECT student_id FROM student_guardians WHERE guardian_id = ?)
+        ORDER BY al.id
+        LIMIT ?
+    ''', ()),
+    ('notifications.publish_access_log', '''
+        SELECT guardian_id FROM student_guardians WHERE student_id = ?
+    ''', ()),
+    ('guardian permissão (pickup, link-student, chat)', '''
+        SELECT 1 FROM student_guardians WHERE student_id = ? AND guardian_id = ?
+    ''', ()),
+    ('guardian.get_student_attendance', '''
+        SELECT first_arrival, last_departure FROM attendance_daily
+        WHERE student_id = ? AND day >= ? AND day < ?
+        ORDER BY day
+    ''', ()),
+    ('school.get_school_attendance_summary', '''
+        SELECT day, class_name, enrolled, present, MAX(enrolled - present, 0) AS absent
+        FROM attendance_class_daily
+        WHERE day >= ? AND day <= ?
+        ORDER BY day, class_name
+    ''', ()),
+    ('attendance_rollups (trigger: aluno no dia)', '''
+        SELECT class_name FROM attendance_daily WHERE student_id = ? AND day = ? AND present
+    ''', ()),
+    ('attendance_rollups (trigger: dia já aberto)', '''
+        SELECT 1 FROM attendance_class_daily WHERE day = ?
+    ''', ()),
+    ('presence.rebuild (log de hoje)', '''
+        SELECT student_id, event_type, ts FROM access_logs
+        WHERE local_date = ? AND event_type IN ('arrival', 'departure')
+        ORDER BY ts, id
+    ''', ()),
+    ('school.get_school_attendance', '''
+        SELECT a.id, a.student_id, a.timestamp, a.type, a.ts, a.local_date,
+               s.name as student_name, s.class_name, s.photo_url
+        FROM attendance a
+        JOIN students s ON a.student_id = s.id
+        WHERE 1=1 AND a.local_date >= ? AND a.local_date <= ?
+        ORDER BY a.ts DESC
+    ''', ()),
+    ('school.get_employee_attendance', '''
+        SELECT ea.*, e.name as employee_name, e.role as employee_role, e.employee_id as matricula
+        FROM employee_attendance ea
+        JOIN employees e ON ea.employee_id = e.id
+        WHERE 1=1 AND ea.local_date >= ? AND ea.local_date <= ?
+        ORDER BY ea.ts DESC
+    ''', ()),
+    ('guardian.get_chat_messages', '''
+        SELECT * FROM chat_messages
+        WHERE student_id = ? AND school_id = ?
+        ORDER BY timestamp ASC
+    ''', ()),
+    ('school chat do aluno', '''
+        SELECT * FROM chat_messages WHERE student_id = ? ORDER BY timestamp ASC
+    ''', ()),
+    ('financial.asaas_webhook', '''
+        UPDATE invoices SET status = ?, paid_at = CURRENT_TIMESTAMP WHERE external_id = ?
+    ''', ()),
+    ('guardian.get_invoices', '''
+        SELECT i.*, s.name as student_name, s.class_name
+        FROM invoices i
+        JOIN students s ON i.student_id = s.id
+        JOIN student_guardians sg ON s.id = sg.student_id
+        WHERE sg.guardian_id = ?
+        ORDER BY i.due_date DESC
+    ''', ()),
+    ('guardian.get_grades', '''
+        SELECT g.*, s.name as student_name, s.class_name
+        FROM student_grades g
+        JOIN students s ON g.student_id = s.id
+        JOIN student_guardians sg ON s.id = sg.student_id
+        WHERE sg.guardian_id = ?
+        ORDER BY g.created_at DESC
+    ''', ()),
+    ('guardian.get_reports', '''
+        SELECT r.*, s.name as student_name, s.class_name
+        FROM student_reports r
+        JOIN students s ON r.student_id = s.id
+        JOIN student_guardians sg ON s.id = sg.student_id
+        WHERE sg.guardian_id = ?
+        ORDER BY r.created_at DESC
+    ''', ()),
+    ('employee_app.find_employee_by_guardian_id', '''
+        SELECT * FROM employees WHERE guardian_id = ?
+    ''', ()),
+    ('employee_app histórico do ponto', '''
+        SELECT * FROM employee_attendance
+        WHERE employee_id = ?
+        ORDER BY ts DESC
+        LIMIT 50
+    ''', ()),
+    ('guardian.confirm_event_participation', '''
+        SELECT id FROM event_participations WHERE event_id = ? AND student_id = ?
+    ''', ()),
+    ('school.get_event_participants', '''
+        SELECT ep.*, s.name as student_name, s.class_name
+        FROM event_participations ep
+        JOIN students s ON ep.student_id = s.id
+        WHERE ep.event_id = ?
+        ORDER BY ep.created_at DESC
+    ''', ()),
+    ('school alunos da turma', '''
+        SELECT * FROM students WHERE class_name = ?
+    ''', ()),
+    ('school pedidos de retirada', '''
+        SELECT p.id, p.student_id, s.name as student_name, s.photo_url, s.class_name,
+               p.guardian_id, p.status, p.timestamp
+        FROM pickup_requests p
+        JOIN students s ON p.student_id = s.id
+        JOIN student_guardians sg ON s.id = sg.student_id AND p.guardian_id = sg.guardian_id
+        ORDER BY p.timestamp DESC LIMIT 100
+    ''', ('p',)),
+    ('attendance.get_student_embeddings (incremental)', '''
+        SELECT id, name, face_descriptor, phone AS guardian_phone, class_name
+        FROM students
+        WHERE face_version > ?
+    ''', ()),
+    ('attendance.get_student_embeddings (remoções)', '''
+        SELECT student_id FROM face_removals WHERE version > ?
+    ''', ()),
+    ('teacher turmas do professor', '''
+        SELECT c.* FROM classes c
+        JOIN teacher_classes tc ON c.id = tc.class_id
+        WHERE tc.teacher_id = ?
+    ''', ()),
+    ('teacher mensagens', '''
+        SELECT * FROM teacher_messages
+        WHERE teacher_id = ?
+        ORDER BY created_at DESC
+    ''', ()),
+]
+
+
+def explain(conn, sql):
+    """Linhas de detalhe do EXPLAIN QUERY PLAN (parâmetros como NULL)."""
+    params = (None,) * sql.count('?')
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+
+def full_scans(plan, allowed=()):
+    """Tabelas varridas por inteiro ('SCAN x', inclusive 'SCAN x USING COVERING INDEX')."""
+    scans = []
+    for detail in plan:
+        parts = detail.split()
+        if len(parts) >= 2 and parts[0] == 'SCAN' and parts[1] != 'CONSTANT' and parts[1] not in allowed:
+            scans.append(detail)
+    return scans
+
+
+def check(conn, verbose=False):
+    """Retorna a lista de (origem, detalhe) que caíram em SCAN."""
+    failures = []
+    for source, sql, allowed in HOT_QUERIES:
+        try:
+            plan = explain(conn, sql)
+        except sqlite3.Error as e:
+            failures.append((source, f'erro: {e}'))
+            continue
+        scans = full_scans(plan, allowed)
+        failures.extend((source, detail) for detail in scans)
+        if verbose:
+            print(f"{'❌' if scans else '✅'} {source}")
+            for detail in plan:
+                print(f"      {detail}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='EXPLAIN QUERY PLAN das consultas quentes dos bancos das escolas')
+    parser.add_argument('--db', action='append', default=[], help='school_*.db a conferir (padrão: esquema atual em memória)')
+    parser.add_argument('--verbose', action='store_true', help='mostra o plano de todas as consultas')
+    args = parser.parse_args(argv)
+
+    targets = args.db or [':memory:']
+    total = 0
+    for target in targets:
+        if target == ':memory:':
+            conn = sqlite3.connect(':memory:')
+            migrate_school_db(conn)
+        else:
+            conn = sqlite3.connect(f'file:{target}?mode=ro', uri=True)
+        try:
+            print(f"📋 {target}")
+            failures = check(conn, args.verbose)
+        finally:
+            conn.close()
+        for source, detail in failures:
+            print(f"   ❌ {source}: {detail}")
+        total += len(failures)
+
+    if total:
+        print(f"❌ {total} consulta(s) com varredura completa")
+        return 1
+    print(f"✅ {len(HOT_QUERIES)} consultas usando índice")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,15 @@ Helper functions for affiliate school access control
 from flask import g, request
 from database import get_system_db
 
+def has_affiliate_access(user_school_id, requested_school_id, db):
+    """True if the two schools have an active affiliate link (either direction)."""
+    return db.execute('''
+        SELECT id FROM school_affiliates
+        WHERE ((parent_school_id = ? AND affiliate_school_id = ?)
+           OR (parent_school_id = ? AND affiliate_school_id = ?))
+           AND status = 'active'
+    ''', (user_school_id, requested_school_id, requested_school_id, user_school_id)).fetchone() is not None
+
 def get_accessible_school_id():
     """
     Get the school_id that should be used for data queries.
@@ -22,17 +31,7 @@ def get_accessible_school_id():
         return user_school_id
     
     # Verify user has access to the requested school
-    db = get_system_db()
-    cur = db.cursor()
-    
-    cur.execute('''
-        SELECT id FROM school_affiliates
-        WHERE ((parent_school_id = ? AND affiliate_school_id = ?)
-           OR (parent_school_id = ? AND affiliate_school_id = ?))
-           AND status = 'active'
-    ''', (user_school_id, requested_school_id, requested_school_id, user_school_id))
-    
-    if cur.fetchone():
+    if has_affiliate_access(user_school_id, requested_school_id, get_system_db()):
         return requested_school_id
     
     # Raise error to prevent showing wrong data
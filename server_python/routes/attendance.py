@@ -1,10 +1,43 @@
 from flask import Blueprint, request, jsonify, g
 from .auth import token_required
 from database import get_system_db, get_school_db
-import datetime
+from notifications import publish_access_log, publish_presence
+from school_writer import write_school
+from timestamps import stamp, school_tz
+from .face_helpers import changed_faces
+from .attendance_helpers import ingest_events, MAX_BATCH_EVENTS, ATTENDANCE_TYPES
+import os
 
 attendance_bp = Blueprint('attendance', __name__)
 
+# Token compartilhado com o serviço de reconhecimento facial (facial-recognition/app.py)
+RECOGNITION_SERVICE_TOKEN = os.environ.get('RECOGNITION_SERVICE_TOKEN')
+
+
+def record_access(db, school_id, student_id, event_type):
+    """Grava attendance + access_logs (pelo escritor da escola) e avisa os responsáveis conectados."""
+    timestamp, ts, local_date = stamp(tz=school_tz(school_id))
+
+    def write(conn):
+        conn.execute('''
+            INSERT INTO attendance (student_id, timestamp, type, ts, local_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (student_id, timestamp, ATTENDANCE_TYPES[event_type], ts, local_date))
+
+        # Log de Acesso (para notificações do app do responsável)
+        log_id = conn.execute('''
+            INSERT INTO access_logs (student_id, event_type, timestamp, notified_guardian, ts, local_date)
+            VALUES (?, ?, ?, 0, ?, ?)
+        ''', (student_id, event_type, timestamp, ts, local_date)).lastrowid
+        return log_id
+
+    # Group commit com as outras gravações da escola; retorna depois do COMMIT
+    log_id = write_school(school_id, write)
+    publish_access_log(db, school_id, log_id)
+    publish_presence(school_id, student_id, event_type, ts, local_date)
+    return timestamp
+
+
 @attendance_bp.route('/api/attendance/arrival', methods=['POST'])
 @token_required
 def register_arrival():
@@ -25,20 +58,8 @@ def register_arrival():
     if not student:
         return jsonify({'message': 'Aluno não encontrado'}), 404
         
-    # 2. Registrar presença
-    timestamp = datetime.datetime.now().isoformat()
-    cur.execute('''
-        INSERT INTO attendance (student_id, timestamp, type)
-        VALUES (?, ?, 'arrival')
-    ''', (student_id, timestamp))
-    
-    # 3. Registrar Log de Acesso (para notificações do app do responsável)
-    cur.execute('''
-        INSERT INTO access_logs (student_id, event_type, timestamp, notified_guardian)
-        VALUES (?, 'arrival', ?, 0)
-    ''', (student_id, timestamp))
-    
-    db.commit()
+    # 2. Registrar presença e log de acesso
+    timestamp = record_access(db, school_id, student_id, 'arrival')
     
     return jsonify({
         'success': True,
@@ -66,18 +87,7 @@ def register_departure():
     if not student:
         return jsonify({'message': 'Aluno não encontrado'}), 404
         
-    timestamp = datetime.datetime.now().isoformat()
-    cur.execute('''
-        INSERT INTO attendance (student_id, timestamp, type)
-        VALUES (?, ?, 'departure')
-    ''', (student_id, timestamp))
-    
-    cur.execute('''
-        INSERT INTO access_logs (student_id, event_type, timestamp, notified_guardian)
-        VALUES (?, 'departure', ?, 0)
-    ''', (student_id, timestamp))
-    
-    db.commit()
+    timestamp = record_access(db, school_id, student_id, 'departure')
 
     return jsonify({
         'success': True,
@@ -99,3 +109,111 @@ def register_attendance_generic():
         return register_departure()
     
     return jsonify({'message': 'Evento inválido'}), 400
+
+
+def ingest_batch_response(school_id):
+    """Lote {"events": [...]} (ou a lista direto) -> resultado por evento (ver attendance_helpers)"""
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else data
+    if not isinstance(events, list) or not events:
+        return jsonify({'message': 'Envie uma lista de eventos em "events"'}), 400
+    if len(events) > MAX_BATCH_EVENTS:
+        return jsonify({'message': f'Máximo de {MAX_BATCH_EVENTS} eventos por lote'}), 413
+
+    db = get_school_db(school_id)
+    return jsonify({'success': True, **ingest_events(db, school_id, events)})
+
+
+@attendance_bp.route('/api/attendance/batch', methods=['POST'])
+@token_required
+def register_attendance_batch():
+    # Portaria/tablet: rajadas de entradas com idempotency_key por evento
+    school_id = g.user.get('school_id') or g.user.get('id')
+    if not school_id:
+        return jsonify({'message': 'Escola não identificada'}), 400
+    return ingest_batch_response(school_id)
+
+
+def is_recognition_service():
+    return bool(RECOGNITION_SERVICE_TOKEN) and request.headers.get('X-Service-Token') == RECOGNITION_SERVICE_TOKEN
+
+
+@attendance_bp.route('/api/school/<int:school_id>/students/embeddings', methods=['GET'])
+def get_student_embeddings(school_id):
+    """Rostos da escola para o serviço de reconhecimento.
+
+    ?since=<versão> traz só o que mudou; ?format=binary manda os descritores
+    como BLOB em base64 (face_descriptors.py) em vez de texto JSON.
+    """
+    if not is_recognition_service():
+        return jsonify({'message': 'Token de serviço inválido'}), 403
+
+    since = request.args.get('since', 0, type=int)
+    binary = request.args.get('format') == 'binary'
+    db = get_school_db(school_id)
+    return jsonify(changed_faces(db, since, binary))
+
+
+@attendance_bp.route('/api/recognition/cameras', methods=['GET'])
+def get_recognition_cameras():
+    """Câmeras ativas (com credenciais) para os leitores do serviço de reconhecimento"""
+    if not is_recognition_service():
+        return jsonify({'message': 'Token de serviço inválido'}), 403
+
+    rows = get_system_db().execute('''
+        SELECT id, school_id, camera_name, camera_purpose, camera_ip, camera_url, camera_port,
+               camera_username, camera_password
+        FROM cameras
+        WHERE status = 'active'
+    ''').fetchall()
+    return jsonify([dict(row) for row in rows])
+
+
+@attendance_bp.route('/api/school/<int:school_id>/attendance', methods=['POST'])
+def register_recognition_entry(school_id):
+    """Entrada/saída enviada pelo serviço de reconhecimento facial (register_entry)"""
+    if not is_recognition_service():
+        return jsonify({'message': 'Token de serviço inválido'}), 403
+
+    data = request.json or {}
+    student_id = data.get('student_id')
+    # O serviço usa entry/exit; o restante do sistema usa arrival/departure
+    event_type = {'entry': 'arrival', 'exit': 'departure'}.get(data.get('type'), data.get('type'))
+
+    if event_type not in ('arrival', 'departure'):
+        return jsonify({'message': 'Evento inválido'}), 400
+
+    db = get_school_db(school_id)
+    student = db.execute('SELECT name FROM students WHERE id = ?', (student_id,)).fetchone()
+    if not student:
+        return jsonify({'message': 'Aluno não encontrado'}), 404
+
+    # Com Idempotency-Key a retentativa do serviço não duplica a entrada
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key:
+        result = ingest_events(db, school_id, [{
+            'idempotency_key': idempotency_key,
+            'student_id': student_id,
+            'type': event_type,
+            'timestamp': data.get('timestamp'),
+        }])['results'][0]
+        if result['status'] == 'error':
+            return jsonify({'message': result['error']}), 400
+        return jsonify({
+            'success': True,
+            'student': student['name'],
+            'timestamp': result.get('timestamp'),
+            'duplicate': result['status'] == 'duplicate',
+        })
+
+    timestamp = record_access(db, school_id, student_id, event_type)
+
+    return jsonify({'success': True, 'student': student['name'], 'timestamp': timestamp})
+
+
+@attendance_bp.route('/api/school/<int:school_id>/attendance/batch', methods=['POST'])
+def register_recognition_batch(school_id):
+    """Lote de entradas/saídas do serviço de reconhecimento ou de uma estação de câmera"""
+    if not is_recognition_service():
+        return jsonify({'message': 'Token de serviço inválido'}), 403
+    return ingest_batch_response(school_id)
@@ -0,0 +1,124 @@
+"""
+Gravação em lote de presenças (POST /api/attendance/batch e a rota do serviço
+de reconhecimento).
+
+Cada evento traz uma idempotency_key gerada pelo cliente (portaria, câmera).
+A chave fica em attendance.idempotency_key (índice único, migração 7): o
+reenvio de um lote que já entrou, por Wi-Fi instável na portaria, volta como
+'duplicate' em vez de contar a presença de novo. Todos os alunos do lote são
+conferidos em uma consulta e as linhas de attendance + access_logs são
+gravadas em uma única transação, pelo escritor da escola (school_writer.py).
+"""
+from notifications import publish_access_log, publish_presence
+from school_writer import write_school
+from timestamps import stamp, school_tz
+
+MAX_BATCH_EVENTS = 500
+MAX_KEY_LENGTH = 200
+
+# O serviço de reconhecimento usa entry/exit; o restante do sistema usa arrival/departure
+EVENT_TYPES = {'arrival': 'arrival', 'departure': 'departure', 'entry': 'arrival', 'exit': 'departure'}
+
+# attendance.type segue o esquema original (CHECK type IN ('entry', 'exit') nos bancos
+# existentes, e é o que o frontend filtra); access_logs.event_type usa arrival/departure
+ATTENDANCE_TYPES = {'arrival': 'entry', 'departure': 'exit'}
+
+
+def _student_id(value):
+    if isinstance(value, bool):
+        raise ValueError
+    return int(value)
+
+
+def ingest_events(db, school_id, events):
+    """Grava um lote de eventos {idempotency_key, student_id, type, timestamp?}.
+
+    Retorna {'results': [...], 'created', 'duplicates', 'errors'}, com um
+    resultado por evento, na ordem recebida: status 'created', 'duplicate'
+    (chave já gravada, antes ou no próprio lote) ou 'error'.
+    """
+    tz = school_tz(school_id)
+    now = stamp(tz=tz)
+    results = [None] * len(events)
+    pending = []  # (índice, chave, aluno, tipo, (timestamp, ts, local_date))
+    seen = {}  # chave -> índice do primeiro evento do lote com ela
+
+    for i, event in enumerate(events):
+        key = event.get('idempotency_key') if isinstance(event, dict) else None
+        result = results[i] = {'index': i, 'idempotency_key': key}
+        if not key or not isinstance(key, str) or len(key) > MAX_KEY_LENGTH:
+            result.update(status='error', error='idempotency_key obrigatória (texto de até 200 caracteres)')
+            continue
+        event_type = EVENT_TYPES.get(event.get('type') or event.get('event_type'))
+        if event_type is None:
+            result.update(status='error', error='Evento inválido')
+            continue
+        try:
+            student_id = _student_id(event.get('student_id'))
+        except (TypeError, ValueError):
+            result.update(status='error', error='student_id inválido')
+            continue
+        try:
+            timestamp = stamp(event['timestamp'], tz) if event.get('timestamp') else now
+        except ValueError:
+            result.update(status='error', error='timestamp inválido')
+            continue
+        if key in seen:
+            result.update(status='duplicate', duplicate_of=seen[key])
+            continue
+        seen[key] = i
+        pending.append((i, key, student_id, event_type, timestamp))
+
+    if pending:
+        student_ids = sorted({p[2] for p in pending})
+        names = dict(db.execute(
+            f'SELECT id, name FROM students WHERE id IN ({",".join("?" * len(student_ids))})', student_ids
+        ).fetchall())
+        keys = [p[1] for p in pending]
+        existing = {row['idempotency_key']: row for row in db.execute(f'''
+            SELECT id, idempotency_key, timestamp FROM attendance
+            WHERE idempotency_key IN ({",".join("?" * len(keys))})
+        ''', keys).fetchall()}
+
+        def write(conn):
+            written = []  # (log_id, aluno, tipo, ts, local_date)
+            for i, key, student_id, event_type, (timestamp, ts, local_date) in pending:
+                result = results[i]
+                if key in existing:
+                    row = existing[key]
+                    result.update(status='duplicate', attendance_id=row['id'], timestamp=row['timestamp'])
+                    continue
+                if student_id not in names:
+                    result.update(status='error', error='Aluno não encontrado')
+                    continue
+                cur = conn.execute('''
+                    INSERT INTO attendance (student_id, timestamp, type, idempotency_key, ts, local_date)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+                ''', (student_id, timestamp, ATTENDANCE_TYPES[event_type], key, ts, local_date))
+                if cur.rowcount == 0:
+                    # gravado por outra requisição concorrente com a mesma chave
+                    result.update(status='duplicate')
+                    continue
+                attendance_id = cur.lastrowid
+                cur = conn.execute('''
+                    INSERT INTO access_logs (student_id, event_type, timestamp, notified_guardian, ts, local_date)
+                    VALUES (?, ?, ?, 0, ?, ?)
+                ''', (student_id, event_type, timestamp, ts, local_date))
+                written.append((cur.lastrowid, student_id, event_type, ts, local_date))
+                result.update(status='created', attendance_id=attendance_id, student=names[student_id],
+                              timestamp=timestamp)
+            return written
+
+        # Uma transação para o lote todo, junto das outras gravações da escola (school_writer.py)
+        for log_id, student_id, event_type, ts, local_date in write_school(school_id, write):
+            publish_access_log(db, school_id, log_id)
+            publish_presence(school_id, student_id, event_type, ts, local_date)
+
+    statuses = [r['status'] for r in results]
+    return {
+        'results': results,
+        'created': statuses.count('created'),
+        'duplicates': statuses.count('duplicate'),
+        'errors': statuses.count('error'),
+    }
@@ -55,11 +55,8 @@ def login():
         cur.execute('SELECT * FROM guardians WHERE email = ?', (email,))
         user = cur.fetchone()
         if user:
-            # Check if role column exists and uses it, otherwise default to guardian
-            if 'role' in user.keys() and user['role']:
-                role = user['role']
-            else:
-                role = 'guardian'
+            # guardians.role é garantida pela migração 2 do system.db
+            role = user['role'] or 'guardian'
             
     if not user:
         return jsonify({'message': 'Usuário não encontrado'}), 400
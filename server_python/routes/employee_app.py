@@ -1,31 +1,33 @@
 from flask import Blueprint, request, jsonify, g
 from .auth import token_required
 from database import get_system_db, get_school_db
+from school_fanout import for_each_school
+from face_descriptors import serialize_face_fields
+from timestamps import stamp, school_tz
 import sqlite3
 import json
-import datetime
 
 employee_bp = Blueprint('employee_app', __name__)
 
 def find_employee_by_guardian_id(guardian_id):
-    # Itera sobre todas as escolas para achar o funcionário vinculado a este login
+    # Procura em todas as escolas (em paralelo) o funcionário vinculado a este login
     sys_db = get_system_db()
     schools = sys_db.execute('SELECT id, name, latitude, longitude FROM schools').fetchall()
     
+    found = for_each_school(
+        [school['id'] for school in schools],
+        lambda db, school_id: db.execute('SELECT * FROM employees WHERE guardian_id = ?', (guardian_id,)).fetchone()
+    )
+    
     for school in schools:
-        try:
-            s_db = get_school_db(school['id'])
-            # Verifica se tem coluna guardian_id (já fizemos migração)
-            emp = s_db.execute('SELECT * FROM employees WHERE guardian_id = ?', (guardian_id,)).fetchone()
-            if emp:
-                emp_dict = dict(emp)
-                emp_dict['school_id'] = school['id']
-                emp_dict['school_name'] = school['name']
-                emp_dict['school_lat'] = school['latitude']
-                emp_dict['school_lng'] = school['longitude']
-                return emp_dict
-        except Exception as e:
-            continue
+        emp = found.results.get(school['id'])
+        if emp:
+            emp_dict = serialize_face_fields(dict(emp))
+            emp_dict['school_id'] = school['id']
+            emp_dict['school_name'] = school['name']
+            emp_dict['school_lat'] = school['latitude']
+            emp_dict['school_lng'] = school['longitude']
+            return emp_dict
             
     return None
 
@@ -64,39 +66,16 @@ def register_clock():
     lat = data.get('latitude')
     lng = data.get('longitude')
     photo = data.get('photo') # Base64 da foto tirada na hora
-    timestamp = datetime.datetime.now()
+    timestamp, ts, local_date = stamp(tz=school_tz(school_id))
     
     db = get_school_db(school_id)
     
-    # Salvar na tabela employee_attendance
-    # Preciso criar essa tabela se não existir? 
-    # Vou assumir que não existe e tratar no try/catch ou criar na hora.
-    
-    try:
-        db.execute('''
-            INSERT INTO employee_attendance (employee_id, type, timestamp, latitude, longitude, photo_url, verified)
-            VALUES (?, ?, ?, ?, ?, ?, 1)
-        ''', (emp_id, type_, timestamp, lat, lng, photo)) # photo aqui salvando base64 direto? Melhor salvar URL mas tempo é curto. Vou salvar string 'base64...'
-        db.commit()
-    except sqlite3.OperationalError:
-        # Tabela não existe, criar
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS employee_attendance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER,
-                type TEXT, -- clock_in, lunch_out, etc
-                timestamp DATETIME,
-                latitude REAL,
-                longitude REAL,
-                photo_url TEXT,
-                verified INTEGER DEFAULT 0
-            )
-        ''')
-        db.execute('''
-            INSERT INTO employee_attendance (employee_id, type, timestamp, latitude, longitude, photo_url, verified)
-            VALUES (?, ?, ?, ?, ?, ?, 1)
-        ''', (emp_id, type_, timestamp, lat, lng, photo))
-        db.commit()
+    # Colunas de ponto (type, latitude, ...) garantidas pela migração 2 das escolas
+    db.execute('''
+        INSERT INTO employee_attendance (employee_id, type, timestamp, latitude, longitude, photo_url, verified, ts, local_date)
+        VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+    ''', (emp_id, type_, timestamp, lat, lng, photo, ts, local_date)) # photo aqui salvando base64 direto? Melhor salvar URL mas tempo é curto. Vou salvar string 'base64...'
+    db.commit()
         
     return jsonify({'success': True, 'message': 'Ponto registrado com sucesso!'})
 
@@ -113,7 +92,7 @@ def get_history():
         rows = db.execute('''
             SELECT * FROM employee_attendance 
             WHERE employee_id = ? 
-            ORDER BY timestamp DESC
+            ORDER BY ts DESC
             LIMIT 50
         ''', (employee['id'],)).fetchall()
         return jsonify([dict(r) for r in rows])
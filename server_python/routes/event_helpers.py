@@ -0,0 +1,83 @@
+"""
+Versão da agenda de eventos de cada escola (tabela data_versions do school_*.db).
+
+Triggers na tabela events (migração 14) incrementam a versão na mesma
+transação de qualquer escrita, inclusive do servidor Node. O stream de eventos
+do responsável só relê uma escola quando a versão dela muda, e só confere a
+versão quando recebe events_changed no canal school-events:<id> do hub:
+
+    - as rotas de eventos publicam depois do commit (publish_events_changed);
+    - events_watcher, uma thread por processo, lê a versão de cada escola com
+      stream aberto a cada EVENTS_VERSION_POLL_SECONDS e avisa os streams
+      locais quando ela muda (gravações do Node, de outros workers).
+"""
+import os
+import threading
+import time
+
+from database import _connect_school_db
+from notifications import hub, school_events_channel
+
+EVENTS_VERSION_KEY = 'events'
+
+EVENTS_VERSION_POLL_SECONDS = float(os.environ.get('EVENTS_VERSION_POLL_SECONDS', '5'))
+
+
+def get_events_version(db):
+    row = db.execute('SELECT version FROM data_versions WHERE name = ?', (EVENTS_VERSION_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+class EventsVersionWatcher:
+    """Uma leitura de data_versions por escola por intervalo, não importa quantos streams ela tenha."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watched = {}  # school_id -> quantidade de streams
+        self._versions = {}  # school_id -> última versão vista
+        self._conns = {}  # school_id -> conexão da thread
+        self._thread = None
+
+    def watch(self, school_ids):
+        with self._lock:
+            for school_id in school_ids:
+                self._watched[school_id] = self._watched.get(school_id, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='events-version-watcher', daemon=True)
+                self._thread.start()
+
+    def unwatch(self, school_ids):
+        with self._lock:
+            for school_id in school_ids:
+                count = self._watched.get(school_id, 0) - 1
+                if count > 0:
+                    self._watched[school_id] = count
+                else:
+                    self._watched.pop(school_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = list(self._watched)
+            for school_id in set(self._conns) - set(watched):
+                self._conns.pop(school_id).close()
+                self._versions.pop(school_id, None)
+            for school_id in watched:
+                try:
+                    conn = self._conns.get(school_id)
+                    if conn is None:
+                        conn = self._conns[school_id] = _connect_school_db(school_id)
+                    version = get_events_version(conn)
+                except Exception as e:
+                    print(f"Erro ao ler a versão dos eventos da escola {school_id}: {e}")
+                    continue
+                # Primeira leitura também avisa: o stream compara com a versão do próprio snapshot
+                if self._versions.get(school_id) != version:
+                    self._versions[school_id] = version
+                    hub.publish_local(school_events_channel(school_id),
+                                      {'type': 'events_changed', 'school_id': int(school_id)})
+
+
+events_watcher = EventsVersionWatcher(EVENTS_VERSION_POLL_SECONDS)
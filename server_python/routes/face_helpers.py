@@ -0,0 +1,88 @@
+"""
+Versão dos rostos de cada escola, para o cache de embeddings do serviço de
+reconhecimento facial (facial-recognition/embeddings_cache.py).
+
+Toda escrita que muda a galeria (criar/editar/excluir aluno, trocar a
+biometria) incrementa data_versions['faces'] na mesma transação e carimba o
+aluno com a nova versão (students.face_version) ou registra a remoção em
+face_removals. Assim o serviço busca só o que mudou desde a versão que já tem.
+Funcionários (poucos por escola) vão sempre completos em 'employees'.
+"""
+from face_descriptors import descriptor_base64, descriptor_json
+
+FACES_VERSION_KEY = 'faces'
+
+
+def _bump_faces_version(db):
+    db.execute('''
+        INSERT INTO data_versions (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    ''', (FACES_VERSION_KEY,))
+    return get_faces_version(db)
+
+
+def get_faces_version(db):
+    row = db.execute('SELECT version FROM data_versions WHERE name = ?', (FACES_VERSION_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+def touch_student_face(db, student_id):
+    """Marca o aluno como alterado na galeria (o commit fica por conta de quem chamou)."""
+    version = _bump_faces_version(db)
+    db.execute('UPDATE students SET face_version = ? WHERE id = ?', (version, student_id))
+    db.execute('DELETE FROM face_removals WHERE student_id = ?', (student_id,))
+    return version
+
+
+def record_face_removal(db, student_id):
+    """Registra a saída do aluno da galeria (o commit fica por conta de quem chamou)."""
+    version = _bump_faces_version(db)
+    db.execute('''
+        INSERT INTO face_removals (student_id, version) VALUES (?, ?)
+        ON CONFLICT(student_id) DO UPDATE SET version = excluded.version
+    ''', (student_id, version))
+    return version
+
+
+def _serialize_descriptors(rows, binary):
+    encode = descriptor_base64 if binary else descriptor_json
+    for row in rows:
+        row['face_descriptor'] = encode(row['face_descriptor'])
+    return rows
+
+
+def changed_faces(db, since=0, binary=False):
+    """Rostos alterados depois de `since` (0 = galeria completa).
+
+    Retorna {'version', 'full', 'students', 'removed', 'employees'}; alunos
+    sem descritor entram em removed (a biometria pode ter sido apagada).
+    Descritores em texto JSON, ou BLOB em base64 com binary=True.
+    """
+    # versão lida antes dos dados: uma escrita concorrente aparece de novo na próxima busca
+    version = get_faces_version(db)
+    full = not since
+    rows = db.execute(f'''
+        SELECT id, name, face_descriptor, phone AS guardian_phone, class_name
+        FROM students
+        {'' if full else 'WHERE face_version > ?'}
+    ''', () if full else (since,)).fetchall()
+
+    students = [dict(row) for row in rows if row['face_descriptor']]
+    removed = [row['id'] for row in rows if not row['face_descriptor']]
+    if not full:
+        removed += [row[0] for row in db.execute(
+            'SELECT student_id FROM face_removals WHERE version > ?', (since,)
+        ).fetchall()]
+
+    employees = [dict(row) for row in db.execute('''
+        SELECT id, name, face_descriptor FROM employees
+        WHERE face_descriptor IS NOT NULL AND face_descriptor != ''
+    ''').fetchall()]
+
+    return {
+        'version': version,
+        'full': full,
+        'students': _serialize_descriptors(students, binary),
+        'removed': removed,
+        'employees': _serialize_descriptors(employees, binary),
+    }
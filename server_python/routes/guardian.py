@@ -1,15 +1,27 @@
 from flask import Blueprint, request, jsonify, g, Response
 from .auth import token_required, SECRET_KEY
-from database import get_system_db, get_school_db, SYSTEM_DB_PATH
+from database import get_system_db, get_school_db, SYSTEM_DB_PATH, prefix_range
+from .guardian_helpers import get_guardian_schools, link_guardian_school, get_notification_cursors, save_notification_cursor
 import json
 import time
 import bcrypt
 import datetime
 import jwt
 import sqlite3
+import queue
+from notifications import hub, guardian_channel, school_events_channel
+from .event_helpers import get_events_version, events_watcher
+from school_fanout import for_each_school
+from timestamps import format_local, school_tz
 
 guardian_bp = Blueprint('guardian', __name__)
 
+# Comentário SSE enviado quando não há notificações, para detectar clientes desconectados
+SSE_KEEPALIVE_SECONDS = 15
+# Conferência da versão dos eventos de todas as escolas, só quando o broker entre workers está falhando
+# (normalmente o stream só relê ao receber events_changed, ver routes/event_helpers.py)
+EVENTS_RECHECK_SECONDS = 30
+
 @guardian_bp.route('/api/guardian/login', methods=['POST', 'OPTIONS'])
 @guardian_bp.route('/api/guardian/auth/login', methods=['POST', 'OPTIONS'])
 def login():
@@ -85,7 +97,7 @@ def login():
     token = jwt.encode({
         'id': guardian['id'],
         'email': guardian['email'],
-        'role': dict(guardian).get('role', 'guardian'),
+        'role': guardian['role'] or 'guardian',
         'exp': datetime.datetime.utcnow() + datetime.timedelta(days=30)
     }, SECRET_KEY, algorithm='HS256')
     
@@ -156,43 +168,28 @@ def register():
 @token_required
 def get_students():
     guardian_id = g.user.get('id')
-    sys_db = get_system_db()
+    schools = get_guardian_schools(guardian_id)
     
-    schools_cur = sys_db.cursor()
-    # Adicionado latitude e longitude
-    schools_cur.execute('SELECT id, name, latitude, longitude FROM schools')
-    schools = schools_cur.fetchall()
+    def query(school_db, school_id):
+        return [dict(row) for row in school_db.execute('''
+            SELECT s.id, s.name, s.photo_url, s.class_name, sg.linked_at
+            FROM students s
+            JOIN student_guardians sg ON s.id = sg.student_id
+            WHERE sg.guardian_id = ?
+        ''', (guardian_id,)).fetchall()]
     
-    all_students = []
+    fan = for_each_school([school['id'] for school in schools], query)
     
+    all_students = []
     for school in schools:
-        school_db = None
-        try:
-            school_db = get_school_db(school['id'])
-            cur = school_db.cursor()
-            
-            cur.execute('''
-                SELECT s.id, s.name, s.photo_url, s.class_name, sg.linked_at
-                FROM students s
-                JOIN student_guardians sg ON s.id = sg.student_id
-                WHERE sg.guardian_id = ?
-            ''', (guardian_id,))
-            
-            rows = cur.fetchall()
-            for row in rows:
-                student_data = dict(row)
-                student_data['school_id'] = school['id']
-                student_data['school_name'] = school['name']
-                student_data['latitude'] = school['latitude']
-                student_data['longitude'] = school['longitude']
-                all_students.append(student_data)
-                
-        except Exception as e:
-            continue
-        finally:
-            if school_db: school_db.close()
+        for student_data in fan.results.get(school['id'], []):
+            student_data['school_id'] = school['id']
+            student_data['school_name'] = school['name']
+            student_data['latitude'] = school['latitude']
+            student_data['longitude'] = school['longitude']
+            all_students.append(student_data)
             
-    return jsonify({'success': True, 'data': {'students': all_students}})
+    return jsonify({'success': True, 'data': {'students': all_students}, 'school_errors': fan.report()})
 
 @guardian_bp.route('/api/guardian/pickup', methods=['POST'])
 @token_required
@@ -233,45 +230,15 @@ def request_pickup():
 def check_notifications():
     """Endpoint de polling para verificar novas notificações"""
     guardian_id = g.user.get('id')
-    sys_db = get_system_db()
-    
-    schools_cur = sys_db.cursor()
-    schools_cur.execute('SELECT id, name FROM schools')
-    schools = schools_cur.fetchall()
+    cursor = NotificationCursor(guardian_id)
     
+    # Uma notificação por vez, na ordem em que aconteceram; o cursor avança junto
     notification = None
-    
-    for school in schools:
-        school_db = None
-        try:
-            school_db = get_school_db(school['id'])
-            cur = school_db.cursor()
-            
-            # Buscar apenas notificações não lidas
-            cur.execute('''
-                SELECT al.id, al.student_id, s.name as student_name, s.photo_url, al.event_type, al.timestamp
-                FROM access_logs al
-                JOIN students s ON al.student_id = s.id
-                JOIN student_guardians sg ON s.id = sg.student_id
-                WHERE sg.guardian_id = ? AND al.notified_guardian = 0
-                ORDER BY al.timestamp DESC LIMIT 1
-            ''', (guardian_id,))
-            
-            row = cur.fetchone()
-            if row:
-                notification = dict(row)
-                notification['school_id'] = school['id']
-                notification['school_name'] = school['name']
-                
-                # Marcar como notificado
-                cur.execute('UPDATE access_logs SET notified_guardian = 1 WHERE id = ?', (notification['id'],))
-                school_db.commit()
-                break  # Retorna apenas uma notificação por vez
-                
-        except Exception as e:
-            continue
-        finally:
-            if school_db: school_db.close()
+    for n in cursor.pending(limit=1):
+        notification = n
+        cursor.advance(n)
+        cursor.save(n)
+        break
     
     return jsonify({'notification': notification})
 
@@ -279,43 +246,274 @@ def check_notifications():
 @token_required
 def get_notifications():
     guardian_id = g.user.get('id')
-    sys_db = get_system_db()
+    schools = get_guardian_schools(guardian_id)
     
-    schools_cur = sys_db.cursor()
-    schools_cur.execute('SELECT id, name FROM schools')
-    schools = schools_cur.fetchall()
+    # Mostra histórico (independente do cursor de entrega)
+    def query(school_db, school_id):
+        return [dict(row) for row in school_db.execute('''
+            SELECT al.id, al.student_id, s.name as student_name, al.event_type, al.timestamp
+            FROM access_logs al
+            JOIN students s ON al.student_id = s.id
+            JOIN student_guardians sg ON s.id = sg.student_id
+            WHERE sg.guardian_id = ?
+            ORDER BY al.timestamp DESC LIMIT 20
+        ''', (guardian_id,)).fetchall()]
     
-    all_notifs = []
+    fan = for_each_school([school['id'] for school in schools], query)
     
+    all_notifs = []
     for school in schools:
-        school_db = None
-        try:
-            school_db = get_school_db(school['id'])
-            cur = school_db.cursor()
+        for n in fan.results.get(school['id'], []):
+            n['school_id'] = school['id']
+            n['school_name'] = school['name']
+            n['read'] = False 
+            all_notifs.append(n)
             
-            # Mostra histórico (sem filtro de notified_guardian)
-            cur.execute('''
-                SELECT al.id, al.student_id, s.name as student_name, al.event_type, al.timestamp
-                FROM access_logs al
-                JOIN students s ON al.student_id = s.id
-                JOIN student_guardians sg ON s.id = sg.student_id
-                WHERE sg.guardian_id = ?
-                ORDER BY al.timestamp DESC LIMIT 20
-            ''', (guardian_id,))
+    return jsonify({'success': True, 'data': {'notifications': all_notifs}, 'school_errors': fan.report()})
+
+def _school_name(school_id):
+    sys_db = sqlite3.connect(SYSTEM_DB_PATH)
+    try:
+        row = sys_db.execute('SELECT name FROM schools WHERE id = ?', (school_id,)).fetchone()
+        return row[0] if row else f'Escola {school_id}'
+    finally:
+        sys_db.close()
+
+def _last_access_log_id(school_id):
+    school_db = get_school_db(school_id)
+    try:
+        return school_db.execute('SELECT COALESCE(MAX(id), 0) FROM access_logs').fetchone()[0]
+    finally:
+        school_db.close()
+
+def _parse_event_id(value):
+    """'14:289,15:12' -> {14: 289, 15: 12}; partes inválidas são ignoradas."""
+    positions = {}
+    for part in (value or '').split(','):
+        school_id, _, log_id = part.strip().partition(':')
+        if school_id.isdigit() and log_id.isdigit():
+            positions[int(school_id)] = int(log_id)
+    return positions
+
+class NotificationCursor:
+    """Posição de entrega das notificações de um responsável: último access_log por escola.
+
+    O id de cada evento SSE leva o vetor inteiro ("14:289,15:12"); o navegador
+    devolve esse valor em Last-Event-ID ao reconectar e a entrega continua
+    exatamente dali. Sem Last-Event-ID vale o cursor salvo no system.db.
+    """
+
+    def __init__(self, guardian_id, last_event_id=None):
+        self.guardian_id = guardian_id
+        sys_db = sqlite3.connect(SYSTEM_DB_PATH)
+        sys_db.row_factory = sqlite3.Row
+        try:
+            self.school_names = {s['id']: s['name'] for s in get_guardian_schools(guardian_id, sys_db)}
+            self.positions = get_notification_cursors(guardian_id, sys_db)
+            for school_id in self.school_names:
+                if school_id not in self.positions:
+                    # Vínculo sem cursor: começa do fim, sem reenviar o histórico da escola
+                    self.positions[school_id] = _last_access_log_id(school_id)
+                    save_notification_cursor(guardian_id, school_id, self.positions[school_id], sys_db)
+        finally:
+            sys_db.close()
+        self.positions.update(_parse_event_id(last_event_id))
+
+    @property
+    def event_id(self):
+        return ','.join(f'{school_id}:{log_id}' for school_id, log_id in sorted(self.positions.items()))
+
+    def pending(self, school_ids=None, limit=None):
+        """access_logs depois do cursor (busca por faixa de id, sem escrita)."""
+        notifications = []
+        for school_id in (school_ids or list(self.school_names)):
+            school_db = None
+            try:
+                school_db = get_school_db(school_id)
+                rows = school_db.execute('''
+                    SELECT al.id, al.student_id, s.name as student_name, s.photo_url, al.event_type, al.timestamp
+                    FROM access_logs al
+                    JOIN students s ON al.student_id = s.id
+                    WHERE al.id > ?
+                      AND al.student_id IN (SELECT student_id FROM student_guardians WHERE guardian_id = ?)
+                    ORDER BY al.id
+                    LIMIT ?
+                ''', (self.positions.get(school_id, 0), self.guardian_id, limit or -1)).fetchall()
+            except Exception as e:
+                print(f"Erro ao buscar notificações pendentes da escola {school_id}: {e}")
+                continue
+            finally:
+                if school_db: school_db.close()
             
-            rows = cur.fetchall()
             for row in rows:
                 n = dict(row)
-                n['school_id'] = school['id']
-                n['school_name'] = school['name']
-                n['read'] = False 
-                all_notifs.append(n)
-        except:
+                n['school_id'] = school_id
+                n['school_name'] = self.school_names.get(school_id, f'Escola {school_id}')
+                notifications.append(n)
+        return notifications
+
+    def on_message(self, n):
+        """Mensagem do hub: relê a faixa da escola (pega também o que o hub tenha descartado)."""
+        school_id = n['school_id']
+        if school_id not in self.school_names:
+            # Vinculado depois da conexão
+            self.school_names[school_id] = _school_name(school_id)
+            self.positions.setdefault(school_id, n['id'] - 1)
+        return self.pending([school_id])
+
+    def advance(self, n):
+        """Move o cursor em memória para depois de n e devolve o id SSE correspondente."""
+        self.positions[n['school_id']] = max(self.positions.get(n['school_id'], 0), n['id'])
+        return self.event_id
+
+    def save(self, n):
+        sys_db = sqlite3.connect(SYSTEM_DB_PATH)
+        try:
+            save_notification_cursor(self.guardian_id, n['school_id'], n['id'], sys_db)
+        finally:
+            sys_db.close()
+
+def _sse_notification(n, event_id):
+    return f"id: {event_id}\ndata: {json.dumps({'type': 'notification', 'data': n})}\n\n"
+
+def _drain_notifications(inbox, seconds, cursor):
+    """Entrega as notificações que chegarem pelo hub durante até `seconds` segundos.
+
+    Retorna antes do prazo, com o id da escola, se ela avisar que os eventos mudaram.
+    """
+    deadline = time.monotonic() + seconds
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        try:
+            msg = inbox.get(timeout=remaining)
+        except queue.Empty:
+            return
+        if msg['type'] == 'events_changed':
+            return msg['school_id']
+        for n in cursor.on_message(msg['data']):
+            yield _sse_notification(n, cursor.advance(n))
+            cursor.save(n)
+
+def _stream_last_event_id():
+    # EventSource reenvia o header sozinho; ?lastEventId= serve para quem recria a conexão
+    return request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+
+def _stream_guardian_id(token):
+    """Responsável do token enviado pelo EventSource (query param ?token=); None se inválido."""
+    try:
+        data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        return data['id']
+    except:
+        return None
+
+def _stream_channels(guardian_id):
+    """Canais do stream de eventos: notificações do responsável + agenda de cada escola."""
+    sys_db = sqlite3.connect(SYSTEM_DB_PATH)
+    sys_db.row_factory = sqlite3.Row
+    try:
+        schools = get_guardian_schools(guardian_id, sys_db)
+    finally:
+        sys_db.close()
+    return [guardian_channel(guardian_id)] + [school_events_channel(s['id']) for s in schools]
+
+def _school_events(school_db, guardian_id, school_id, school_name):
+    """(versão, {event_id: evento}) da escola, só com os eventos relevantes para os alunos do responsável."""
+    # Versão lida antes dos eventos: uma escrita no meio só causa uma releitura a mais
+    version = get_events_version(school_db)
+    
+    class_names = {s['class_name'] for s in school_db.execute('''
+        SELECT s.class_name
+        FROM students s
+        JOIN student_guardians sg ON s.id = sg.student_id
+        WHERE sg.guardian_id = ?
+    ''', (guardian_id,)).fetchall()}
+    if not class_names:
+        return version, {}
+    
+    events = {}
+    for event in school_db.execute('SELECT * FROM events ORDER BY event_date ASC').fetchall():
+        event_dict = dict(event)
+        # Eventos sem turma valem para todos
+        if event_dict.get('class_name') and event_dict['class_name'] not in class_names:
             continue
+        event_dict['school_id'] = school_id
+        event_dict['school_name'] = school_name
+        events[event_dict['id']] = event_dict
+    return version, events
+
+def _guardian_school_events(guardian_id, school_names):
+    """_school_events de todas as escolas em paralelo (FanOutResult)."""
+    return for_each_school(
+        list(school_names),
+        lambda school_db, school_id: _school_events(school_db, guardian_id, school_id, school_names[school_id])
+    )
+
+def _sort_events(events):
+    return sorted(events, key=lambda x: x.get('event_date') or '9999-12-31')
+
+class GuardianEventsView:
+    """Eventos já enviados a um stream, por escola, com a versão em que foram lidos.
+
+    refresh() só relê a escola cuja versão (data_versions) mudou e devolve o
+    que mudou: added / updated / removed. Enquanto a view existe, as escolas
+    dela ficam em events_watcher; chame close() ao encerrar o stream.
+    """
+
+    def __init__(self, guardian_id):
+        self.guardian_id = guardian_id
+        self.versions = {}
+        self.events = {}  # school_id -> {event_id: evento}
+        sys_db = sqlite3.connect(SYSTEM_DB_PATH)
+        sys_db.row_factory = sqlite3.Row
+        try:
+            self.school_names = {s['id']: s['name'] for s in get_guardian_schools(guardian_id, sys_db)}
         finally:
-            if school_db: school_db.close()
+            sys_db.close()
+        events_watcher.watch(self.school_names)
+
+    def close(self):
+        events_watcher.unwatch(self.school_names)
+
+    def snapshot(self):
+        """Lista completa (mensagem 'events' da conexão)."""
+        fan = _guardian_school_events(self.guardian_id, self.school_names)
+        for school_id, (version, events) in fan.results.items():
+            self.versions[school_id], self.events[school_id] = version, events
+        return _sort_events(e for events in self.events.values() for e in events.values())
+
+    def refresh(self, school_ids=None):
+        """Delta desde o último envio, ou None se nada mudou."""
+        added, updated, removed = [], [], []
+        for school_id in (school_ids or list(self.school_names)):
+            if school_id not in self.school_names:
+                continue
+            try:
+                school_db = get_school_db(school_id)
+                try:
+                    if get_events_version(school_db) == self.versions.get(school_id):
+                        continue
+                    version, current = _school_events(school_db, self.guardian_id, school_id, self.school_names[school_id])
+                finally:
+                    school_db.close()
+            except Exception as e:
+                print(f"Erro ao buscar eventos da escola {school_id}: {e}")
+                continue
             
-    return jsonify({'success': True, 'data': {'notifications': all_notifs}})
+            previous = self.events.get(school_id, {})
+            for event_id, event in current.items():
+                if event_id not in previous:
+                    added.append(event)
+                elif previous[event_id] != event:
+                    updated.append(event)
+            removed.extend({'id': event_id, 'school_id': school_id} for event_id in previous if event_id not in current)
+            self.versions[school_id] = version
+            self.events[school_id] = current
+        
+        if not (added or updated or removed):
+            return None
+        return {'added': _sort_events(added), 'updated': _sort_events(updated), 'removed': removed}
 
 @guardian_bp.route('/api/guardian/events')
 def events():
@@ -326,62 +524,36 @@ def events():
     if not token:
         return jsonify({'message': 'Token missing'}), 401
     
-    try:
-        data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        guardian_id = data['id']
-    except:
+    guardian_id = _stream_guardian_id(token)
+    if guardian_id is None:
         return jsonify({'message': 'Invalid token'}), 403
 
+    last_event_id = _stream_last_event_id()
+
     def generate():
         yield f"data: {json.dumps({'type': 'connected'})}\n\n"
         
-        while True:
-            try:
-                # Conexão manual para threads/generators
-                sys_db = sqlite3.connect(SYSTEM_DB_PATH)
-                sys_db.row_factory = sqlite3.Row
-                schools = sys_db.execute('SELECT id, name FROM schools').fetchall()
-                sys_db.close()
-                
-                for school in schools:
-                    school_db = None
-                    try:
-                        school_db = get_school_db(school['id'])
-                        
-                        # Apenas não notificados para SSE
-                        rows = school_db.execute('''
-                            SELECT al.id, al.student_id, s.name as student_name, al.event_type, al.timestamp
-                            FROM access_logs al
-                            JOIN students s ON al.student_id = s.id
-                            JOIN student_guardians sg ON s.id = sg.student_id
-                            WHERE sg.guardian_id = ? AND al.notified_guardian = 0
-                        ''', (guardian_id,)).fetchall()
-                        
-                        if rows:
-                            # Marcar como notificado
-                            ids = [str(dict(r)['id']) for r in rows]
-                            if ids:
-                                school_db.execute(f"UPDATE access_logs SET notified_guardian = 1 WHERE id IN ({','.join(ids)})")
-                                school_db.commit()
-
-                        for row in rows:
-                            n = dict(row)
-                            n['school_name'] = school['name']
-                            yield f"data: {json.dumps({'type': 'notification', 'data': n})}\n\n"
-                            
-                    except Exception as e:
-                        pass
-                    finally:
-                        if school_db:
-                            try:
-                                school_db.close()
-                            except:
-                                pass
-                                
-            except Exception as e:
-                pass
+        channel = guardian_channel(guardian_id)
+        inbox = hub.subscribe(channel)
+        try:
+            # Pendentes desde o cursor; depois disso o hub só acorda a releitura
+            cursor = NotificationCursor(guardian_id, last_event_id)
+            for n in cursor.pending():
+                yield _sse_notification(n, cursor.advance(n))
+                cursor.save(n)
             
-            time.sleep(3)
+            while True:
+                try:
+                    msg = inbox.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                
+                for n in cursor.on_message(msg['data']):
+                    yield _sse_notification(n, cursor.advance(n))
+                    cursor.save(n)
+        finally:
+            hub.unsubscribe(channel, inbox)
             
     return Response(generate(), mimetype='text/event-stream')
 
@@ -390,6 +562,9 @@ def events_stream():
     """
     Server-Sent Events (SSE) para eventos escolares em tempo real.
     Substitui o polling por uma conexão persistente.
+    Na conexão envia 'events' com a lista completa; depois só 'events_delta'
+    ({added, updated, removed}) quando a versão dos eventos de uma escola muda.
+    (Versão asyncio das duas rotas de stream em asgi.py.)
     """
     token = request.args.get('token')
     if not token and 'Authorization' in request.headers:
@@ -398,117 +573,61 @@ def events_stream():
     if not token:
         return jsonify({'message': 'Token missing'}), 401
     
-    try:
-        data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        guardian_id = data['id']
-    except:
+    guardian_id = _stream_guardian_id(token)
+    if guardian_id is None:
         return jsonify({'message': 'Invalid token'}), 403
 
-    def generate():
+    last_event_id = _stream_last_event_id()
+
+    def stream(inbox):
         # Enviar confirmação de conexão
         yield f"data: {json.dumps({'type': 'connected'})}\n\n"
         
-        last_event_count = 0
+        cursor = NotificationCursor(guardian_id, last_event_id)
+        for n in cursor.pending():
+            yield _sse_notification(n, cursor.advance(n))
+            cursor.save(n)
         
-        while True:
+        view = GuardianEventsView(guardian_id)
+        try:
             try:
-                # Buscar eventos atualizados
-                sys_db = sqlite3.connect(SYSTEM_DB_PATH)
-                sys_db.row_factory = sqlite3.Row
-                schools = sys_db.execute('SELECT id FROM schools').fetchall()
-                
-                all_schools = set()
-                all_students = []
-                
-                # Buscar alunos vinculados
-                for school_row in schools:
-                    school_id = school_row['id']
-                    try:
-                        school_db = get_school_db(school_id)
-                        students = school_db.execute('''
-                            SELECT s.id, s.name, s.class_name 
-                            FROM students s
-                            JOIN student_guardians sg ON s.id = sg.student_id
-                            WHERE sg.guardian_id = ?
-                        ''', (guardian_id,)).fetchall()
-                        
-                        if students:
-                            all_schools.add(school_id)
-                            for s in students:
-                                all_students.append({
-                                    'id': s['id'],
-                                    'class_name': s['class_name'],
-                                    'school_id': school_id
-                                })
-                        school_db.close()
-                    except:
-                        continue
-                
-                # Check Notifications
-                for school_id in all_schools:
-                    try:
-                        school_db = get_school_db(school_id)
-                        notifs = school_db.execute('''
-                            SELECT al.id, al.student_id, s.name as student_name, al.event_type 
-                            FROM access_logs al
-                            JOIN students s ON al.student_id = s.id
-                            JOIN student_guardians sg ON s.id = sg.student_id
-                            WHERE sg.guardian_id = ? AND al.notified_guardian = 0
-                        ''', (guardian_id,)).fetchall()
-                        if notifs:
-                            ids_to_update = [str(n['id']) for n in notifs]
-                            school_db.execute(f"UPDATE access_logs SET notified_guardian = 1 WHERE id IN ({','.join(ids_to_update)})")
-                            school_db.commit()
-                            for n in notifs:
-                                yield f"data: {json.dumps({'type': 'notification', 'data': dict(n)})}\n\n"
-                        school_db.close()
-                    except: pass
-
-                # Buscar eventos
-                all_events = []
-                for school_id in all_schools:
-                    try:
-                        school_db = get_school_db(school_id)
-                        school_info = sys_db.execute('SELECT name FROM schools WHERE id = ?', (school_id,)).fetchone()
-                        school_name = school_info['name'] if school_info else f'Escola {school_id}'
-                        
-                        events = school_db.execute('SELECT * FROM events ORDER BY event_date ASC').fetchall()
-                        
-                        for event in events:
-                            event_dict = dict(event)
-                            event_dict['school_id'] = school_id
-                            event_dict['school_name'] = school_name
-                            
-                            # Filtrar eventos relevantes
-                            is_relevant = False
-                            if not event_dict.get('class_name'):
-                                is_relevant = True
-                            else:
-                                for student in all_students:
-                                    if student['school_id'] == school_id and student['class_name'] == event_dict.get('class_name'):
-                                        is_relevant = True
-                                        break
-                            
-                            if is_relevant:
-                                all_events.append(event_dict)
-                        
-                        school_db.close()
-                    except:
-                        continue
-                
-                sys_db.close()
-                
-                # Enviar eventos se houver mudança
-                current_count = len(all_events)
-                if current_count != last_event_count:
-                    all_events.sort(key=lambda x: x.get('event_date', '9999-12-31'))
-                    yield f"data: {json.dumps({'type': 'events', 'data': all_events})}\n\n"
-                    last_event_count = current_count
-                
+                yield f"data: {json.dumps({'type': 'events', 'data': view.snapshot()})}\n\n"
             except Exception as e:
                 print(f"Erro no SSE de eventos: {e}")
             
-            time.sleep(5)  # Verificar a cada 5 segundos
+            last_check = time.monotonic()
+            while True:
+                # Notificações saem na hora pelo hub; eventos só são relidos quando a escola
+                # avisa (events_changed). Parado, o stream não toca no banco: só keepalive.
+                changed_school = yield from _drain_notifications(inbox, SSE_KEEPALIVE_SECONDS, cursor)
+                if changed_school is not None:
+                    school_ids = [changed_school]
+                elif not hub.available and time.monotonic() - last_check >= EVENTS_RECHECK_SECONDS:
+                    school_ids = None
+                else:
+                    yield ": keepalive\n\n"
+                    continue
+                last_check = time.monotonic()
+                try:
+                    delta = view.refresh(school_ids)
+                    if delta:
+                        yield f"data: {json.dumps({'type': 'events_delta', 'data': delta})}\n\n"
+                except Exception as e:
+                    print(f"Erro no SSE de eventos: {e}")
+        finally:
+            view.close()
+    
+    def generate():
+        # Uma fila só para notificações do responsável e mudanças de eventos das escolas
+        channels = _stream_channels(guardian_id)
+        inbox = None
+        for channel in channels:
+            inbox = hub.subscribe(channel, inbox)
+        try:
+            yield from stream(inbox)
+        finally:
+            for channel in channels:
+                hub.unsubscribe(channel, inbox)
             
     return Response(generate(), mimetype='text/event-stream')
 
@@ -592,15 +711,25 @@ def get_student_attendance():
         try:
             school_db = get_school_db(school_id)
             
-            # Buscar de access_logs (que tem event_type: arrival, departure)
-            like_pattern = f"{y_str}-{m_str}-%"
+            # Resumo diário (attendance_rollups.py): uma linha por dia em vez do log bruto do mês
+            month_start, month_end = prefix_range(f"{y_str}-{m_str}-")
             
             rows = school_db.execute('''
-                SELECT timestamp, event_type as type FROM access_logs 
-                WHERE student_id = ? AND timestamp LIKE ?
-            ''', (student_id, like_pattern)).fetchall()
+                SELECT first_arrival, last_departure FROM attendance_daily
+                WHERE student_id = ? AND day >= ? AND day < ?
+                ORDER BY day
+            ''', (student_id, month_start, month_end)).fetchall()
             
-            return jsonify([dict(r) for r in rows])
+            # Mesmo formato de antes: [{timestamp, type}] com a entrada e a saída de cada dia
+            # (horários no fuso da escola, então o prefixo do dia bate com o calendário)
+            tz = school_tz(school_id)
+            records = []
+            for r in rows:
+                if r['first_arrival'] is not None:
+                    records.append({'timestamp': format_local(r['first_arrival'], tz), 'type': 'arrival'})
+                if r['last_departure'] is not None:
+                    records.append({'timestamp': format_local(r['last_departure'], tz), 'type': 'departure'})
+            return jsonify(records)
         finally:
             if school_db: school_db.close()
             
@@ -618,93 +747,14 @@ def get_school_events():
     guardian_id = g.user.get('id')
     
     try:
-        # Buscar todas as escolas onde o responsável tem filhos
-        sys_db = get_system_db()
+        # Apenas as escolas do diretório guardian_school_links
+        schools = get_guardian_schools(guardian_id)
+        fan = _guardian_school_events(guardian_id, {school['id']: school['name'] for school in schools})
         
-        # Buscar todos os alunos vinculados ao responsável
-        all_schools = set()
-        all_students = []
-        
-        # Procurar em todas as escolas (brute force, mas funcional)
-        schools = sys_db.execute('SELECT id FROM schools').fetchall()
-        
-        for school_row in schools:
-            school_id = school_row['id']
-            try:
-                school_db = get_school_db(school_id)
-                students = school_db.execute('''
-                    SELECT s.id, s.name, s.class_name 
-                    FROM students s
-                    JOIN student_guardians sg ON s.id = sg.student_id
-                    WHERE sg.guardian_id = ?
-                ''', (guardian_id,)).fetchall()
-                
-                if students:
-                    all_schools.add(school_id)
-                    for s in students:
-                        all_students.append({
-                            'id': s['id'],
-                            'name': s['name'],
-                            'class_name': s['class_name'],
-                            'school_id': school_id
-                        })
-                school_db.close()
-            except Exception as e:
-                print(f"Erro ao verificar escola {school_id}: {e}")
-                continue
-        
-        if not all_schools:
-            return jsonify({'success': True, 'events': []})
-        
-        # Buscar eventos de todas as escolas
-        all_events = []
-        
-        for school_id in all_schools:
-            try:
-                school_db = get_school_db(school_id)
-                
-                # Buscar nome da escola
-                school_info = sys_db.execute('SELECT name FROM schools WHERE id = ?', (school_id,)).fetchone()
-                school_name = school_info['name'] if school_info else f'Escola {school_id}'
-                
-                # Buscar todos os eventos
-                events = school_db.execute('''
-                    SELECT * FROM events 
-                    ORDER BY event_date ASC
-                ''').fetchall()
-                
-                # Filtrar eventos relevantes para os alunos deste responsável
-                for event in events:
-                    event_dict = dict(event)
-                    event_dict['school_id'] = school_id
-                    event_dict['school_name'] = school_name
-                    
-                    # Verificar se o evento é relevante
-                    is_relevant = False
-                    
-                    # Eventos sem turma específica são para todos
-                    if not event_dict.get('class_name'):
-                        is_relevant = True
-                    else:
-                        # Verificar se algum aluno está na turma do evento
-                        for student in all_students:
-                            if student['school_id'] == school_id and student['class_name'] == event_dict.get('class_name'):
-                                is_relevant = True
-                                break
-                    
-                    if is_relevant:
-                        all_events.append(event_dict)
-                
-                school_db.close()
-            except Exception as e:
-                print(f"Erro ao buscar eventos da escola {school_id}: {e}")
-                continue
-        
-        # Ordenar eventos por data
-        all_events.sort(key=lambda x: x.get('event_date', '9999-12-31'))
+        all_events = _sort_events(e for _, events in fan.results.values() for e in events.values())
         
         print(f"✅ Retornando {len(all_events)} eventos para responsável {guardian_id}")
-        return jsonify({'success': True, 'events': all_events})
+        return jsonify({'success': True, 'events': all_events, 'school_errors': fan.report()})
         
     except Exception as e:
         print(f"❌ Erro em get_school_events: {e}")
@@ -736,6 +786,7 @@ def link_student():
         school_db.execute('INSERT INTO student_guardians (student_id, guardian_id) VALUES (?, ?)', 
                           (student_id, guardian_id))
         school_db.commit()
+        link_guardian_school(guardian_id, school_id, student_id)
         
         return jsonify({'success': True, 'message': 'Vinculado com sucesso'})
     except Exception as e:
@@ -946,135 +997,123 @@ def send_chat_message(student_id):
 def get_invoices():
     guardian_id = g.user.get('id')
     sys_db = get_system_db()
-    schools = sys_db.execute('SELECT id, name FROM schools').fetchall()
+    schools = get_guardian_schools(guardian_id, sys_db)
     
-    all_invoices = []
+    def query(school_db, school_id):
+        # Verificar se tabela existe
+        try:
+            school_db.execute('SELECT 1 FROM invoices LIMIT 1')
+        except sqlite3.OperationalError:
+            return [] # Tabela não existe nesta escola
+            
+        # Join to get student info and verify guardian
+        return [dict(r) for r in school_db.execute('''
+            SELECT i.*, s.name as student_name, s.class_name
+            FROM invoices i
+            JOIN students s ON i.student_id = s.id
+            JOIN student_guardians sg ON s.id = sg.student_id
+            WHERE sg.guardian_id = ?
+            ORDER BY i.due_date DESC
+        ''', (guardian_id,)).fetchall()]
     
+    fan = for_each_school([school['id'] for school in schools], query)
+    
+    all_invoices = []
     for school in schools:
-        school_db = None
-        try:
-            school_db = get_school_db(school['id'])
-            # Verificar se tabela existe
-            try:
-                school_db.execute('SELECT 1 FROM invoices LIMIT 1')
-            except:
-                continue # Tabela não existe nesta escola
-                
-            # Join to get student info and verify guardian
-            query = '''
-                SELECT i.*, s.name as student_name, s.class_name
-                FROM invoices i
-                JOIN students s ON i.student_id = s.id
-                JOIN student_guardians sg ON s.id = sg.student_id
-                WHERE sg.guardian_id = ?
-                ORDER BY i.due_date DESC
-            '''
-            rows = school_db.execute(query, (guardian_id,)).fetchall()
-            for r in rows:
-                inv = dict(r)
-                inv['school_id'] = school['id']
-                inv['school_name'] = school['name']
-                all_invoices.append(inv)
-        except Exception as e:
-            print(f"Erro ao buscar faturas escola {school['id']}: {e}")
-            continue
-        finally:
-             if school_db: school_db.close()
+        for inv in fan.results.get(school['id'], []):
+            inv['school_id'] = school['id']
+            inv['school_name'] = school['name']
+            all_invoices.append(inv)
              
-    return jsonify({'success': True, 'invoices': all_invoices})
+    return jsonify({'success': True, 'invoices': all_invoices, 'school_errors': fan.report()})
+
+def _teacher_names(sys_db, items):
+    """Nomes dos professores (system.db) para as notas/relatórios, numa consulta só."""
+    teacher_ids = list({item['teacher_id'] for item in items if item.get('teacher_id')})
+    if not teacher_ids:
+        return {}
+    placeholders = ','.join('?' * len(teacher_ids))
+    rows = sys_db.execute(f'SELECT id, name FROM teachers WHERE id IN ({placeholders})', teacher_ids).fetchall()
+    return {row['id']: row['name'] for row in rows}
 
 @guardian_bp.route('/api/guardian/grades', methods=['GET'])
 @token_required
 def get_grades():
     guardian_id = g.user.get('id')
     sys_db = get_system_db()
-    schools = sys_db.execute('SELECT id, name FROM schools').fetchall()
-    
-    all_grades = []
+    schools = get_guardian_schools(guardian_id, sys_db)
     
-    for school in schools:
-        school_db = None
+    def query(school_db, school_id):
+        # Verificar se tabela existe
         try:
-            school_db = get_school_db(school['id'])
-            # Verificar se tabela existe
-            try:
-                school_db.execute('SELECT 1 FROM student_grades LIMIT 1')
-            except:
-                continue 
-                
-            query = '''
-                SELECT g.*, s.name as student_name, s.class_name
-                FROM student_grades g
-                JOIN students s ON g.student_id = s.id
-                JOIN student_guardians sg ON s.id = sg.student_id
-                WHERE sg.guardian_id = ?
-                ORDER BY g.created_at DESC
-            '''
+            school_db.execute('SELECT 1 FROM student_grades LIMIT 1')
+        except sqlite3.OperationalError:
+            return []
             
-            rows = school_db.execute(query, (guardian_id,)).fetchall()
-            for r in rows:
-                item = dict(r)
-                item['school_id'] = school['id']
-                item['school_name'] = school['name']
-                # Fetch teacher name from system db
-                if item.get('teacher_id'):
-                    t = sys_db.execute('SELECT name FROM teachers WHERE id = ?', (item['teacher_id'],)).fetchone()
-                    item['teacher_name'] = t['name'] if t else 'Professor'
-                else:
-                    item['teacher_name'] = 'Professor'
-                    
-                all_grades.append(item)
-        except Exception as e:
-            # print(f"Erro ao buscar notas escola {school['id']}: {e}")
-            continue
-        finally:
-             if school_db: school_db.close()
+        return [dict(r) for r in school_db.execute('''
+            SELECT g.*, s.name as student_name, s.class_name
+            FROM student_grades g
+            JOIN students s ON g.student_id = s.id
+            JOIN student_guardians sg ON s.id = sg.student_id
+            WHERE sg.guardian_id = ?
+            ORDER BY g.created_at DESC
+        ''', (guardian_id,)).fetchall()]
+    
+    fan = for_each_school([school['id'] for school in schools], query)
+    
+    all_grades = []
+    for school in schools:
+        for item in fan.results.get(school['id'], []):
+            item['school_id'] = school['id']
+            item['school_name'] = school['name']
+            all_grades.append(item)
+    
+    # Fetch teacher name from system db
+    teacher_names = _teacher_names(sys_db, all_grades)
+    for item in all_grades:
+        item['teacher_name'] = teacher_names.get(item.get('teacher_id'), 'Professor')
              
-    return jsonify({'success': True, 'grades': all_grades})
+    return jsonify({'success': True, 'grades': all_grades, 'school_errors': fan.report()})
 
 @guardian_bp.route('/api/guardian/reports', methods=['GET'])
 @token_required
 def get_reports():
     guardian_id = g.user.get('id')
     sys_db = get_system_db()
-    schools = sys_db.execute('SELECT id, name FROM schools').fetchall()
+    schools = get_guardian_schools(guardian_id, sys_db)
     
-    all_reports = []
+    def query(school_db, school_id):
+        try:
+            school_db.execute('SELECT 1 FROM student_reports LIMIT 1')
+        except sqlite3.OperationalError:
+            return []
+            
+        return [dict(r) for r in school_db.execute('''
+            SELECT r.*, s.name as student_name, s.class_name
+            FROM student_reports r
+            JOIN students s ON r.student_id = s.id
+            JOIN student_guardians sg ON s.id = sg.student_id
+            WHERE sg.guardian_id = ?
+            ORDER BY r.created_at DESC
+        ''', (guardian_id,)).fetchall()]
     
+    fan = for_each_school([school['id'] for school in schools], query)
+    
+    all_reports = []
     for school in schools:
-        school_db = None
-        try:
-            school_db = get_school_db(school['id'])
-            try:
-                school_db.execute('SELECT 1 FROM student_reports LIMIT 1')
-            except:
-                continue 
-                
-            query = '''
-                SELECT r.*, s.name as student_name, s.class_name
-                FROM student_reports r
-                JOIN students s ON r.student_id = s.id
-                JOIN student_guardians sg ON s.id = sg.student_id
-                WHERE sg.guardian_id = ?
-                ORDER BY r.created_at DESC
-            '''
-            rows = school_db.execute(query, (guardian_id,)).fetchall()
-            for r in rows:
-                item = dict(r)
-                item['school_id'] = school['id']
-                item['school_name'] = school['name']
-                if item.get('teacher_id'):
-                    t = sys_db.execute('SELECT name FROM teachers WHERE id = ?', (item['teacher_id'],)).fetchone()
-                    item['teacher_name'] = t['name'] if t else 'Professor'
-                else:
-                    item['teacher_name'] = 'Coordenação'
-                all_reports.append(item)
-        except Exception as e:
-            continue
-        finally:
-             if school_db: school_db.close()
+        for item in fan.results.get(school['id'], []):
+            item['school_id'] = school['id']
+            item['school_name'] = school['name']
+            all_reports.append(item)
+    
+    teacher_names = _teacher_names(sys_db, all_reports)
+    for item in all_reports:
+        if item.get('teacher_id'):
+            item['teacher_name'] = teacher_names.get(item['teacher_id'], 'Professor')
+        else:
+            item['teacher_name'] = 'Coordenação'
              
-    return jsonify({'success': True, 'reports': all_reports})
+    return jsonify({'success': True, 'reports': all_reports, 'school_errors': fan.report()})
 
 
 
@@ -0,0 +1,121 @@
+"""
+Diretório responsável -> escolas (tabela guardian_school_links no system.db).
+
+Evita abrir o banco de todas as escolas para descobrir onde estão os filhos
+de um responsável. Deve ser mantido junto com student_guardians: quem grava
+lá chama link_guardian_school / unlink_student; o que vem de fora (servidor
+Node, scripts) é acertado com `python guardian_links.py`.
+
+Também guarda os cursores de entrega de notificações (guardian_notification_cursors).
+"""
+import os
+import threading
+import time
+
+from database import get_system_db, get_school_db_path
+from school_fanout import for_each_school
+
+# Responsável sem vínculo em nenhuma escola: não varre tudo de novo a cada requisição
+UNLINKED_RESCAN_SECONDS = float(os.environ.get('UNLINKED_RESCAN_SECONDS', '300'))
+
+_unlinked_lock = threading.Lock()
+_unlinked = {}  # guardian_id -> time.monotonic() da última varredura sem resultado
+
+
+def _linked_schools(guardian_id, sys_db):
+    return sys_db.execute('''
+        SELECT DISTINCT s.id, s.name, s.latitude, s.longitude
+        FROM guardian_school_links gl
+        JOIN schools s ON s.id = gl.school_id
+        WHERE gl.guardian_id = ?
+        ORDER BY s.id
+    ''', (guardian_id,)).fetchall()
+
+
+def _scan_guardian_links(guardian_id, sys_db):
+    """Varredura antiga (student_guardians de todas as escolas), gravando o que achar no diretório."""
+    school_ids = [r[0] for r in sys_db.execute('SELECT id FROM schools').fetchall()
+                  if os.path.exists(get_school_db_path(r[0]))]
+    fan = for_each_school(school_ids, lambda school_db, school_id: [r[0] for r in school_db.execute(
+        'SELECT DISTINCT student_id FROM student_guardians WHERE guardian_id = ? AND student_id IS NOT NULL',
+        (guardian_id,)
+    ).fetchall()])
+    links = [(guardian_id, school_id, student_id)
+             for school_id, student_ids in fan.results.items() for student_id in student_ids]
+    if links:
+        sys_db.executemany(
+            'INSERT OR IGNORE INTO guardian_school_links (guardian_id, school_id, student_id) VALUES (?, ?, ?)', links
+        )
+        sys_db.commit()
+        print(f"🔗 Responsável {guardian_id}: {len(links)} vínculo(s) recuperado(s) fora do diretório")
+    return bool(links)
+
+
+def get_guardian_schools(guardian_id, sys_db=None):
+    """Escolas onde o responsável tem algum aluno vinculado.
+
+    Sem nenhum vínculo no diretório (gravado pelo Node ou por script), cai na
+    varredura de todas as escolas e grava o que achar.
+    """
+    sys_db = sys_db or get_system_db()
+    schools = _linked_schools(guardian_id, sys_db)
+    if schools:
+        return schools
+    with _unlinked_lock:
+        scanned_at = _unlinked.get(guardian_id)
+    if scanned_at is not None and time.monotonic() - scanned_at < UNLINKED_RESCAN_SECONDS:
+        return schools
+    if _scan_guardian_links(guardian_id, sys_db):
+        with _unlinked_lock:
+            _unlinked.pop(guardian_id, None)
+        return _linked_schools(guardian_id, sys_db)
+    with _unlinked_lock:
+        _unlinked[guardian_id] = time.monotonic()
+    return schools
+
+
+def link_guardian_school(guardian_id, school_id, student_id, sys_db=None):
+    """Registra o vínculo no diretório; chamar junto de todo INSERT em student_guardians."""
+    sys_db = sys_db or get_system_db()
+    sys_db.execute('''
+        INSERT OR IGNORE INTO guardian_school_links (guardian_id, school_id, student_id)
+        VALUES (?, ?, ?)
+    ''', (guardian_id, school_id, student_id))
+    sys_db.commit()
+    with _unlinked_lock:
+        _unlinked.pop(guardian_id, None)
+
+
+def unlink_student(school_id, student_id, guardian_id=None, sys_db=None):
+    """Remove os vínculos do aluno (de todos os responsáveis, ou só de um)."""
+    sys_db = sys_db or get_system_db()
+    if guardian_id is None:
+        sys_db.execute('DELETE FROM guardian_school_links WHERE school_id = ? AND student_id = ?',
+                       (school_id, student_id))
+    else:
+        sys_db.execute('DELETE FROM guardian_school_links WHERE school_id = ? AND student_id = ? AND guardian_id = ?',
+                       (school_id, student_id, guardian_id))
+    sys_db.commit()
+
+
+def get_notification_cursors(guardian_id, sys_db=None):
+    """Último access_log entregue ao responsável, por escola: {school_id: log_id}."""
+    sys_db = sys_db or get_system_db()
+    rows = sys_db.execute(
+        'SELECT school_id, last_log_id FROM guardian_notification_cursors WHERE guardian_id = ?',
+        (guardian_id,)
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def save_notification_cursor(guardian_id, school_id, last_log_id, sys_db=None):
+    """Avança o cursor (nunca volta: outra aba pode já ter entregue mais)."""
+    sys_db = sys_db or get_system_db()
+    sys_db.execute('''
+        INSERT INTO guardian_notification_cursors (guardian_id, school_id, last_log_id, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(guardian_id, school_id) DO UPDATE SET
+            last_log_id = MAX(last_log_id, excluded.last_log_id),
+            updated_at = excluded.updated_at
+    ''', (guardian_id, school_id, last_log_id))
+    sys_db.commit()
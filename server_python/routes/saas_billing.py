@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, g
 from database import get_system_db, get_school_db
+from school_fanout import for_each_school
 from datetime import datetime
 import calendar
 
@@ -117,19 +118,19 @@ def list_schools_billing():
     schools = conn.execute("SELECT id, name, custom_price FROM schools").fetchall()
     default_price = get_default_price()
     
+    # Alunos de todas as escolas em paralelo (a latência é a da escola mais lenta)
+    counts = for_each_school(
+        [s['id'] for s in schools],
+        lambda db, school_id: db.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+    )
+    
     results = []
     for s in schools:
-        # Calcular alunos e total on-the-fly (pode ser lento se muitos bancos, mas ok para MVP)
-        student_count = 0
-        try:
-            s_db = get_school_db(s['id'])
-            student_count = s_db.execute("SELECT COUNT(*) FROM students").fetchone()[0]
-            s_db.close()
-        except:
-            pass
+        # Escola que falhou (ver "error") fica sem contagem em vez de aparecer com 0 alunos
+        student_count = counts.results.get(s['id'])
             
         price = s['custom_price'] if s['custom_price'] is not None else default_price
-        total = student_count * float(price)
+        total = student_count * float(price) if student_count is not None else None
         
         results.append({
             "id": s['id'],
@@ -137,7 +138,8 @@ def list_schools_billing():
             "student_count": student_count,
             "price_per_student": price,
             "is_custom_price": s['custom_price'] is not None,
-            "current_invoice_total": total
+            "current_invoice_total": total,
+            "error": counts.errors.get(s['id'])
         })
         
     return jsonify(results)
@@ -1,8 +1,19 @@
-from flask import Blueprint, request, jsonify, g
-from .auth import token_required
-from .affiliate_helpers import get_accessible_school_id
-from database import get_system_db, get_school_db
+from flask import Blueprint, request, jsonify, g, Response
+from .auth import token_required, SECRET_KEY
+from .affiliate_helpers import get_accessible_school_id, has_affiliate_access
+from .guardian_helpers import link_guardian_school, unlink_student
+from database import get_system_db, get_school_db, SYSTEM_DB_PATH
+from notifications import publish_access_log, publish_events_changed
+from school_writer import write_school
+from .face_helpers import touch_student_face, record_face_removal
+from face_descriptors import store_descriptor, serialize_face_fields
+from timestamps import stamp, school_tz, local_date_filter
+from presence import get_presence, RESYNC
 import bcrypt
+import json
+import jwt
+import queue
+import sqlite3
 
 school_bp = Blueprint('school', __name__)
 
@@ -15,7 +26,7 @@ def get_students():
     
     # Lógica idêntica ao Funcionário: Leitura direta da tabela
     cur.execute('SELECT * FROM students')
-    students = [dict(row) for row in cur.fetchall()]
+    students = [serialize_face_fields(dict(row)) for row in cur.fetchall()]
     return jsonify(students)
 
 @school_bp.route('/api/school/students', methods=['POST'])
@@ -27,15 +38,11 @@ def create_student():
     cur = db.cursor()
     
     try:
-        # 1. Preparar Descritor (Lógica idêntica ao Funcionário)
-        descriptor = None
-        if data.get('face_descriptor'):
-            import json
-            d_data = data.get('face_descriptor')
-            if isinstance(d_data, list):
-                descriptor = json.dumps(d_data)
-            else:
-                descriptor = d_data
+        # 1. Preparar Descritor (JSON ou BLOB, ver face_descriptors.py)
+        try:
+            descriptor = store_descriptor(data.get('face_descriptor'))
+        except ValueError as e:
+            return jsonify({'message': 'Descritor facial inválido', 'error': str(e)}), 400
 
         # 2. Criar Aluno salvando TUDO na tabela students
         cur.execute('''
@@ -51,6 +58,7 @@ def create_student():
             descriptor
         ))
         student_id = cur.lastrowid
+        touch_student_face(db, student_id)
             
         # 3. Criar/Vincular Responsável Global (System DB)
         parent_email = data.get('parent_email')
@@ -85,6 +93,8 @@ def create_student():
             ''', (student_id, guardian_id))
             
         db.commit()
+        if parent_email:
+            link_guardian_school(guardian_id, school_id, student_id)
         return jsonify({'message': 'Aluno criado com sucesso', 'id': student_id})
         
     except Exception as e:
@@ -183,7 +193,7 @@ def get_class_students(class_id):
     
     # Buscar alunos por class_name
     cur.execute('SELECT * FROM students WHERE class_name = ?', (class_name,))
-    students = [dict(row) for row in cur.fetchall()]
+    students = [serialize_face_fields(dict(row)) for row in cur.fetchall()]
     
     return jsonify(students)
 
@@ -303,7 +313,10 @@ def update_student_face(student_id):
     data = request.json
     school_id = g.user.get('school_id') or g.user.get('id')
     
-    descriptor = data.get('face_descriptor')
+    try:
+        descriptor = store_descriptor(data.get('face_descriptor'))
+    except ValueError:
+        return jsonify({'error': 'Descritor facial inválido'}), 400
     if not descriptor:
         return jsonify({'error': 'Descritor facial ausente'}), 400
 
@@ -312,6 +325,7 @@ def update_student_face(student_id):
         
         # Atualiza tabela STUDENTS direto
         db.execute('UPDATE students SET face_descriptor = ? WHERE id = ?', (descriptor, student_id))
+        touch_student_face(db, student_id)
             
         db.commit()
         db.close()
@@ -361,6 +375,7 @@ def create_event():
         ))
         db.commit()
         db.close()
+        publish_events_changed(school_id)
         return jsonify({'success': True})
     except Exception as e:
         print(f"❌ Erro ao criar evento: {e}")
@@ -391,6 +406,7 @@ def update_event(event_id):
         ))
         db.commit()
         db.close()
+        publish_events_changed(school_id)
         return jsonify({'success': True})
     except Exception as e:
         print(f"❌ Erro ao atualizar evento: {e}")
@@ -407,6 +423,7 @@ def delete_event(event_id):
         db.execute('DELETE FROM events WHERE id = ?', (event_id,))
         db.commit()
         db.close()
+        publish_events_changed(school_id)
         return jsonify({'success': True})
     except Exception as e:
         print(f"❌ Erro ao deletar evento: {e}")
@@ -550,10 +567,13 @@ def get_pickups():
     pickups = [dict(row) for row in cur.fetchall()]
     
     sys_db = get_system_db()
+    presence = get_presence(school_id)
     for p in pickups:
         guardian = sys_db.execute('SELECT name FROM guardians WHERE id = ?', (p['guardian_id'],)).fetchone()
         if guardian:
             p['guardian_name'] = guardian['name']
+        # Aluno está na escola agora? (presence.py, sem consultar o log)
+        p['inside'] = p['student_id'] in presence.inside
             
     return jsonify(pickups)
 
@@ -564,17 +584,26 @@ def update_pickup_status(request_id):
     status = data.get('status')
     school_id = g.user.get('school_id') or g.user.get('id')
     
-    db = get_school_db(school_id)
-    db.execute('UPDATE pickup_requests SET status = ? WHERE id = ?', (status, request_id))
-    
-    # Notificar responsável se status relevante
-    if status in ['released', 'calling', 'approved', 'confirmed']:
-        row = db.execute('SELECT student_id FROM pickup_requests WHERE id = ?', (request_id,)).fetchone()
-        if row:
-            db.execute('INSERT INTO access_logs (student_id, event_type, notified_guardian) VALUES (?, ?, 0)',
-                       (row['student_id'], f'pickup_{status}'))
-
-    db.commit()
+    notify = status in ['released', 'calling', 'approved', 'confirmed']
+    timestamp, ts, local_date = stamp(tz=school_tz(school_id))
+
+    def write(conn):
+        conn.execute('UPDATE pickup_requests SET status = ? WHERE id = ?', (status, request_id))
+        # Notificar responsável se status relevante
+        if not notify:
+            return None
+        row = conn.execute('SELECT student_id FROM pickup_requests WHERE id = ?', (request_id,)).fetchone()
+        if not row:
+            return None
+        return conn.execute('''
+            INSERT INTO access_logs (student_id, event_type, notified_guardian, timestamp, ts, local_date)
+            VALUES (?, ?, 0, ?, ?, ?)
+        ''', (row['student_id'], f'pickup_{status}', timestamp, ts, local_date)).lastrowid
+
+    # Mesmo escritor (group commit) das presenças, sem disputar o lock de escrita com ele
+    log_id = write_school(school_id, write)
+    if log_id:
+        publish_access_log(get_school_db(school_id), school_id, log_id)
     
     return jsonify({'success': True})
 
@@ -595,12 +624,12 @@ def update_student(student_id):
         
         # Atualizar descritor facial se fornecido
         if data.get('face_descriptor'):
-            import json
-            descriptor = data.get('face_descriptor')
-            if isinstance(descriptor, list):
-                descriptor = json.dumps(descriptor)
+            descriptor = store_descriptor(data.get('face_descriptor'))
             db.execute('DELETE FROM face_descriptors WHERE student_id = ?', (student_id,))
             db.execute('INSERT INTO face_descriptors (student_id, descriptor) VALUES (?, ?)', (student_id, descriptor))
+            # O reconhecimento lê students.face_descriptor
+            db.execute('UPDATE students SET face_descriptor = ? WHERE id = ?', (descriptor, student_id))
+        touch_student_face(db, student_id)
         
         db.commit()
         return jsonify({'success': True})
@@ -615,7 +644,9 @@ def delete_student(student_id):
     db.execute('DELETE FROM face_descriptors WHERE student_id = ?', (student_id,))
     db.execute('DELETE FROM student_guardians WHERE student_id = ?', (student_id,))
     db.execute('DELETE FROM students WHERE id = ?', (student_id,))
+    record_face_removal(db, student_id)
     db.commit()
+    unlink_student(school_id, student_id)
     return jsonify({'success': True})
 
 # ====== EMPLOYEES ======
@@ -625,13 +656,17 @@ def get_employees():
     school_id = g.user.get('school_id') or g.user.get('id')
     db = get_school_db(school_id)
     employees = db.execute('SELECT * FROM employees').fetchall()
-    return jsonify([dict(e) for e in employees])
+    return jsonify([serialize_face_fields(dict(e)) for e in employees])
 
 @school_bp.route('/api/school/employees', methods=['POST'])
 @token_required
 def create_employee():
     data = request.json
     school_id = g.user.get('school_id') or g.user.get('id')
+    try:
+        face_descriptor = store_descriptor(data.get('face_descriptor'))
+    except ValueError:
+        return jsonify({'error': 'Descritor facial inválido'}), 400
     
     # Gerar senha aleatória
     import random
@@ -669,7 +704,7 @@ def create_employee():
         data.get('name'), 
         data.get('role'), 
         data.get('photo_url'), 
-        data.get('face_descriptor'),
+        face_descriptor,
         data.get('email'),
         data.get('phone'),
         data.get('employee_id'),
@@ -691,6 +726,10 @@ def create_employee():
 def update_employee(emp_id):
     data = request.json
     school_id = g.user.get('school_id') or g.user.get('id')
+    try:
+        face_descriptor = store_descriptor(data.get('face_descriptor'))
+    except ValueError:
+        return jsonify({'error': 'Descritor facial inválido'}), 400
     db = get_school_db(school_id)
     
     # Atualizar dados locais
@@ -702,7 +741,7 @@ def update_employee(emp_id):
         data.get('name'), 
         data.get('role'), 
         data.get('photo_url'), 
-        data.get('face_descriptor'),
+        face_descriptor,
         data.get('email'),
         data.get('phone'),
         data.get('employee_id'),
@@ -1107,9 +1146,9 @@ def register_employee_attendance():
     if not emp:
          return jsonify({'message': 'Funcionário não encontrado'}), 404
          
-    import datetime
-    timestamp = datetime.datetime.now().isoformat()
-    db.execute('INSERT INTO employee_attendance (employee_id, timestamp) VALUES (?, ?)', (employee_id, timestamp))
+    timestamp, ts, local_date = stamp(tz=school_tz(school_id))
+    db.execute('INSERT INTO employee_attendance (employee_id, timestamp, ts, local_date) VALUES (?, ?, ?, ?)',
+               (employee_id, timestamp, ts, local_date))
     db.commit()
     return jsonify({'success': True, 'timestamp': timestamp})
 
@@ -1131,16 +1170,21 @@ def get_employee_attendance():
     '''
     params = []
     
-    if date_filter:
-        query += " AND date(ea.timestamp) = ?"
-        params.append(date_filter)
-    
-    if start_date and end_date:
-        query += " AND date(ea.timestamp) BETWEEN ? AND ?"
-        params.append(start_date)
-        params.append(end_date)
+    # Faixas em local_date (dia no fuso da escola) em vez de date(timestamp), que não usa índice
+    try:
+        if date_filter:
+            sql, date_params = local_date_filter('ea.local_date', date_filter, date_filter)
+            query += sql
+            params += date_params
+        
+        if start_date and end_date:
+            sql, date_params = local_date_filter('ea.local_date', start_date, end_date)
+            query += sql
+            params += date_params
+    except ValueError:
+        return jsonify({'error': 'Data inválida (use YYYY-MM-DD)'}), 400
         
-    query += " ORDER BY ea.timestamp DESC"
+    query += " ORDER BY ea.ts DESC"
     
     try:
         records = db.execute(query, params).fetchall()
@@ -1165,39 +1209,19 @@ def get_school_attendance(school_id=None):
     try:
         db = get_school_db(school_id)
         
-        # Se start e end são iguais (ex carregando hoje), usar LIKE para simplificar e evitar problemas de hora
-        if start_date and end_date and start_date == end_date:
-             query = '''
-                SELECT a.id, a.student_id, a.timestamp, a.type, 
-                       s.name as student_name, s.class_name, s.photo_url
-                FROM attendance a
-                JOIN students s ON a.student_id = s.id
-                WHERE a.timestamp LIKE ?
-                ORDER BY a.timestamp DESC
-             '''
-             # start_date geralmente é YYYY-MM-DD
-             params = [f"{start_date}%"]
-        else:
-            query = '''
-                SELECT a.id, a.student_id, a.timestamp, a.type, 
-                       s.name as student_name, s.class_name, s.photo_url
-                FROM attendance a
-                JOIN students s ON a.student_id = s.id
-                WHERE 1=1
-            '''
-            params = []
-            
-            if start_date:
-                query += " AND a.timestamp >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                if len(end_date) == 10:
-                     end_date += 'T23:59:59'
-                query += " AND a.timestamp <= ?"
-                params.append(end_date + 'Z') # Z para garantir UTC se necessário
-                
-            query += " ORDER BY a.timestamp DESC"
+        # Filtro pelo dia local (timestamps.py): faixa indexada em local_date, certa também perto da meia-noite
+        try:
+            date_sql, params = local_date_filter('a.local_date', start_date, end_date)
+        except ValueError:
+            return jsonify({'error': 'Data inválida (use YYYY-MM-DD)'}), 400
+        query = f'''
+            SELECT a.id, a.student_id, a.timestamp, a.type, a.ts, a.local_date,
+                   s.name as student_name, s.class_name, s.photo_url
+            FROM attendance a
+            JOIN students s ON a.student_id = s.id
+            WHERE 1=1 {date_sql}
+            ORDER BY a.ts DESC
+        '''
 
         rows = db.execute(query, params).fetchall()
         return jsonify([dict(r) for r in rows])
@@ -1205,5 +1229,116 @@ def get_school_attendance(school_id=None):
         print(f"Erro em get_school_attendance: {e}")
         return jsonify([])
 
+@school_bp.route('/api/school/attendance/summary', methods=['GET'])
+@token_required
+def get_school_attendance_summary():
+    # Painel por turma: presentes/ausentes por dia a partir de attendance_class_daily
+    school_id = get_accessible_school_id()
+    start_date = request.args.get('startDate')
+    end_date = request.args.get('endDate') or start_date
+    if not start_date:
+        return jsonify({'error': 'startDate obrigatório (YYYY-MM-DD)'}), 400
+    try:
+        date_sql, params = local_date_filter('day', start_date, end_date)
+    except ValueError:
+        return jsonify({'error': 'Data inválida (use YYYY-MM-DD)'}), 400
+
+    db = get_school_db(school_id)
+    rows = db.execute(f'''
+        SELECT day, class_name, enrolled, present, MAX(enrolled - present, 0) AS absent
+        FROM attendance_class_daily
+        WHERE 1=1 {date_sql}
+        ORDER BY day, class_name
+    ''', params).fetchall()
+    return jsonify([dict(r) for r in rows])
+
+PRESENCE_KEEPALIVE_SECONDS = 15
+
+@school_bp.route('/api/school/presence', methods=['GET'])
+@token_required
+def get_school_presence():
+    # Quem está na escola agora (presence.py): portaria, retirada e chamada de emergência
+    school_id = get_accessible_school_id()
+    return jsonify(get_presence(school_id).snapshot(request.args.get('class_name')))
+
+def presence_stream_school_id(token, requested_school_id=None):
+    """(school_id, None) para o token do stream de presença, ou (None, (status, corpo)) se recusado.
+
+    Não usa o contexto do Flask: serve também para asgi.py.
+    """
+    try:
+        user = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None, (403, {'message': 'Token inválido'})
+    school_id = user.get('school_id') or user.get('id')
+    if not requested_school_id:
+        return school_id, None
+    try:
+        requested_school_id = int(requested_school_id)
+    except ValueError:
+        return None, (400, {'message': 'school_id inválido'})
+    if requested_school_id == school_id:
+        return school_id, None
+    sys_db = sqlite3.connect(SYSTEM_DB_PATH)
+    try:
+        allowed = has_affiliate_access(school_id, requested_school_id, sys_db)
+    finally:
+        sys_db.close()
+    if not allowed:
+        return None, (403, {'message': 'Sem acesso a esta escola'})
+    return requested_school_id, None
+
+def presence_sse(presence, msg, class_name=None):
+    """Mensagem da fila de presence.subscribe() -> evento SSE (None se for de outra turma)."""
+    if msg is RESYNC or msg['type'] == 'resync':
+        return f"data: {json.dumps({'type': 'presence', 'data': presence.snapshot(class_name)})}\n\n"
+    if class_name is not None and msg['student']['class_name'] != class_name:
+        return None
+    return f"data: {json.dumps(msg)}\n\n"
+
+@school_bp.route('/api/school/presence/stream')
+def school_presence_stream():
+    """
+    SSE do mapa de presença: 'presence' com o estado completo na conexão (e
+    sempre que for preciso reler, ex. virada do dia), depois 'presence_delta'
+    a cada entrada/saída ({student, class, total_present, version}).
+    EventSource não envia header, então o token pode vir em ?token=.
+    (Versão asyncio em asgi.py, sem uma thread por conexão.)
+    """
+    token = request.args.get('token')
+    if not token and 'Authorization' in request.headers:
+        token = request.headers['Authorization'].split(' ')[-1]
+    if not token:
+        return jsonify({'message': 'Token ausente'}), 401
+    school_id, error = presence_stream_school_id(token, request.args.get('school_id'))
+    if error:
+        return jsonify(error[1]), error[0]
+
+    class_name = request.args.get('class_name')
+    presence = get_presence(school_id)
+
+    def generate():
+        inbox = presence.subscribe()
+        try:
+            yield presence_sse(presence, RESYNC, class_name)
+            while True:
+                try:
+                    msg = inbox.get(timeout=PRESENCE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # check_day() remonta na virada do dia e manda RESYNC para a fila
+                    presence.check_day()
+                    if presence.take_resync(inbox):
+                        yield presence_sse(presence, RESYNC, class_name)
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+                event = presence_sse(presence, msg, class_name)
+                if event:
+                    yield event
+        finally:
+            presence.unsubscribe(inbox)
+
+    return Response(generate(), mimetype='text/event-stream')
+
 # Fim do arquivo (Duplicatas removidas)
 
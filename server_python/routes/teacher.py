@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request, g
 from .auth import token_required
 from database import get_system_db, get_school_db
+from face_descriptors import serialize_face_fields
 
 teacher_bp = Blueprint('teacher', __name__)
 
@@ -64,7 +65,7 @@ def get_class_students():
     try:
         school_db = get_school_db(school_id)
         rows = school_db.execute('SELECT * FROM students WHERE class_name = (SELECT name FROM classes WHERE id = ?)', (class_id,)).fetchall()
-        return jsonify([dict(r) for r in rows])
+        return jsonify([serialize_face_fields(dict(r)) for r in rows])
     except:
         return jsonify([])
 
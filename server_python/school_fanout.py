@@ -0,0 +1,107 @@
+"""
+Consulta em paralelo a vários school_*.db.
+
+for_each_school(school_ids, query) roda query(db, school_id) para cada escola
+em um pool de threads limitado e devolve os resultados que deram certo mais um
+relatório de erros por escola (incluindo timeout), no lugar do
+`except: continue` silencioso. A latência passa a ser a da escola mais lenta,
+não a soma de todas.
+
+O prazo (timeout) de cada escola começa quando a consulta dela começa a
+rodar, não no envio: com o pool ocupado por outras requisições, a escola
+espera a vez na fila (até SCHOOL_FANOUT_QUEUE_TIMEOUT) em vez de estourar o
+prazo sem ter rodado.
+
+A query roda fora do contexto do Flask: não use g nem get_system_db() dentro
+dela, e devolva dados já materializados. A conexão vem do pool das escolas
+(database.py) e volta para ele em seguida.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from database import _checkout_school_db, _release_school_db
+
+SCHOOL_FANOUT_WORKERS = int(os.environ.get('SCHOOL_FANOUT_WORKERS', '16'))
+SCHOOL_FANOUT_TIMEOUT = float(os.environ.get('SCHOOL_FANOUT_TIMEOUT', '5'))
+# Espera máxima na fila do pool antes de a escola começar a rodar
+SCHOOL_FANOUT_QUEUE_TIMEOUT = float(os.environ.get('SCHOOL_FANOUT_QUEUE_TIMEOUT', '30'))
+
+_executor = ThreadPoolExecutor(max_workers=SCHOOL_FANOUT_WORKERS, thread_name_prefix='school-fanout')
+
+
+class FanOutResult:
+    def __init__(self):
+        self.results = {}  # school_id -> retorno da query (na ordem de school_ids)
+        self.errors = {}   # school_id -> mensagem de erro
+
+    def report(self):
+        """Erros por escola em formato JSON ({"14": "timeout (5.0s)"})."""
+        return {str(school_id): message for school_id, message in self.errors.items()}
+
+
+class _Task:
+    def __init__(self):
+        self.started = threading.Event()
+        self.started_at = None
+        self.cancelled = False
+        self.db = None
+
+
+def _run(school_id, query, task):
+    if task.cancelled:
+        return None
+    key = str(school_id)
+    try:
+        db = task.db = _checkout_school_db(key)
+    except Exception:
+        task.started.set()
+        raise
+    # O prazo é da consulta: abrir o arquivo pela primeira vez (migrações) não conta
+    task.started_at = time.monotonic()
+    task.started.set()
+    try:
+        return query(db, school_id)
+    finally:
+        task.db = None
+        _release_school_db(key, db)
+
+
+def for_each_school(school_ids, query, timeout=None):
+    """Executa query(db, school_id) em cada escola; cada uma tem `timeout` segundos depois de começar.
+
+    Escolas que estouram têm a consulta interrompida (sqlite3 interrupt) e
+    entram em errors, assim como as que não saíram da fila do pool a tempo.
+    """
+    timeout = SCHOOL_FANOUT_TIMEOUT if timeout is None else timeout
+    tasks = {}
+    for school_id in dict.fromkeys(school_ids):
+        task = _Task()
+        tasks[school_id] = (task, _executor.submit(_run, school_id, query, task))
+
+    result = FanOutResult()
+    queue_deadline = time.monotonic() + SCHOOL_FANOUT_QUEUE_TIMEOUT
+    for school_id, (task, future) in tasks.items():
+        if not task.started.wait(max(queue_deadline - time.monotonic(), 0)) and not future.done():
+            task.cancelled = True
+            future.cancel()
+            result.errors[school_id] = f'não executada: pool ocupado por mais de {SCHOOL_FANOUT_QUEUE_TIMEOUT}s'
+            continue
+        try:
+            remaining = task.started_at + timeout - time.monotonic() if task.started_at else timeout
+            result.results[school_id] = future.result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            db = task.db
+            if db is not None:
+                try:
+                    db.interrupt()
+                except Exception:
+                    pass
+            result.errors[school_id] = f'timeout ({timeout}s)'
+        except Exception as e:
+            result.errors[school_id] = str(e)
+
+    if result.errors:
+        print(f"⚠️ Consulta falhou em {len(result.errors)} escola(s): {result.report()}")
+    return result
@@ -0,0 +1,193 @@
+"""
+Escritor por escola com group commit para as gravações de presença
+(attendance + access_logs).
+
+No pico da manhã várias requisições da mesma escola gravavam ao mesmo tempo,
+cada uma com seu commit, disputando o lock de escrita do SQLite (e às vezes
+caindo em "database is locked"). Aqui cada escola tem uma thread com uma
+conexão própria: as gravações entram numa fila, a thread junta o que chegar
+em WRITE_BATCH_WINDOW_MS (até WRITE_MAX_BATCH) e grava tudo em uma única
+transação, com um fsync por lote em vez de um por requisição.
+
+Cada gravação roda dentro de um SAVEPOINT, então o erro de uma não desfaz as
+outras do lote. submit() só retorna depois do COMMIT (confirmação durável) e
+levanta a exceção da própria gravação, se houver.
+
+O serializador vale por processo; com vários workers do gunicorn cada um tem
+o seu escritor por escola, e o lock do SQLite continua valendo entre eles.
+"""
+import os
+import queue
+import threading
+import time
+
+from database import _connect_school_db
+
+WRITE_BATCH_WINDOW_MS = float(os.environ.get('WRITE_BATCH_WINDOW_MS', '5'))
+WRITE_MAX_BATCH = int(os.environ.get('WRITE_MAX_BATCH', '256'))
+WRITER_IDLE_SECONDS = float(os.environ.get('WRITER_IDLE_SECONDS', '300'))
+
+
+class WriterClosed(RuntimeError):
+    """O escritor encerrou por ociosidade; pegue outro em get_school_writer."""
+
+
+class _Write:
+    __slots__ = ('fn', 'done', 'result', 'error')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SchoolWriter:
+    def __init__(self, school_id, batch_window=WRITE_BATCH_WINDOW_MS / 1000, max_batch=WRITE_MAX_BATCH,
+                 idle_seconds=WRITER_IDLE_SECONDS, on_exit=None):
+        self.school_id = str(school_id)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.idle_seconds = idle_seconds
+        self.on_exit = on_exit
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.writes = 0
+        self.failed = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name=f'school-writer-{self.school_id}', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, timeout=30):
+        """Roda fn(conn) no lote da escola; retorna o resultado depois do COMMIT.
+
+        Levanta WriterClosed se o escritor já encerrou e TimeoutError se o
+        commit não vier a tempo.
+        """
+        write = _Write(fn)
+        with self._lock:
+            if self._closed:
+                raise WriterClosed(f'escritor da escola {self.school_id} encerrado')
+            self._queue.put(write)
+        if not write.done.wait(timeout):
+            raise TimeoutError(f'gravação da escola {self.school_id} não confirmada em {timeout}s')
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _run(self):
+        try:
+            conn = _connect_school_db(self.school_id)
+        except Exception as e:
+            print(f"❌ Escritor da escola {self.school_id} não abriu o banco: {e}")
+            self._fail_pending(e)
+            return
+        conn.isolation_level = None  # transações controladas aqui (BEGIN/SAVEPOINT/COMMIT)
+        try:
+            while True:
+                try:
+                    first = self._queue.get(timeout=self.idle_seconds)
+                except queue.Empty:
+                    # Ocioso: encerra, mas só se ninguém enfileirou enquanto isso
+                    with self._lock:
+                        if self._queue.empty():
+                            self._closed = True
+                            break
+                    continue
+                batch = [first]
+                deadline = time.monotonic() + self.batch_window
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+            if self.on_exit:
+                self.on_exit(self)
+
+    def _fail_pending(self, error):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                write = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            write.error = error
+            write.done.set()
+        if self.on_exit:
+            self.on_exit(self)
+
+    def _commit(self, conn, batch):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for write in batch:
+                conn.execute('SAVEPOINT school_write')
+                try:
+                    write.result = write.fn(conn)
+                except Exception as e:
+                    write.error = e
+                    conn.execute('ROLLBACK TO school_write')
+                conn.execute('RELEASE school_write')
+            conn.execute('COMMIT')
+        except Exception as e:
+            # BEGIN/COMMIT falhou (ex.: lock de outro processo além do timeout): o lote inteiro falha
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for write in batch:
+                write.result, write.error = None, write.error or e
+            print(f"❌ Lote de {len(batch)} gravação(ões) da escola {self.school_id} falhou: {e}")
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for write in batch:
+            if write.error is None:
+                self.writes += 1
+            else:
+                self.failed += 1
+            write.done.set()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'writes': self.writes,
+            'failed': self.failed,
+            'batches': self.batches,
+            'avg_batch': round(self.writes / self.batches, 2) if self.batches else 0,
+            'largest_batch': self.largest_batch,
+        }
+
+
+_writers_lock = threading.Lock()
+_writers = {}  # school_id -> SchoolWriter
+
+
+def _forget(writer):
+    with _writers_lock:
+        if _writers.get(writer.school_id) is writer:
+            del _writers[writer.school_id]
+
+
+def get_school_writer(school_id):
+    key = str(school_id)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = SchoolWriter(key, on_exit=_forget)
+        return writer
+
+
+def write_school(school_id, fn, timeout=30):
+    """Grava fn(conn) pelo escritor da escola e espera o commit."""
+    while True:
+        writer = get_school_writer(school_id)
+        try:
+            return writer.submit(fn, timeout)
+        except WriterClosed:
+            # encerrou por ociosidade entre o get e o submit: tira do registro e tenta de novo
+            _forget(writer)
+
@@ -0,0 +1,106 @@
+"""
+Gravação em lote com idempotency_key (routes/attendance_helpers.ingest_events):
+chave repetida no próprio lote, reenvio do lote e duas requisições
+concorrentes com a mesma chave gravam uma presença só.
+
+    pytest test_attendance_ingest.py
+"""
+import threading
+import time
+
+import pytest
+
+import database
+import school_writer
+from routes import attendance_helpers
+from routes.attendance_helpers import ingest_events
+
+SCHOOL = 'ingest_test'
+
+
+@pytest.fixture(autouse=True)
+def school_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_DIR', str(tmp_path))
+    published = []
+    monkeypatch.setattr(attendance_helpers, 'publish_access_log',
+                        lambda db, school_id, log_id: published.append(log_id))
+    monkeypatch.setattr(attendance_helpers, 'publish_presence', lambda *args: None)
+    conn = database._connect_school_db(SCHOOL)
+    conn.executemany('INSERT INTO students (id, name) VALUES (?, ?)', [(1, 'Ana'), (2, 'Bruno')])
+    conn.commit()
+    yield conn, published
+    conn.close()
+    with school_writer._writers_lock:
+        school_writer._writers.pop(SCHOOL, None)
+
+
+def _counts(conn):
+    return (conn.execute('SELECT COUNT(*) FROM attendance').fetchone()[0],
+            conn.execute('SELECT COUNT(*) FROM access_logs').fetchone()[0])
+
+
+def test_duplicate_keys_inside_one_batch(school_db):
+    conn, published = school_db
+    events = [
+        {'idempotency_key': 'k1', 'student_id': 1, 'type': 'entry', 'timestamp': '2026-03-10T11:00:00Z'},
+        {'idempotency_key': 'k2', 'student_id': 2, 'type': 'arrival'},
+        {'idempotency_key': 'k1', 'student_id': 1, 'type': 'entry', 'timestamp': '2026-03-10T11:00:00Z'},
+        {'idempotency_key': 'k3', 'student_id': 99, 'type': 'entry'},
+        {'student_id': 1, 'type': 'entry'},
+    ]
+    body = ingest_events(conn, SCHOOL, events)
+
+    assert [r['status'] for r in body['results']] == ['created', 'created', 'duplicate', 'error', 'error']
+    assert body['results'][2]['duplicate_of'] == 0
+    assert (body['created'], body['duplicates'], body['errors']) == (2, 1, 2)
+    assert _counts(conn) == (2, 2)
+    assert len(published) == 2
+
+    # Reenvio do mesmo lote (Wi-Fi da portaria caiu antes da resposta): nada novo
+    again = ingest_events(conn, SCHOOL, events[:2])
+    assert [r['status'] for r in again['results']] == ['duplicate', 'duplicate']
+    assert again['results'][0]['attendance_id'] == body['results'][0]['attendance_id']
+    assert _counts(conn) == (2, 2)
+    assert len(published) == 2
+
+
+def test_concurrent_requests_with_same_key(school_db):
+    conn, published = school_db
+    writer = school_writer.get_school_writer(SCHOOL)
+    holding, release = threading.Event(), threading.Event()
+
+    def hold(c):
+        holding.set()
+        release.wait(5)
+
+    # Segura o escritor: as duas requisições leem as chaves antes de qualquer uma gravar
+    blocker = threading.Thread(target=writer.submit, args=(hold,))
+    blocker.start()
+    assert holding.wait(5)
+
+    bodies = []
+
+    def post():
+        db = database._connect_school_db(SCHOOL)
+        try:
+            bodies.append(ingest_events(db, SCHOOL, [
+                {'idempotency_key': 'same', 'student_id': 1, 'type': 'entry'}
+            ]))
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=post) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while writer._queue.qsize() < 2:
+        assert time.monotonic() < deadline, 'requisições não chegaram ao escritor'
+        time.sleep(0.01)
+    release.set()
+    for thread in threads + [blocker]:
+        thread.join(5)
+
+    statuses = sorted(body['results'][0]['status'] for body in bodies)
+    assert statuses == ['created', 'duplicate']
+    assert _counts(conn) == (1, 1)
+    assert len(published) == 1
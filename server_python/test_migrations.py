@@ -0,0 +1,126 @@
+"""
+Migrações dos bancos de escola e resumos de frequência: banco novo chega à
+última versão (e reabrir não refaz nada), banco antigo com entradas gravadas
+por fora ganha os resumos na migração 13, e os triggers em access_logs deixam
+attendance_daily/attendance_class_daily iguais a rebuild_rollups, inclusive
+a turma sem ninguém presente.
+
+    pytest test_migrations.py
+"""
+import sqlite3
+
+import migrations
+from attendance_rollups import ROLLUP_TRIGGERS, rebuild_rollups
+from timestamps import load_timezone, stamp
+
+STUDENTS = [(1, 'Ana', '1A'), (2, 'Bruno', '1A'), (3, 'Carla', '2B'), (4, 'Davi', '3C')]
+
+
+def _school_conn(path, up_to=None):
+    conn = sqlite3.connect(path)
+    if up_to is None:
+        migrations.migrate_school_db(conn)
+    else:
+        migrations.apply_migrations(conn, [m for m in migrations.SCHOOL_MIGRATIONS if m[0] <= up_to])
+    return conn
+
+
+def _node_insert(conn, student_id, event_type, timestamp):
+    """Como o servidor Node grava: só o texto do horário; ts/local_date vêm do trigger."""
+    conn.execute('INSERT INTO access_logs (student_id, event_type, timestamp) VALUES (?, ?, ?)',
+                 (student_id, event_type, timestamp))
+
+
+def _python_insert(conn, student_id, event_type, timestamp):
+    """Como as rotas do Python gravam: ts/local_date já calculados no fuso da escola."""
+    tz = load_timezone(conn.execute('SELECT name FROM school_timezone').fetchone()[0])
+    text, ts, day = stamp(timestamp, tz)
+    conn.execute('INSERT INTO access_logs (student_id, event_type, timestamp, ts, local_date) VALUES (?, ?, ?, ?, ?)',
+                 (student_id, event_type, text, ts, day))
+
+
+def _rollups(conn):
+    return (
+        conn.execute('SELECT * FROM attendance_daily ORDER BY student_id, day').fetchall(),
+        conn.execute('SELECT * FROM attendance_class_daily ORDER BY class_name, day').fetchall(),
+    )
+
+
+def _rebuilt(conn):
+    before = _rollups(conn)
+    rebuild_rollups(conn)
+    after = _rollups(conn)
+    conn.rollback()
+    return before, after
+
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    path = str(tmp_path / 'school_new.db')
+    conn = _school_conn(path)
+    latest = migrations.latest_version(migrations.SCHOOL_MIGRATIONS)
+    assert migrations.get_version(conn) == latest
+    triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert set(ROLLUP_TRIGGERS) <= triggers
+    assert {f'trg_{table}_ts' for table in migrations.TIMESTAMPED_TABLES} <= triggers
+    schema = conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall()
+    conn.close()
+
+    # Reabrir um banco em dia não muda nada
+    conn = _school_conn(path)
+    assert migrations.get_version(conn) == latest
+    assert conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY name').fetchall() == schema
+    conn.close()
+
+
+def test_upgrade_builds_rollups_from_existing_logs(tmp_path):
+    path = str(tmp_path / 'school_old.db')
+    conn = _school_conn(path, up_to=12)
+    conn.executemany('INSERT INTO students (id, name, class_name) VALUES (?, ?, ?)', STUDENTS)
+    # Antes dos triggers de resumo: entradas que só existiam em access_logs
+    _node_insert(conn, 1, 'arrival', '2026-03-09T10:00:00Z')
+    _node_insert(conn, 3, 'arrival', '2026-03-09T10:05:00Z')
+    _node_insert(conn, 3, 'departure', '2026-03-09T19:00:00Z')
+    conn.commit()
+    assert conn.execute('SELECT COUNT(*) FROM attendance_daily').fetchone()[0] == 0
+    conn.close()
+
+    conn = _school_conn(path)
+    before, after = _rebuilt(conn)
+    assert before == after
+    daily, class_daily = before
+    assert len(daily) == 2
+    assert [tuple(row) for row in class_daily] == [('1A', '2026-03-09', 2, 1), ('2B', '2026-03-09', 1, 1),
+                                                    ('3C', '2026-03-09', 1, 0)]
+    conn.close()
+
+
+def test_triggers_match_rebuild(tmp_path):
+    conn = _school_conn(str(tmp_path / 'school_live.db'))
+    conn.executemany('INSERT INTO students (id, name, class_name) VALUES (?, ?, ?)', STUDENTS)
+    conn.commit()
+
+    # Dois dias letivos, gravados pelo Python e pelo Node, com entrada repetida e saída sem entrada
+    _python_insert(conn, 1, 'arrival', '2026-03-10T10:00:00Z')
+    _node_insert(conn, 1, 'arrival', '2026-03-10T10:30:00Z')
+    _node_insert(conn, 2, 'departure', '2026-03-10T20:00:00Z')
+    _python_insert(conn, 3, 'arrival', '2026-03-10T11:00:00Z')
+    _python_insert(conn, 3, 'departure', '2026-03-10T19:00:00Z')
+    _node_insert(conn, 1, 'departure', '2026-03-10T18:00:00Z')
+    # 01:30 UTC ainda é dia 10 em São Paulo
+    _node_insert(conn, 2, 'arrival', '2026-03-11T01:30:00Z')
+    _python_insert(conn, 4, 'arrival', '2026-03-11T10:00:00Z')
+    _node_insert(conn, 4, 'arrival', '2026-03-11T10:00:00Z')
+    conn.commit()
+
+    before, after = _rebuilt(conn)
+    assert before == after
+    daily, class_daily = before
+    assert [(row[0], row[1]) for row in daily] == [(1, '2026-03-10'), (2, '2026-03-10'), (3, '2026-03-10'),
+                                                  (4, '2026-03-11')]
+    # Turma 3C sem presentes no dia 10 e turmas 1A/2B sem presentes no dia 11
+    absent = {(row[0], row[1]) for row in class_daily if row[3] == 0}
+    assert absent == {('3C', '2026-03-10'), ('1A', '2026-03-11'), ('2B', '2026-03-11')}
+    first_arrival = conn.execute(
+        "SELECT first_arrival FROM attendance_daily WHERE student_id = 1 AND day = '2026-03-10'").fetchone()[0]
+    assert first_arrival == stamp('2026-03-10T10:00:00Z')[1]
+    conn.close()
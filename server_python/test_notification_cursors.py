@@ -0,0 +1,88 @@
+"""
+Cursores de entrega das notificações do responsável (routes/guardian.py,
+NotificationCursor): vínculo novo começa do fim, a entrega continua do cursor
+salvo ao reconectar, Last-Event-ID tem prioridade sobre ele e o cursor salvo
+nunca volta.
+
+    pytest test_notification_cursors.py
+"""
+import sqlite3
+
+import pytest
+
+import database
+from routes import guardian
+from routes.guardian import NotificationCursor, _parse_event_id
+from routes.guardian_helpers import get_notification_cursors, save_notification_cursor
+
+SCHOOL_ID = 41
+GUARDIAN_ID = 5
+
+
+@pytest.fixture(autouse=True)
+def dbs(tmp_path, monkeypatch):
+    system_path = str(tmp_path / 'system.db')
+    monkeypatch.setattr(database, 'DB_DIR', str(tmp_path))
+    monkeypatch.setattr(database, 'SYSTEM_DB_PATH', system_path)
+    monkeypatch.setattr(guardian, 'SYSTEM_DB_PATH', system_path)
+    database.init_system_db()
+
+    sys_db = sqlite3.connect(system_path)
+    sys_db.execute("INSERT INTO schools (id, name) VALUES (?, 'Escola Teste')", (SCHOOL_ID,))
+    sys_db.execute('INSERT INTO guardian_school_links (guardian_id, school_id, student_id) VALUES (?, ?, 1)',
+                   (GUARDIAN_ID, SCHOOL_ID))
+    sys_db.commit()
+
+    school_db = database._connect_school_db(SCHOOL_ID)
+    school_db.executemany('INSERT INTO students (id, name) VALUES (?, ?)', [(1, 'Ana'), (2, 'Bruno')])
+    school_db.execute('INSERT INTO student_guardians (student_id, guardian_id) VALUES (1, ?)', (GUARDIAN_ID,))
+    # Histórico anterior ao vínculo: não é reenviado
+    _log(school_db, 1)
+    yield sys_db, school_db
+    school_db.close()
+    sys_db.close()
+
+
+def _log(school_db, student_id, event_type='arrival'):
+    log_id = school_db.execute(
+        "INSERT INTO access_logs (student_id, event_type, timestamp) VALUES (?, ?, '2026-03-10T10:00:00Z')",
+        (student_id, event_type)
+    ).lastrowid
+    school_db.commit()
+    return log_id
+
+
+def test_parse_event_id():
+    assert _parse_event_id('14:289, 15:12') == {14: 289, 15: 12}
+    assert _parse_event_id('14:abc,x:1,,16:3') == {16: 3}
+    assert _parse_event_id(None) == {}
+
+
+def test_delivery_resumes_from_saved_cursor(dbs):
+    sys_db, school_db = dbs
+    cursor = NotificationCursor(GUARDIAN_ID)
+    assert cursor.pending() == []
+    start = cursor.positions[SCHOOL_ID]
+
+    first = _log(school_db, 1)
+    _log(school_db, 2)  # filho de outro responsável
+    second = _log(school_db, 1, 'departure')
+    pending = cursor.pending()
+    assert [n['id'] for n in pending] == [first, second]
+    assert pending[0]['school_name'] == 'Escola Teste'
+
+    assert cursor.advance(pending[0]) == f'{SCHOOL_ID}:{first}'
+    cursor.save(pending[0])
+
+    # Reconexão sem Last-Event-ID: continua do cursor salvo
+    assert [n['id'] for n in NotificationCursor(GUARDIAN_ID).pending()] == [second]
+    # Last-Event-ID do navegador vale mais que o cursor salvo (escrita que falhou é reenviada)
+    replay = NotificationCursor(GUARDIAN_ID, last_event_id=f'{SCHOOL_ID}:{start}')
+    assert [n['id'] for n in replay.pending()] == [first, second]
+
+
+def test_saved_cursor_never_moves_back(dbs):
+    sys_db, _ = dbs
+    save_notification_cursor(GUARDIAN_ID, SCHOOL_ID, 10, sys_db)
+    save_notification_cursor(GUARDIAN_ID, SCHOOL_ID, 7, sys_db)
+    assert get_notification_cursors(GUARDIAN_ID, sys_db) == {SCHOOL_ID: 10}
@@ -0,0 +1,110 @@
+"""
+Escritor por escola (school_writer): o erro de uma gravação não desfaz as
+outras do mesmo lote, write_school pega outro escritor quando o anterior
+encerrou por ociosidade e uma gravação que estourou o timeout ainda é
+confirmada depois (por isso as gravações precisam ser idempotentes).
+
+    pytest test_school_writer.py
+"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import database
+import school_writer
+from school_writer import SchoolWriter, WriterClosed, write_school
+
+SCHOOL = 'writer_test'
+
+
+@pytest.fixture(autouse=True)
+def school_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_DIR', str(tmp_path))
+    conn = database._connect_school_db(SCHOOL)
+    conn.execute('CREATE TABLE writer_probe (id INTEGER PRIMARY KEY, label TEXT NOT NULL)')
+    conn.commit()
+    conn.close()
+    yield database.get_school_db_path(SCHOOL)
+    with school_writer._writers_lock:
+        school_writer._writers.pop(SCHOOL, None)
+
+
+def _labels(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(row[0] for row in conn.execute('SELECT label FROM writer_probe'))
+    finally:
+        conn.close()
+
+
+def _insert(label, fail=False):
+    def fn(conn):
+        conn.execute('INSERT INTO writer_probe (label) VALUES (?)', (label,))
+        if fail:
+            raise ValueError(label)
+        return label
+    return fn
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condição não atingida a tempo'
+        time.sleep(0.01)
+
+
+def test_failed_write_rolls_back_only_its_savepoint(school_db):
+    # Janela larga: as três gravações caem no mesmo lote
+    writer = SchoolWriter(SCHOOL, batch_window=0.3)
+    outcomes = {}
+
+    def submit(label, fail):
+        try:
+            outcomes[label] = writer.submit(_insert(label, fail))
+        except ValueError as e:
+            outcomes[label] = e
+
+    threads = [threading.Thread(target=submit, args=(label, label == 'bad')) for label in ('a', 'bad', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes['a'] == 'a' and outcomes['b'] == 'b'
+    assert isinstance(outcomes['bad'], ValueError)
+    assert _labels(school_db) == ['a', 'b']
+    assert writer.batches == 1 and writer.largest_batch == 3
+    assert (writer.writes, writer.failed) == (2, 1)
+
+
+def test_write_school_retries_when_writer_closed(school_db):
+    idle = SchoolWriter(SCHOOL, idle_seconds=0.05)
+    idle._thread.join(5)
+    with pytest.raises(WriterClosed):
+        idle.submit(_insert('lost'))
+
+    # Registro ainda aponta para o escritor encerrado (corrida entre get e submit)
+    with school_writer._writers_lock:
+        school_writer._writers[SCHOOL] = idle
+    assert write_school(SCHOOL, _insert('retried')) == 'retried'
+    assert school_writer._writers[SCHOOL] is not idle
+    assert _labels(school_db) == ['retried']
+
+
+def test_timed_out_write_still_commits(school_db):
+    release = threading.Event()
+
+    def slow(conn):
+        release.wait(5)
+        return _insert('late')(conn)
+
+    writer = SchoolWriter(SCHOOL)
+    with pytest.raises(TimeoutError):
+        writer.submit(slow, timeout=0.05)
+    assert _labels(school_db) == []
+
+    release.set()
+    _wait_until(lambda: writer.writes == 1)
+    assert _labels(school_db) == ['late']
@@ -0,0 +1,141 @@
+"""
+Confere que o trigger de ts/local_date (migrations.timestamp_trigger_sql) e
+timestamps.stamp() chegam ao mesmo instante e ao mesmo dia local, inclusive
+perto da meia-noite, nas viradas de horário de verão e com escolas em fusos
+diferentes; e que trocar o fuso (ou o tzdata mudar) recalcula local_date.
+
+    python test_timestamps.py      (ou pytest test_timestamps.py)
+"""
+import os
+import sqlite3
+import time
+
+import migrations
+from timestamps import load_timezone, stamp
+
+# Formatos gravados: Node (UTC com 'Z'), isoformat() local do Python, CURRENT_TIMESTAMP (UTC),
+# com deslocamento explícito; horários em volta da meia-noite de São Paulo (03:00 UTC) e de UTC
+SAMPLES = [
+    '2026-03-10T01:30:00Z',
+    '2026-03-10T02:59:59.999Z',
+    '2026-03-10T03:00:00.000Z',
+    '2026-03-09T23:59:59Z',
+    '2026-03-10T00:00:01Z',
+    '2026-03-09T23:45:00-03:00',
+    '2026-03-10T00:15:00+00:00',
+    '2026-03-09 23:59:59',
+    '2026-03-10 02:30:00',
+    '2026-03-09T23:59:59.500000',
+    '2026-03-10T00:00:00.1',
+    '2026-03-10T21:30:00',
+    # Meia-noite de Nova York antes e depois do horário de verão (EST -5, EDT -4)
+    '2026-03-08T04:59:59Z',
+    '2026-03-08T05:00:00Z',
+    '2026-07-01T03:59:59Z',
+    '2026-07-01T04:00:00Z',
+    '2026-11-01T05:30:00Z',
+    # Último horário de verão de São Paulo (dez/2018: -02)
+    '2018-12-01T02:30:00Z',
+    '2018-12-01T01:59:59Z',
+]
+
+# Fuso do servidor (afeta texto sem fuso dos dois lados)
+SERVER_TIMEZONES = ['UTC', 'America/Sao_Paulo', 'Asia/Tokyo']
+
+# Fuso da escola (school_timezone)
+SCHOOL_TIMEZONES = ['America/Sao_Paulo', 'America/New_York', 'Asia/Tokyo']
+
+
+def _school_conn(school_timezone):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE access_logs (timestamp TEXT DEFAULT CURRENT_TIMESTAMP, ts INTEGER, local_date TEXT)')
+    conn.execute('CREATE TABLE school_timezone (id INTEGER PRIMARY KEY CHECK (id = 1), name TEXT NOT NULL)')
+    conn.execute('CREATE TABLE tz_offsets (starts_at INTEGER PRIMARY KEY, offset_minutes INTEGER NOT NULL)')
+    migrations._store_timezone(conn.cursor(), school_timezone)
+    conn.execute(migrations.timestamp_trigger_sql('access_logs'))
+    return conn
+
+
+def _trigger_values(conn, value):
+    cur = conn.execute('INSERT INTO access_logs (timestamp) VALUES (?)', (value,))
+    return tuple(conn.execute('SELECT ts, local_date FROM access_logs WHERE rowid = ?', (cur.lastrowid,)).fetchone())
+
+
+def _check_current_timezone():
+    mismatches = []
+    for school_timezone in SCHOOL_TIMEZONES:
+        tz = load_timezone(school_timezone)
+        conn = _school_conn(school_timezone)
+        for value in SAMPLES:
+            expected = stamp(value, tz)[1:]
+            got = _trigger_values(conn, value)
+            if got != expected:
+                mismatches.append((school_timezone, value, got, expected))
+
+        # Linha gravada sem timestamp nenhum (DEFAULT CURRENT_TIMESTAMP)
+        cur = conn.execute('INSERT INTO access_logs DEFAULT VALUES')
+        text, ts, day = conn.execute('SELECT timestamp, ts, local_date FROM access_logs WHERE rowid = ?',
+                                     (cur.lastrowid,)).fetchone()
+        if (ts, day) != stamp(text, tz)[1:]:
+            mismatches.append((school_timezone, text, (ts, day), stamp(text, tz)[1:]))
+        conn.close()
+    return mismatches
+
+
+def _with_server_timezones(check):
+    if not hasattr(time, 'tzset'):
+        check()
+        return
+    original = os.environ.get('TZ')
+    try:
+        for tz in SERVER_TIMEZONES:
+            os.environ['TZ'] = tz
+            time.tzset()
+            check()
+    finally:
+        if original is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = original
+        time.tzset()
+
+
+def test_trigger_matches_stamp():
+    def check():
+        assert _check_current_timezone() == [], os.environ.get('TZ')
+    _with_server_timezones(check)
+
+
+def test_set_school_timezone_recomputes_local_date():
+    conn = _school_conn('America/Sao_Paulo')
+    conn.execute('CREATE TABLE attendance (timestamp TEXT, ts INTEGER, local_date TEXT)')
+    # 02:30 UTC: ainda dia 9 em São Paulo, já dia 10 em Tóquio
+    _trigger_values(conn, '2026-03-10T02:30:00Z')
+    migrations.set_school_timezone(conn, 'Asia/Tokyo')
+    assert conn.execute('SELECT name FROM school_timezone').fetchone()[0] == 'Asia/Tokyo'
+    assert conn.execute('SELECT local_date FROM access_logs').fetchone()[0] == '2026-03-10'
+    # Gravações seguintes já saem no fuso novo
+    assert _trigger_values(conn, '2026-03-10T16:00:00Z')[1] == '2026-03-11'
+
+
+def test_sync_rewrites_changed_transitions():
+    """tzdata novo (regra mudou): sync_school_timezone regrava tz_offsets e recalcula dali em diante."""
+    conn = _school_conn('America/Sao_Paulo')
+    conn.execute(f'PRAGMA user_version = {migrations.latest_version(migrations.SCHOOL_MIGRATIONS)}')
+    # Como se o tzdata antigo ainda previsse horário de verão em mar/2026 (-02)
+    conn.execute('INSERT INTO tz_offsets (starts_at, offset_minutes) VALUES (?, -120)', (1772323200000,))
+    conn.execute('INSERT INTO tz_offsets (starts_at, offset_minutes) VALUES (?, -180)', (1774137600000,))
+    _trigger_values(conn, '2026-03-10T02:30:00Z')
+    assert conn.execute('SELECT local_date FROM access_logs').fetchone()[0] == '2026-03-10'
+    conn.commit()
+
+    migrations.sync_school_timezone(conn)
+    assert conn.execute('SELECT local_date FROM access_logs').fetchone()[0] == '2026-03-09'
+    assert conn.execute('SELECT COUNT(*) FROM tz_offsets WHERE starts_at = 1772323200000').fetchone()[0] == 0
+
+
+if __name__ == '__main__':
+    test_trigger_matches_stamp()
+    test_set_school_timezone_recomputes_local_date()
+    test_sync_rewrites_changed_transitions()
+    print("✅ trigger e stamp() concordam")
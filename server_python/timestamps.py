@@ -0,0 +1,242 @@
+"""
+Codificação canônica dos horários de presença (attendance, access_logs,
+employee_attendance).
+
+A coluna timestamp antiga mistura formatos conforme quem gravou:
+isoformat() local do Python ('2026-01-06T13:11:25.4'), CURRENT_TIMESTAMP do
+SQLite em UTC ('2026-01-06 16:11:25') e o servidor Node em UTC com 'Z'. Por
+isso as consultas usavam LIKE, date(timestamp) e limites com 'Z' colado, que
+não usam índice e erram o dia perto da meia-noite.
+
+Cada linha passa a ter também:
+    ts          INTEGER, epoch em milissegundos (UTC)
+    local_date  TEXT 'YYYY-MM-DD', o dia no fuso da escola
+
+Filtros por dia usam local_date (local_date_filter), por instante usam ts;
+os dois têm índice (migração 9). A coluna timestamp continua sendo gravada
+para o frontend.
+
+O fuso é de cada escola: fica no próprio school_*.db (school_timezone, com as
+transições em tz_offsets para o trigger de quem grava sem local_date, ver
+migrations.py). Escola nova começa com SCHOOL_TIMEZONE. Para trocar:
+    python timestamps.py --school 14 --timezone America/Manaus
+(recalcula local_date e os resumos; reinicie o servidor depois)
+"""
+import argparse
+import datetime
+import functools
+import os
+import sqlite3
+import sys
+import threading
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+SCHOOL_TIMEZONE = os.environ.get('SCHOOL_TIMEZONE', 'America/Sao_Paulo')
+
+
+def _load_timezone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, TypeError, ValueError):
+        # Windows sem o pacote tzdata: usa o fuso do servidor
+        print(f"⚠️ Fuso {name} indisponível (instale tzdata); usando o fuso do servidor")
+        return datetime.datetime.now().astimezone().tzinfo
+
+
+SCHOOL_TZ = _load_timezone(SCHOOL_TIMEZONE)  # fuso padrão das escolas novas
+
+_school_tz_lock = threading.Lock()
+_school_tzs = {}  # school_id -> tzinfo (lido do banco uma vez por processo)
+
+
+def load_timezone(name):
+    """Nome IANA -> tzinfo; ValueError se o nome não existe."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, TypeError, ValueError):
+        raise ValueError(f'fuso desconhecido: {name}')
+
+
+def school_tz(school_id):
+    """Fuso da escola (school_timezone do banco dela; SCHOOL_TZ se ainda não tem)."""
+    key = str(school_id)
+    with _school_tz_lock:
+        tz = _school_tzs.get(key)
+    if tz is not None:
+        return tz
+    from database import _connect_school_db
+
+    conn = _connect_school_db(key)
+    try:
+        row = conn.execute('SELECT name FROM school_timezone').fetchone()
+    finally:
+        conn.close()
+    tz = SCHOOL_TZ
+    if row is not None and row[0] != SCHOOL_TIMEZONE:
+        tz = _load_timezone(row[0])
+    with _school_tz_lock:
+        _school_tzs[key] = tz
+    return tz
+
+
+# Faixa coberta por tz_offsets (o trigger usa a última transição depois do fim)
+TRANSITIONS_START = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+TRANSITIONS_END = datetime.datetime(2100, 1, 1, tzinfo=datetime.timezone.utc)
+FIRST_TRANSITION = -(2 ** 62)  # starts_at da primeira linha: vale para qualquer instante anterior
+
+
+def _offset_minutes(tz, moment):
+    return int(moment.astimezone(tz).utcoffset().total_seconds() // 60)
+
+
+@functools.lru_cache(maxsize=None)
+def tz_transitions(name):
+    """[(starts_at em ms, deslocamento em minutos)] do fuso, de TRANSITIONS_START a TRANSITIONS_END.
+
+    Varre dia a dia e acha o segundo exato de cada mudança (horário de verão,
+    mudança de regra) por busca binária.
+    """
+    tz = load_timezone(name)
+    day = datetime.timedelta(days=1)
+    moment = TRANSITIONS_START
+    offset = _offset_minutes(tz, moment)
+    transitions = [(FIRST_TRANSITION, offset)]
+    while moment < TRANSITIONS_END:
+        following = moment + day
+        new_offset = _offset_minutes(tz, following)
+        if new_offset != offset:
+            low, high = int(moment.timestamp()), int(following.timestamp())
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _offset_minutes(tz, datetime.datetime.fromtimestamp(middle, datetime.timezone.utc)) == offset:
+                    low = middle
+                else:
+                    high = middle
+            transitions.append((high * 1000, new_offset))
+            offset = new_offset
+        moment = following
+    return transitions
+
+
+def parse_timestamp(value):
+    """Horário em qualquer dos formatos gravados -> datetime com fuso (None se vazio/inválido).
+
+    Com fuso ('Z', '-03:00') é exato. Sem fuso: 'YYYY-MM-DD HH:MM:SS' sem
+    fração é o CURRENT_TIMESTAMP do SQLite (UTC); o resto veio de
+    datetime.now() do Python (hora local do servidor).
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        parsed = value
+        text = ''
+    else:
+        text = str(value).strip()
+        try:
+            parsed = datetime.datetime.fromisoformat(text.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        if ' ' in text and '.' not in text:
+            return parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed.astimezone()
+    return parsed
+
+
+def to_epoch_ms(moment):
+    return int(round(moment.timestamp() * 1000))
+
+
+def local_date(moment, tz=None):
+    return moment.astimezone(tz or SCHOOL_TZ).date().isoformat()
+
+
+def today(tz=None):
+    """Dia de hoje no fuso da escola ('YYYY-MM-DD'); tz = school_tz(id)."""
+    return local_date(datetime.datetime.now().astimezone(), tz)
+
+
+def stamp(value=None, tz=None):
+    """(timestamp texto, ts em ms, local_date) para gravar um evento; None = agora.
+
+    local_date sai no fuso `tz` (school_tz da escola). ValueError se `value`
+    não for um horário reconhecível.
+    """
+    if value:
+        moment = parse_timestamp(value)
+        if moment is None:
+            raise ValueError(f'horário inválido: {value}')
+    else:
+        moment = datetime.datetime.now().astimezone()
+    # texto no horário local do servidor, como os registros que o Python sempre gravou
+    text = moment.astimezone().replace(tzinfo=None).isoformat()
+    return text, to_epoch_ms(moment), local_date(moment, tz)
+
+
+def format_local(ts, tz=None):
+    """ts em ms -> 'YYYY-MM-DDTHH:MM:SS' no fuso da escola (para o frontend)."""
+    if ts is None:
+        return None
+    moment = datetime.datetime.fromtimestamp(ts / 1000, tz or SCHOOL_TZ)
+    return moment.replace(tzinfo=None).isoformat(timespec='seconds')
+
+
+def _day(value):
+    """'YYYY-MM-DD' (ou ISO mais longo) -> 'YYYY-MM-DD'; ValueError se inválido."""
+    return datetime.date.fromisoformat(str(value)[:10]).isoformat()
+
+
+def local_date_filter(column, start_date=None, end_date=None):
+    """Filtro por dia (inclusive nas duas pontas) como faixa indexável em local_date.
+
+    Retorna (sql, params) para concatenar depois de um WHERE, ex.:
+    local_date_filter('a.local_date', '2026-03-01', '2026-03-31')
+    -> (' AND a.local_date >= ? AND a.local_date <= ?', ['2026-03-01', '2026-03-31']).
+    """
+    sql, params = '', []
+    if start_date:
+        sql += f' AND {column} >= ?'
+        params.append(_day(start_date))
+    if end_date:
+        sql += f' AND {column} <= ?'
+        params.append(_day(end_date))
+    return sql, params
+
+
+def main(argv=None):
+    from database import get_school_db_path
+    from migrations import migrate_school_db, set_school_timezone
+
+    parser = argparse.ArgumentParser(description='Mostra ou troca o fuso de uma escola (recalcula local_date e resumos)')
+    parser.add_argument('--school', required=True, help='id da escola')
+    parser.add_argument('--timezone', help='novo fuso IANA, ex.: America/Manaus')
+    args = parser.parse_args(argv)
+
+    path = get_school_db_path(args.school)
+    if not os.path.exists(path):
+        print(f"❌ Banco da escola {args.school} não encontrado")
+        return 1
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        migrate_school_db(conn)
+        if args.timezone:
+            try:
+                load_timezone(args.timezone)
+            except ValueError as e:
+                print(f"❌ {e}")
+                return 1
+            set_school_timezone(conn, args.timezone)
+        name = conn.execute('SELECT name FROM school_timezone').fetchone()[0]
+    finally:
+        conn.close()
+    print(f"🕒 Escola {args.school}: {name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())